@@ -0,0 +1,109 @@
+import threading
+import time
+from LatencyTracker import LatencyTracker
+
+# concurrency limit used before the API has given any feedback
+DEFAULT_INITIAL_LIMIT = 8
+DEFAULT_MIN_LIMIT = 1
+DEFAULT_MAX_LIMIT = 50
+# the limit is multiplied by this on a 429, timeout or latency spike
+DEFAULT_BACKOFF_RATIO = 0.5
+# a response counts as a latency spike when it takes this many times the
+# median of recent responses
+DEFAULT_LATENCY_SPIKE_FACTOR = 3.0
+# seconds after a decrease during which further overload signals are
+# ignored; requests already in flight report the same overload
+DEFAULT_DECREASE_COOLDOWN = 1.0
+# responses timed before latency spikes are looked for
+MIN_LATENCY_SAMPLES = 20
+
+class AdaptiveLimiter:
+    """Limits concurrent requests to an API with additive increase,
+    multiplicative decrease (AIMD), the way TCP finds a connection's capacity.
+
+    Every healthy response raises the limit by 1/limit, so it grows by about
+    one request per full window. A sign of overload, such as a 429, a
+    timeout or a response far slower than usual, multiplies it by
+    backoff_ratio. The limit settles just under the highest concurrency the
+    API sustains for our credentials.
+
+    Parameters
+    ----------
+    initial_limit, min_limit, max_limit : int
+        Starting concurrency and its bounds.
+    backoff_ratio : float
+        Multiplier applied to the limit on overload, between 0 and 1.
+    latency_spike_factor : float
+        Responses slower than this times the recent median count as overload.
+    decrease_cooldown : float
+        Seconds after a decrease during which overload is not acted on again.
+    """
+
+    def __init__(self, initial_limit : int = DEFAULT_INITIAL_LIMIT, min_limit : int = DEFAULT_MIN_LIMIT,
+                 max_limit : int = DEFAULT_MAX_LIMIT, backoff_ratio : float = DEFAULT_BACKOFF_RATIO,
+                 latency_spike_factor : float = DEFAULT_LATENCY_SPIKE_FACTOR,
+                 decrease_cooldown : float = DEFAULT_DECREASE_COOLDOWN):
+        if not 1 <= min_limit <= max_limit:
+            raise ValueError(f"Error: expected 1 <= min_limit <= max_limit, got {min_limit} and {max_limit}")
+        if not 0 < backoff_ratio < 1:
+            raise ValueError(f"Error: backoff_ratio must be between 0 and 1, got {backoff_ratio}")
+
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.backoff_ratio = backoff_ratio
+        self.latency_spike_factor = latency_spike_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.in_flight = 0
+        self.decreases = 0
+        self._last_decrease = None
+        self._latencies = LatencyTracker()
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout : float | None = None) -> bool:
+        """Waits up to timeout seconds (forever if None) for a free slot.
+
+        Returns
+        -------
+        bool
+            True if a slot was taken and must be given back with release(),
+            False if the timeout ran out first.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.in_flight < int(self.limit), timeout):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, latency : float | None = None, overloaded : bool = False) -> None:
+        """Gives back a slot and adjusts the limit.
+
+        Parameters
+        ----------
+        latency : float
+            Seconds the request took, if it got a response.
+        overloaded : bool
+            Whether the response showed the API is overloaded (429, 5xx,
+            timeout or dropped connection).
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if overloaded:
+                self._decrease()
+            elif latency is not None:
+                median_latency = self._latencies.percentile(0.5) if self._latencies.count() >= MIN_LATENCY_SAMPLES else None
+                self._latencies.add(latency)
+                if median_latency is not None and latency > median_latency * self.latency_spike_factor:
+                    self._decrease()
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def _decrease(self) -> None:
+        # Caller must hold self._condition.
+        now = time.monotonic()
+        if self._last_decrease is not None and now - self._last_decrease < self.decrease_cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+        self.decreases += 1
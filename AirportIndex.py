@@ -0,0 +1,137 @@
+import bisect
+import functools
+import hashlib
+import heapq
+import threading
+import NavigationTools
+
+# Suggestions returned when the caller does not ask for a number
+DEFAULT_SUGGESTION_LIMIT = 8
+# Most suggestions one request may ask for
+MAX_SUGGESTION_LIMIT = 25
+# Distinct queries whose suggestions are kept, keystrokes repeat a lot of prefixes
+SUGGESTION_CACHE_SIZE = 4096
+# How long browsers and proxies may reuse suggestions, the database only
+# changes when the app is redeployed
+SUGGESTION_MAX_AGE_SECONDS = 3600
+# Sorts after every character that appears in airport codes and names
+PREFIX_END = "\uffff"
+# How a query matched an airport, best first
+EXACT_CODE_MATCH, CODE_PREFIX_MATCH, NAME_PREFIX_MATCH = 0, 1, 2
+
+def normalize_query(query : str | None) -> str:
+    """Returns query in upper case with runs of whitespace collapsed."""
+    return " ".join((query or "").upper().split())
+
+def airport_rank(properties : dict) -> tuple:
+    """Returns the sort key of an airport among equally good matches.
+
+    Airports with an ICAO code come first, as those are the ones people fly
+    between, then shorter identifiers, then alphabetical order.
+    """
+    ident = (properties["IDENT"] or "").upper()
+    return (properties["ICAO_ID"] is None, len(ident), ident)
+
+def name_suffixes(name : str) -> list:
+    """Returns name and every part of it starting at a word, so typing any
+    word of a name finds it, e.g. ROGERS finds WILL ROGERS WORLD."""
+    words = normalize_query(name).split(" ")
+    return [" ".join(words[position:]) for position in range(len(words)) if words[position]]
+
+class AirportIndex:
+    """Prefix index over the codes and names of continental US airports.
+
+    Codes (IDENT and ICAO_ID) and names are kept in two sorted lists of
+    (key, rank, airport number) tuples. The keys starting with a prefix are
+    a contiguous run found with two bisections, so a lookup does not scan
+    the database. Suggestions for the most recent queries are cached.
+    """
+
+    def __init__(self, airport_list : list):
+        # airport number -> suggestion dict
+        self.airports = []
+        code_entries = []
+        name_entries = []
+        for airport in airport_list:
+            properties = airport["properties"]
+            if not NavigationTools.is_in_US_mainland(properties):
+                continue
+            airport_number = len(self.airports)
+            rank = airport_rank(properties)
+            self.airports.append({
+                "ident": properties["IDENT"],
+                "icao_id": properties["ICAO_ID"],
+                "name": properties["NAME"],
+                "state": properties["STATE"],
+            })
+            codes = {code.upper() for code in (properties["IDENT"], properties["ICAO_ID"]) if code}
+            code_entries += [(code, rank, airport_number) for code in codes]
+            name_entries += [(suffix, rank, airport_number) for suffix in name_suffixes(properties["NAME"] or "")]
+
+        code_entries.sort()
+        name_entries.sort()
+        self._code_entries = code_entries
+        self._code_keys = [entry[0] for entry in code_entries]
+        self._name_entries = name_entries
+        self._name_keys = [entry[0] for entry in name_entries]
+        self.version = hashlib.sha1(repr(self.airports).encode()).hexdigest()[:12]
+        self.suggest = functools.lru_cache(maxsize=SUGGESTION_CACHE_SIZE)(self._suggest)
+
+    def __len__(self):
+        return len(self.airports)
+
+    def _prefix_range(self, keys : list, entries : list, prefix : str) -> list:
+        return entries[bisect.bisect_left(keys, prefix):bisect.bisect_left(keys, prefix + PREFIX_END)]
+
+    def _suggest(self, query : str, limit : int = DEFAULT_SUGGESTION_LIMIT) -> tuple:
+        """Returns up to limit airports matching a normalized query, best first.
+
+        Exact code matches come first, then airports whose code starts with
+        the query, then airports with a word of their name starting with it.
+        """
+        if not query:
+            return ()
+        candidates = [((EXACT_CODE_MATCH if code == query else CODE_PREFIX_MATCH,) + rank, airport_number)
+                      for code, rank, airport_number in self._prefix_range(self._code_keys, self._code_entries, query)]
+        candidates += [((NAME_PREFIX_MATCH,) + rank, airport_number)
+                       for suffix, rank, airport_number in self._prefix_range(self._name_keys, self._name_entries, query)]
+
+        # An airport can match through several keys, keep its best match
+        best_matches = {}
+        for match_rank, airport_number in candidates:
+            if match_rank < best_matches.get(airport_number, (NAME_PREFIX_MATCH + 1,)):
+                best_matches[airport_number] = match_rank
+        best_airports = heapq.nsmallest(limit, best_matches.items(), key=lambda item: item[1])
+        return tuple(self.airports[airport_number] for airport_number, match_rank in best_airports)
+
+_index = None
+# Makes sure only one thread builds the index
+_index_lock = threading.Lock()
+
+def get_index() -> AirportIndex:
+    """Returns the index of the airport database, building it on first use."""
+    global _index
+
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                NavigationTools.load_database_file()
+                _index = AirportIndex(NavigationTools.database)
+    return _index
+
+def parse_limit(raw_limit : str | None) -> int:
+    """Returns the number of suggestions asked for. Raises ValueError if it is
+    not an integer between 1 and MAX_SUGGESTION_LIMIT."""
+    if raw_limit is None or raw_limit == "":
+        return DEFAULT_SUGGESTION_LIMIT
+    try:
+        limit = int(raw_limit)
+    except ValueError as err:
+        raise ValueError(f"limit must be an integer, got {raw_limit}") from err
+    if not 1 <= limit <= MAX_SUGGESTION_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_SUGGESTION_LIMIT}, got {limit}")
+    return limit
+
+def suggestion_etag(index : AirportIndex, query : str, limit : int) -> str:
+    """Returns the ETag of the suggestions for a normalized query."""
+    return hashlib.sha1(f"{index.version}:{query}:{limit}".encode()).hexdigest()[:20]
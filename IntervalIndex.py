@@ -0,0 +1,136 @@
+import bisect
+import contextlib
+import math
+
+class IntervalNode:
+    """One node of the interval tree: the intervals that contain center,
+    sorted by start and by end, and the subtrees of intervals entirely
+    before and after it."""
+
+    def __init__(self, center : float, intervals : list, left, right):
+        self.center = center
+        by_start = sorted(intervals, key=lambda interval: interval[0])
+        self.starts = [interval[0] for interval in by_start]
+        self.start_keys = [interval[2] for interval in by_start]
+        by_end = sorted(intervals, key=lambda interval: interval[1])
+        self.ends = [interval[1] for interval in by_end]
+        self.end_keys = [interval[2] for interval in by_end]
+        self.left = left
+        self.right = right
+
+def build_tree(intervals : list) -> IntervalNode | None:
+    """Builds a centered interval tree from (start, end, key) tuples."""
+    if not intervals:
+        return None
+    endpoints = sorted(value for start, end, key in intervals for value in (start, end) if math.isfinite(value))
+    # Intervals open at both ends contain any center
+    center = endpoints[len(endpoints) // 2] if endpoints else 0.0
+    before = [interval for interval in intervals if interval[1] < center]
+    after = [interval for interval in intervals if interval[0] > center]
+    containing = [interval for interval in intervals if interval[0] <= center <= interval[1]]
+    return IntervalNode(center, containing, build_tree(before), build_tree(after))
+
+class IntervalIndex:
+    """Index of time intervals, for finding the NOTAMs in effect at some point
+    during a window.
+
+    Intervals are (start, end) numbers, e.g. timestamps, and may be open
+    ended with -math.inf or math.inf. The index is a centered interval tree,
+    so a query takes O(log n + k) for k matching intervals. Changes made
+    since the tree was last built are kept aside and checked one by one, so
+    queries never wait for a rebuild. Call rebuild once a batch of changes
+    is done, e.g. after a sweep, to fold them into the tree.
+
+    The index is not thread safe; callers sharing one hold their own lock,
+    and pass it to rebuild.
+    """
+
+    def __init__(self):
+        # key -> (start, end)
+        self._intervals = {}
+        self._root = None
+        # key -> (start, end) of the intervals the tree was built from
+        self._tree_intervals = {}
+        # key -> (start, end) of intervals inserted or changed since the tree was built
+        self._pending = {}
+        # keys in the tree whose interval has since been removed or changed
+        self._removed = set()
+
+    def __len__(self):
+        return len(self._intervals)
+
+    def __contains__(self, key):
+        return key in self._intervals
+
+    def insert(self, key, start : float, end : float) -> None:
+        """Adds an interval, replacing any interval already stored under key."""
+        if start > end:
+            raise ValueError(f"Error: interval for {key} starts after it ends")
+        self._intervals[key] = (start, end)
+        if self._tree_intervals.get(key) == (start, end):
+            # Put back as the tree has it
+            self._pending.pop(key, None)
+            self._removed.discard(key)
+            return
+        self._pending[key] = (start, end)
+        if key in self._tree_intervals:
+            self._removed.add(key)
+
+    def remove(self, key) -> bool:
+        """Removes the interval stored under key. Returns whether there was one."""
+        if self._intervals.pop(key, None) is None:
+            return False
+        self._pending.pop(key, None)
+        if key in self._tree_intervals:
+            self._removed.add(key)
+        return True
+
+    def get(self, key) -> tuple | None:
+        return self._intervals.get(key)
+
+    def pending_count(self) -> int:
+        """Returns the number of changes not yet in the tree."""
+        return len(self._pending) + len(self._removed)
+
+    def rebuild(self, lock = None) -> None:
+        """Builds the tree again from the current intervals. The tree is
+        built without holding lock, so queries made under it meanwhile go
+        on using the old tree, and changes made meanwhile stay aside."""
+        with lock or contextlib.nullcontext():
+            if not self._pending and not self._removed:
+                return
+            intervals = dict(self._intervals)
+        root = build_tree([(interval_start, interval_end, key) for key, (interval_start, interval_end) in intervals.items()])
+        with lock or contextlib.nullcontext():
+            self._root = root
+            self._tree_intervals = intervals
+            self._pending = {key: interval for key, interval in self._intervals.items() if intervals.get(key) != interval}
+            self._removed = {key for key, interval in intervals.items() if self._intervals.get(key) != interval}
+
+    def overlapping(self, start : float, end : float) -> list:
+        """Returns the keys of the intervals that share at least one moment
+        with [start, end]."""
+        found_keys = []
+        nodes = [self._root]
+        while nodes:
+            node = nodes.pop()
+            if node is None:
+                continue
+            if end < node.center:
+                # Every interval here ends after the window, so keep those starting before its end
+                found_keys.extend(node.start_keys[:bisect.bisect_right(node.starts, end)])
+                nodes.append(node.left)
+            elif start > node.center:
+                # Every interval here starts before the window, so keep those ending after its start
+                found_keys.extend(node.end_keys[bisect.bisect_left(node.ends, start):])
+                nodes.append(node.right)
+            else:
+                found_keys.extend(node.start_keys)
+                nodes.append(node.left)
+                nodes.append(node.right)
+
+        if self._removed:
+            found_keys = [key for key in found_keys if key not in self._removed]
+        found_keys.extend(key for key, (interval_start, interval_end) in self._pending.items()
+                          if interval_start <= end and interval_end >= start)
+        return found_keys
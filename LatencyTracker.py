@@ -0,0 +1,43 @@
+import threading
+from collections import deque
+
+# number of recent latencies kept when no window is given
+DEFAULT_WINDOW = 200
+
+class LatencyTracker:
+    """Keeps the most recent latencies of an operation, e.g. FAA API page
+    requests, to estimate its current percentiles.
+
+    Parameters
+    ----------
+    window : int
+        Number of recent latencies kept. Older ones are forgotten so the
+        estimate follows changes in the API's response times.
+    """
+
+    def __init__(self, window : int = DEFAULT_WINDOW):
+        if window < 1:
+            raise ValueError(f"Error: window must be at least 1, got {window}")
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, latency : float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._latencies)
+
+    def percentile(self, fraction : float) -> float | None:
+        """Returns the fraction (0 to 1) percentile of the recent latencies,
+        or None if none have been added."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._latencies.clear()
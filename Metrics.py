@@ -0,0 +1,228 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Counters, gauges and histograms for the search pipeline, served in the
+# Prometheus text format from the app's /metrics endpoint. Everything is
+# kept in memory in this process; recording a value is a lock and a few
+# additions, so it is cheap enough to leave on for every request.
+
+# Upper bounds of the stage duration buckets, in seconds
+DEFAULT_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def format_labels(label_names : tuple, label_values : tuple, extra_label : str = "") -> str:
+    labels = [f'{name}="{escape_label_value(value)}"' for name, value in zip(label_names, label_values)]
+    if extra_label:
+        labels.append(extra_label)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+def escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_value(value : float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class Metric:
+    """A named metric with values for each combination of label values.
+
+    Parameters
+    ----------
+    name : str
+        Prometheus metric name.
+    description : str
+        Shown as the metric's HELP line.
+    label_names : tuple
+        Names of the labels every value is recorded with.
+    function : callable
+        For metrics without labels, called when rendering to read the
+        current value instead of recording it (e.g. a cache's hit count).
+    """
+
+    metric_type = "untyped"
+
+    def __init__(self, name : str, description : str, label_names : tuple = (), function=None):
+        if function is not None and label_names:
+            raise ValueError(f"Error: metric {name} can't have both labels and a function")
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.function = function
+        self._lock = threading.Lock()
+        # tuple of label values -> value
+        self._values = {}
+
+    def _key(self, labels : dict) -> tuple:
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"Error: metric {self.name} expects labels {', '.join(self.label_names)}, got {', '.join(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def value(self, **labels):
+        """Returns the current value for the given labels, None if none was recorded."""
+        if self.function is not None:
+            return self.function()
+        with self._lock:
+            return self._values.get(self._key(labels))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def render_samples(self) -> list:
+        if self.function is not None:
+            return [f"{self.name} {format_value(self.function())}"]
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{format_labels(self.label_names, key)} {format_value(value)}" for key, value in values]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self.render_samples())
+        return "\n".join(lines)
+
+class Counter(Metric):
+    """A value that only goes up."""
+
+    metric_type = "counter"
+
+    def inc(self, amount : float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def total(self) -> float:
+        """Returns the sum of the values recorded for every combination of labels."""
+        if self.function is not None:
+            return self.function()
+        with self._lock:
+            return sum(self._values.values())
+
+class Gauge(Metric):
+    """A value that can go up and down."""
+
+    metric_type = "gauge"
+
+    def set(self, value : float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount : float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount : float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    """Counts observations into buckets, e.g. request durations."""
+
+    metric_type = "histogram"
+
+    def __init__(self, name : str, description : str, label_names : tuple = (), buckets : tuple = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value : float, **labels) -> None:
+        key = self._key(labels)
+        bucket_index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            # [count in each bucket (non-cumulative, plus +Inf), sum]
+            bucket_counts = self._values.get(key)
+            if bucket_counts is None:
+                bucket_counts = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            bucket_counts[0][bucket_index] += 1
+            bucket_counts[1] += value
+
+    def value(self, **labels) -> dict | None:
+        """Returns {"count", "sum", "buckets"} for the given labels, with
+        cumulative counts for each bucket's upper bound."""
+        with self._lock:
+            bucket_counts = self._values.get(self._key(labels))
+            if bucket_counts is None:
+                return None
+            counts, total = list(bucket_counts[0]), bucket_counts[1]
+        cumulative_counts = []
+        running_count = 0
+        for count in counts:
+            running_count += count
+            cumulative_counts.append(running_count)
+        return {"count": running_count, "sum": total, "buckets": dict(zip(self.buckets + (float("inf"),), cumulative_counts))}
+
+    def render_samples(self) -> list:
+        with self._lock:
+            keys = sorted(self._values)
+        lines = []
+        for key in keys:
+            histogram = self.value(**dict(zip(self.label_names, key)))
+            for upper_bound, count in histogram["buckets"].items():
+                bucket_label = 'le="' + format_value(upper_bound) + '"'
+                lines.append(f"{self.name}_bucket{format_labels(self.label_names, key, bucket_label)} {count}")
+            lines.append(f"{self.name}_sum{format_labels(self.label_names, key)} {format_value(histogram['sum'])}")
+            lines.append(f"{self.name}_count{format_labels(self.label_names, key)} {histogram['count']}")
+        return lines
+
+class Registry:
+    """The metrics served together from one /metrics endpoint.
+
+    Asking for a metric name that already exists returns the existing
+    metric, so modules can declare their metrics at import time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # metric name -> Metric, in registration order
+        self._metrics = {}
+
+    def _register(self, metric_class, name : str, *args, **kwargs) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, *args, **kwargs)
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"Error: metric {name} is already registered as a {metric.metric_type}")
+            return metric
+
+    def counter(self, name : str, description : str, label_names : tuple = (), function=None) -> Counter:
+        return self._register(Counter, name, description, label_names, function)
+
+    def gauge(self, name : str, description : str, label_names : tuple = (), function=None) -> Gauge:
+        return self._register(Gauge, name, description, label_names, function)
+
+    def histogram(self, name : str, description : str, label_names : tuple = (), buckets : tuple = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, description, label_names, buckets)
+
+    def get(self, name : str) -> Metric | None:
+        with self._lock:
+            return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+# The registry served by the app's /metrics endpoint
+registry = Registry()
+
+STAGE_DURATION = registry.histogram("notam_stage_duration_seconds", "Time spent in each stage of a search.", ("stage",))
+STAGE_ERRORS = registry.counter("notam_stage_errors_total", "Stages that ended with an exception.", ("stage",))
+
+@contextmanager
+def span(stage : str):
+    """Times the body of a with block as one stage of a search.
+
+    The duration is recorded in notam_stage_duration_seconds whether or not
+    the block raises; blocks that raise also count in notam_stage_errors_total.
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_DURATION.observe(time.perf_counter() - start_time, stage=stage)
@@ -1,16 +1,26 @@
 import math
-import geopy.distance
+import pickle
+import threading
 from io import StringIO
 from json import load
-from os import path
+from os import getpid, path, replace
 
 # File name for database file
 DATABASE_FILE_DIR = "database/Airports.json"
+# Compact copy of the database that loads much faster than the full json.
+# It is rebuilt whenever the json file is newer than it.
+DATABASE_SNAPSHOT_FILE_DIR = "database/Airports.snapshot.pickle"
+# The only airport properties the app reads
+DATABASE_PROPERTIES = ("IDENT", "ICAO_ID", "NAME", "COUNTRY", "STATE")
 # radius of the earth in nautical miles
 EARTH_RADIUS = 3443.89849
 # conversion factor between miles and nautical miles
 NM_TO_MILES = 1.151
 database = None
+# upper case IDENT or ICAO_ID -> first airport in the database with that code
+airport_codes = None
+# Makes sure only one thread loads the database
+_database_lock = threading.Lock()
 
 class PointObject :
     """
@@ -65,19 +75,70 @@ class PointObject :
 def load_database_file() -> None:
         """
         Reads the local data base file and creates a dictionary from it.
+
+        The database is loaded on first use rather than at import time. When
+        an up to date snapshot exists it is loaded instead of the full json.
         """
-        global database
+        global database, airport_codes
+
+        if database is not None:
+            return
 
-        if database is None:
+        with _database_lock:
+            if database is not None:
+                return
 
             if not path.exists(DATABASE_FILE_DIR):
                 raise FileNotFoundError(f"No database found! A file is expected at {DATABASE_FILE_DIR} relative to where this app was run.")
 
-            file = open(DATABASE_FILE_DIR)
-            database = load(file)
-            database = database["features"]
-
-            file.close()   
+            if path.exists(DATABASE_SNAPSHOT_FILE_DIR) and path.getmtime(DATABASE_SNAPSHOT_FILE_DIR) >= path.getmtime(DATABASE_FILE_DIR):
+                with open(DATABASE_SNAPSHOT_FILE_DIR, "rb") as snapshot_file:
+                    airport_list = pickle.load(snapshot_file)
+                airport_codes = build_code_lookup(airport_list)
+                database = airport_list
+                return
+
+            with open(DATABASE_FILE_DIR) as file:
+                features = load(file)["features"]
+
+            # Keep only what the app uses, in the same shape as the json
+            airport_list = [{
+                "properties": {name: airport["properties"].get(name) for name in DATABASE_PROPERTIES},
+                "geometry": {"coordinates": airport["geometry"]["coordinates"]},
+            } for airport in features]
+
+            # Write to a temporary file first so other processes never read a
+            # half written snapshot
+            temporary_snapshot = f"{DATABASE_SNAPSHOT_FILE_DIR}.{getpid()}.tmp"
+            try:
+                with open(temporary_snapshot, "wb") as snapshot_file:
+                    pickle.dump(airport_list, snapshot_file, protocol=pickle.HIGHEST_PROTOCOL)
+                replace(temporary_snapshot, DATABASE_SNAPSHOT_FILE_DIR)
+            except OSError:
+                # The snapshot only speeds up the next start, the app works without it
+                pass
+
+            airport_codes = build_code_lookup(airport_list)
+            database = airport_list
+
+def build_code_lookup(airport_list : list) -> dict:
+        """Returns {upper case code: airport} for every IDENT and ICAO_ID,
+        keeping the first airport in the list when codes repeat."""
+        code_lookup = {}
+        for airport in airport_list:
+            for code in (airport["properties"]["IDENT"], airport["properties"]["ICAO_ID"]):
+                if code is not None:
+                    code_lookup.setdefault(code.upper(), airport)
+        return code_lookup
+
+def is_in_US_mainland(airport_properties : dict) -> bool:
+        """Returns whether an airport is in the continental United States."""
+        # Was using the US_HIGH, US_LOW, etc. identifiers before, but some of the airports are mislabeled
+        # For example, WA and OR airports could be labeled as PACIFIC airports. 
+        # Some AK airports have both AK_HIGH an AK_LOW set to 0.
+        # Instead of looking for every edge case, just check the two states that don't need to be included
+        return (airport_properties["COUNTRY"] == "UNITED STATES"
+                and not (airport_properties["STATE"] == "AK" or airport_properties["STATE"] == "HI"))
 
 def get_valid_US_airport(user_input : str, message_log : StringIO) -> tuple:
         """ Get the first US airport that is found within the database 
@@ -97,33 +158,21 @@ def get_valid_US_airport(user_input : str, message_log : StringIO) -> tuple:
             The latitude and longitude of the airport
         """
 
+        load_database_file()
+
         if len(user_input) == 4 or len(user_input) == 3:
-            for airport in database:
-                # Get the two airport codes.
-                # IDENT covers both IATA and the FAA identifiers
-                airport_properties = airport["properties"]
-                curr_airport_code_IATA_FAA = airport_properties["IDENT"]
-                curr_airport_code_ICAO = airport_properties["ICAO_ID"]
-
-                is_IATA_FAA_code = curr_airport_code_IATA_FAA is not None and curr_airport_code_IATA_FAA.upper() == user_input.upper()
-                is_ICAO_code = curr_airport_code_ICAO is not None and curr_airport_code_ICAO.upper() == user_input.upper()
-                
-                # Was using the US_HIGH, US_LOW, etc. identifiers before, but some of the airports are mislabeled
-                # For example, WA and OR airports could be labeled as PACIFIC airports. 
-                # Some AK airports have both AK_HIGH an AK_LOW set to 0.
-                # Instead of looking for every edge case, just check the two states that don't need to be included
-                is_in_US_mainland = (airport_properties["COUNTRY"] == "UNITED STATES" 
-                                     and not (airport_properties["STATE"] == "AK" or airport_properties["STATE"] == "HI")) 
-
-                if is_in_US_mainland and (is_ICAO_code or is_IATA_FAA_code):
-                    # coordinates contains a list of the longitude, latitude, and altitude
-                    # Altitude is weirdly not used, however.
-                    airport_lat = airport["geometry"]["coordinates"][1]
-                    airport_long = airport["geometry"]["coordinates"][0]
-                    return (airport_lat, airport_long)
-                
-                elif not is_in_US_mainland and (is_ICAO_code or is_IATA_FAA_code):
-                    raise ValueError(f"Airport must be in the continental United States, got {user_input} instead.")
+            # IDENT covers both IATA and the FAA identifiers
+            airport = airport_codes.get(user_input.upper())
+
+            if airport is not None and is_in_US_mainland(airport["properties"]):
+                # coordinates contains a list of the longitude, latitude, and altitude
+                # Altitude is weirdly not used, however.
+                airport_lat = airport["geometry"]["coordinates"][1]
+                airport_long = airport["geometry"]["coordinates"][0]
+                return (airport_lat, airport_long)
+
+            elif airport is not None:
+                raise ValueError(f"Airport must be in the continental United States, got {user_input} instead.")
 
         else:
             raise ValueError(f"Airport code is expected to be in IATA, ICAO, or FAA forms, got {user_input} instead")
@@ -150,10 +199,123 @@ def get_distance(point_one: PointObject, point_two: PointObject) :
     point_one_coords = (point_one.latitude, point_one.longitude)
     point_two_coords = (point_two.latitude, point_two.longitude)
 
+    # geopy is only imported once distances are needed
+    import geopy.distance
     distance = geopy.distance.great_circle(point_one_coords, point_two_coords).miles / NM_TO_MILES
         
     return distance
 
+def get_distance_nm(latitude_one : float, longitude_one : float, latitude_two : float, longitude_two : float) -> float :
+    """
+    Returns the great circle distance between two lat/lon points, in nautical miles
+
+    Takes plain floats and skips the checks in get_distance, for loops over
+    many NOTAMs.
+    """
+    latitude_one_radians = math.radians(latitude_one)
+    latitude_two_radians = math.radians(latitude_two)
+    haversine = (math.sin((latitude_two_radians - latitude_one_radians) / 2) ** 2
+                 + math.cos(latitude_one_radians) * math.cos(latitude_two_radians)
+                 * math.sin(math.radians(longitude_two - longitude_one) / 2) ** 2)
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(haversine)))
+
+def get_initial_bearing_radians(latitude_one : float, longitude_one : float, latitude_two : float, longitude_two : float) -> float :
+    """Returns the great circle bearing from point one to point two, in radians"""
+    latitude_one_radians = math.radians(latitude_one)
+    latitude_two_radians = math.radians(latitude_two)
+    longitude_difference = math.radians(longitude_two - longitude_one)
+    return math.atan2(math.sin(longitude_difference) * math.cos(latitude_two_radians),
+                      math.cos(latitude_one_radians) * math.sin(latitude_two_radians)
+                      - math.sin(latitude_one_radians) * math.cos(latitude_two_radians) * math.cos(longitude_difference))
+
+def get_distance_to_segment_nm(latitude : float, longitude : float, start_latitude : float, start_longitude : float,
+                               end_latitude : float, end_longitude : float) -> float :
+    """
+    Returns the distance in nautical miles from a point to the great circle
+    segment between start and end.
+
+    This is the cross-track distance when the point is abeam the segment,
+    otherwise the distance to the nearer end point.
+    """
+    start_distance = get_distance_nm(start_latitude, start_longitude, latitude, longitude)
+    segment_length = get_distance_nm(start_latitude, start_longitude, end_latitude, end_longitude)
+    if segment_length == 0 or start_distance == 0:
+        return start_distance
+
+    bearing_difference = (get_initial_bearing_radians(start_latitude, start_longitude, latitude, longitude)
+                          - get_initial_bearing_radians(start_latitude, start_longitude, end_latitude, end_longitude))
+    # Behind the start of the segment
+    if math.cos(bearing_difference) < 0:
+        return start_distance
+
+    start_angle = start_distance / EARTH_RADIUS
+    cross_track_angle = math.asin(max(-1.0, min(1.0, math.sin(start_angle) * math.sin(bearing_difference))))
+    along_track_angle = math.acos(max(-1.0, min(1.0, math.cos(start_angle) / math.cos(cross_track_angle))))
+    # Past the end of the segment
+    if along_track_angle * EARTH_RADIUS > segment_length:
+        return get_distance_nm(end_latitude, end_longitude, latitude, longitude)
+    return abs(cross_track_angle) * EARTH_RADIUS
+
+def to_unit_vector(latitude : float, longitude : float) -> tuple :
+    """Returns the point as an (x, y, z) unit vector from the earth's center"""
+    latitude_radians = math.radians(latitude)
+    longitude_radians = math.radians(longitude)
+    return (math.cos(latitude_radians) * math.cos(longitude_radians),
+            math.cos(latitude_radians) * math.sin(longitude_radians),
+            math.sin(latitude_radians))
+
+class RouteCorridor :
+    """
+    A route made of great circle segments, for measuring how far many points
+    are from it.
+
+    The plane of each segment is worked out once, so a point's cross-track
+    distance only takes a few dot products instead of the bearings and
+    inverse trig of get_distance_to_segment_nm.
+
+    points: list of (latitude, longitude) tuples along the route
+    """
+
+    def __init__(self, points : list) :
+        if not points :
+            raise ValueError("Error: a route corridor needs at least one point")
+        self.end_vectors = [to_unit_vector(latitude, longitude) for latitude, longitude in points]
+        # (start, end, unit normal of the segment's great circle plane) for every segment that isn't a single point
+        self.segments = []
+        for start, end in zip(self.end_vectors, self.end_vectors[1:]) :
+            normal = cross_product(start, end)
+            normal_length = math.sqrt(dot_product(normal, normal))
+            if normal_length > 1e-12 :
+                self.segments.append((start, end, (normal[0] / normal_length, normal[1] / normal_length, normal[2] / normal_length)))
+
+    def distance_nm(self, latitude : float, longitude : float) -> float :
+        """Returns the distance in nautical miles from a point to the nearest part of the route"""
+        point = to_unit_vector(latitude, longitude)
+        if not self.segments :
+            return chord_angle(point, self.end_vectors[0]) * EARTH_RADIUS
+        closest_angle = math.pi
+        for start, end, normal in self.segments :
+            # The point is abeam the segment when its projection lies between start and end
+            if dot_product(cross_product(start, point), normal) >= 0 and dot_product(cross_product(point, end), normal) >= 0 :
+                segment_angle = abs(math.asin(max(-1.0, min(1.0, dot_product(normal, point)))))
+            else :
+                segment_angle = min(chord_angle(point, start), chord_angle(point, end))
+            closest_angle = min(closest_angle, segment_angle)
+        return closest_angle * EARTH_RADIUS
+
+def chord_angle(vector_one : tuple, vector_two : tuple) -> float :
+    """Returns the angle in radians between two unit vectors"""
+    chord = math.sqrt((vector_one[0] - vector_two[0]) ** 2 + (vector_one[1] - vector_two[1]) ** 2 + (vector_one[2] - vector_two[2]) ** 2)
+    return 2 * math.asin(min(1.0, chord / 2))
+
+def dot_product(vector_one : tuple, vector_two : tuple) -> float :
+    return vector_one[0] * vector_two[0] + vector_one[1] * vector_two[1] + vector_one[2] * vector_two[2]
+
+def cross_product(vector_one : tuple, vector_two : tuple) -> tuple :
+    return (vector_one[1] * vector_two[2] - vector_one[2] * vector_two[1],
+            vector_one[2] * vector_two[0] - vector_one[0] * vector_two[2],
+            vector_one[0] * vector_two[1] - vector_one[1] * vector_two[0])
+
 
 def get_bearing(point_one: PointObject, point_two: PointObject) -> float :
     """
@@ -222,6 +384,7 @@ def get_next_point_geopy(point: PointObject, bearing: float, distance: float| in
         error_message = "\n".join(error_log)
         raise ValueError(error_message)
     
+    import geopy.distance
     spacing = geopy.distance.distance(miles=distance*NM_TO_MILES)
     next_point_geopy = spacing.destination([point.latitude, point.longitude], bearing)
     next_point = PointObject(next_point_geopy.latitude, next_point_geopy.longitude)
@@ -283,6 +446,3 @@ def get_next_point_manual(point: PointObject, bearing: float, distance: float |
     next_longitude = math.degrees(next_longitude_radians)
     next_point = PointObject(next_latitude, next_longitude)
     return next_point
-
-# Initialize database
-load_database_file()
\ No newline at end of file
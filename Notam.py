@@ -1,3 +1,78 @@
+import math
+import re
+from datetime import datetime, timezone
+
+# Date format used by the FAA API, e.g. 2024-03-01T12:00:00.000Z
+NOTAM_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+def parse_notam_date(notam_date : str) -> datetime | None:
+    """Converts an FAA API date into a datetime. Returns None for PERM NOTAMs."""
+    if notam_date == "PERM":
+        return None
+    return datetime.strptime(notam_date, NOTAM_DATE_FORMAT)
+
+def parse_notam_interval(effective_start : str | None, effective_end : str | None) -> tuple:
+    """Returns the (start, end) UTC timestamps of the time a NOTAM is in
+    effect. PERM NOTAMs end at math.inf. A start or end that can't be read
+    is treated as open ended, so the NOTAM is never dropped because of it."""
+    try:
+        start_date = parse_notam_date(effective_start)
+        start = -math.inf if start_date is None else start_date.replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        start = -math.inf
+    try:
+        end_date = parse_notam_date(effective_end)
+        end = math.inf if end_date is None else end_date.replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        end = math.inf
+    return (start, max(start, end))
+
+# FAA coordinates such as 3524N09736W, optionally with seconds (352412N0973604W)
+COORDINATES_PATTERN = re.compile(r"^(\d{2})(\d{2})(\d{2}(?:\.\d+)?)?([NS])(\d{3})(\d{2})(\d{2}(?:\.\d+)?)?([EW])$")
+
+def parse_notam_coordinates(coordinates : str | None) -> tuple | None:
+    """Converts FAA degrees/minutes/seconds coordinates into a
+    (latitude, longitude) tuple in decimal degrees. Returns None if the
+    coordinates are missing or can't be read."""
+    if not coordinates:
+        return None
+    match = COORDINATES_PATTERN.match(coordinates.strip().upper())
+    if match is None:
+        return None
+    lat_deg, lat_min, lat_sec, lat_hemisphere, lon_deg, lon_min, lon_sec, lon_hemisphere = match.groups()
+    latitude = int(lat_deg) + int(lat_min) / 60 + float(lat_sec or 0) / 3600
+    longitude = int(lon_deg) + int(lon_min) / 60 + float(lon_sec or 0) / 3600
+    if lat_hemisphere == "S":
+        latitude = -latitude
+    if lon_hemisphere == "W":
+        longitude = -longitude
+    if latitude > 90 or longitude > 180:
+        return None
+    return (latitude, longitude)
+
+def parse_notam_radius(radius : str | None) -> float | None:
+    """Converts the radius of a NOTAM, in nautical miles such as "005", into
+    a float. Returns None if it is missing or can't be read."""
+    try:
+        radius_nm = float(radius)
+    except (TypeError, ValueError):
+        return None
+    return radius_nm if radius_nm >= 0 and math.isfinite(radius_nm) else None
+
+def parse_geometry_point(geometry : dict | None) -> tuple | None:
+    """Returns the first (latitude, longitude) found in a GeoJSON geometry."""
+    if not isinstance(geometry, dict):
+        return None
+    if geometry.get("type") == "Point":
+        coordinates = geometry.get("coordinates") or []
+        if len(coordinates) >= 2:
+            return (float(coordinates[1]), float(coordinates[0]))
+    for inner_geometry in geometry.get("geometries") or []:
+        point = parse_geometry_point(inner_geometry)
+        if point is not None:
+            return point
+    return None
+
 class Notam:
 # Property names as they appear in the FAA API for an easier way to 
 # retreive specific properties without having to reference the FAA 
@@ -19,6 +94,14 @@ class Notam:
     ICAOLOCATION = "icaoLocation"
     COORDINATES = "coordinates"
     RADIUS = "radius"
+    # Attributes read from the FAA API and the property each one comes from
+    PROPERTY_ATTRIBUTES = (("id", ID), ("effective_start", EFFECTIVE_START), ("effective_end", EFFECTIVE_END),
+                           ("text", TEXT), ("type", TYPE), ("location", LOCATION), ("number", NUMBER),
+                           ("issued", ISSUED), ("classification", CLASSIFICATION), ("icao_location", ICAOLOCATION),
+                           ("traffic", TRAFFIC), ("purpose", PURPOSE), ("scope", SCOPE), ("radius", RADIUS),
+                           ("selection_code", SELECTION_CODE), ("coordinates", COORDINATES))
+    # Attributes of a NOTAM as a row, see to_row
+    ROW_ATTRIBUTES = tuple(attribute for attribute, property_name in PROPERTY_ATTRIBUTES) + ("latitude", "longitude", "radius_nm")
     
     def __init__(self, raw_notam_data):
         """
@@ -44,6 +127,61 @@ class Notam:
         self.scope = notam_properties.get(Notam.SCOPE)
         self.radius = notam_properties.get(Notam.RADIUS)
         self.selection_code = notam_properties.get(Notam.SELECTION_CODE)
+        self.coordinates = notam_properties.get(Notam.COORDINATES)
+
+        # Numeric location of the NOTAM, taken from its coordinates or, if
+        # those can't be read, from the GeoJSON geometry of the response.
+        location_point = parse_notam_coordinates(self.coordinates) or parse_geometry_point(raw_notam_data.get("geometry"))
+        self.latitude, self.longitude = location_point if location_point is not None else (None, None)
+        # Radius of the affected area in nautical miles, None if not given
+        self.radius_nm = parse_notam_radius(self.radius)
+
+    def to_dict(self) -> dict:
+        """Returns the NOTAM as a flat dictionary of FAA property names, plus
+        its parsed latitude and longitude and its score if it was ranked."""
+        notam_dict = {property_name: getattr(self, attribute) for attribute, property_name in Notam.PROPERTY_ATTRIBUTES}
+        notam_dict["latitude"] = self.latitude
+        notam_dict["longitude"] = self.longitude
+        notam_dict["score"] = getattr(self, "score", None)
+        return notam_dict
+
+    @classmethod
+    def from_dict(cls, notam_dict : dict):
+        """Rebuilds a NOTAM from to_dict's output without going back through
+        the FAA response format. Coordinates are only parsed again when the
+        dictionary has no latitude and longitude."""
+        notam = cls.__new__(cls)
+        for attribute, property_name in Notam.PROPERTY_ATTRIBUTES:
+            setattr(notam, attribute, notam_dict.get(property_name))
+        latitude, longitude = notam_dict.get("latitude"), notam_dict.get("longitude")
+        if latitude is None or longitude is None:
+            latitude, longitude = parse_notam_coordinates(notam.coordinates) or (None, None)
+        notam.latitude, notam.longitude = latitude, longitude
+        notam.radius_nm = parse_notam_radius(notam.radius)
+        if notam_dict.get("score") is not None:
+            notam.score = notam_dict["score"]
+        return notam
+
+    def to_row(self) -> tuple:
+        """Returns the NOTAM's attributes as a tuple in ROW_ATTRIBUTES order,
+        which pickles far smaller and faster than the NOTAM itself."""
+        return tuple(getattr(self, attribute) for attribute in Notam.ROW_ATTRIBUTES)
+
+    @classmethod
+    def from_row(cls, row : tuple):
+        """Rebuilds a NOTAM from to_row's output without parsing anything again."""
+        notam = cls.__new__(cls)
+        notam.__dict__.update(zip(Notam.ROW_ATTRIBUTES, row))
+        return notam
+
+    def to_feature(self) -> dict:
+        """Returns the NOTAM as an item of the FAA API's GeoJSON response, e.g.
+        for the mock server to replay."""
+        return {
+            "type": "Feature",
+            "properties": {"coreNOTAMData": {"notam": {property_name: getattr(self, attribute) for attribute, property_name in Notam.PROPERTY_ATTRIBUTES}}},
+            "geometry": None if self.latitude is None else {"type": "Point", "coordinates": [self.longitude, self.latitude]},
+        }
 
     # If two NOTAMs share the same id, they are considered to be the same NOTAM.
     def __eq__(self, other):
@@ -54,7 +192,7 @@ class Notam:
     
     # The id attribute is chosen for the hash as it is a unique value.
     def __hash__(self):
-            return hash(self.ID)
+            return hash(self.id)
         
     def __str__(self):
         """Returns a string representing the notam object in the form
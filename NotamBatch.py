@@ -0,0 +1,214 @@
+import copy
+from io import StringIO
+import NotamFetch
+import NotamSort
+from NavigationTools import PointObject, get_distance
+
+# most routes accepted in one batch
+MAX_BATCH_ROUTES = 100
+# an area counts as covered by another if it lies inside it give or take
+# this many nautical miles
+AREA_COVER_TOLERANCE_NM = 1
+# size in degrees of the grid used to find nearby areas when deduplicating
+AREA_GRID_DEGREES = 1.0
+
+class BatchArea:
+    """A unique request area and the legs that need it."""
+
+    def __init__(self, point : PointObject, request_radius : int | float):
+        self.point = point
+        self.request_radius = request_radius
+        self.notams = set()
+        # The exception that stopped the area being fetched, if any
+        self.error = None
+
+    def covers(self, point : PointObject, request_radius : int | float) -> bool:
+        """Whether the circle around point lies inside this area."""
+        return get_distance(self.point, point) + request_radius <= self.request_radius + AREA_COVER_TOLERANCE_NM
+
+def plan_batch_areas(leg_areas : list) -> tuple:
+    """Deduplicates the request areas of every leg.
+
+    Parameters
+    ----------
+    leg_areas : list
+        For each leg, the list of (point, request_radius) areas it needs.
+
+    Returns
+    -------
+    tuple
+        The list of unique BatchAreas to fetch and, for each leg, the list of
+        (point, request_radius, BatchArea) giving the area that covers each
+        of its own areas.
+    """
+
+    unique_areas = []
+    # (grid latitude, grid longitude) -> BatchAreas centered in that cell
+    area_grid = {}
+    leg_coverage = [[] for _ in leg_areas]
+
+    # Place the largest areas first so smaller ones can be folded into them
+    all_areas = [(request_radius, leg_index, point) for leg_index, areas in enumerate(leg_areas) for point, request_radius in areas]
+    all_areas.sort(key=lambda area: -area[0])
+
+    for request_radius, leg_index, point in all_areas:
+        cell = (int(point.latitude // AREA_GRID_DEGREES), int(point.longitude // AREA_GRID_DEGREES))
+        covering_area = None
+        for latitude_offset in (-1, 0, 1):
+            for longitude_offset in (-1, 0, 1):
+                for area in area_grid.get((cell[0] + latitude_offset, cell[1] + longitude_offset), ()):
+                    if area.covers(point, request_radius):
+                        covering_area = area
+                        break
+                if covering_area is not None:
+                    break
+            if covering_area is not None:
+                break
+
+        if covering_area is None:
+            covering_area = BatchArea(point, request_radius)
+            unique_areas.append(covering_area)
+            area_grid.setdefault(cell, []).append(covering_area)
+        leg_coverage[leg_index].append((point, request_radius, covering_area))
+
+    return unique_areas, leg_coverage
+
+def notams_for_leg_area(point : PointObject, request_radius : int | float, covering_area : BatchArea) -> set:
+    """Returns the notams of covering_area that belong to the leg's own area.
+
+    When the covering area is noticeably larger than the leg's area, notams
+    with a known location outside the leg's circle are left out.
+    """
+    if covering_area.request_radius <= request_radius + AREA_COVER_TOLERANCE_NM:
+        return covering_area.notams
+
+    leg_notams = set()
+    for notam in covering_area.notams:
+        if notam.latitude is None or notam.longitude is None:
+            leg_notams.add(notam)
+        elif get_distance(point, PointObject(notam.latitude, notam.longitude)) <= request_radius + AREA_COVER_TOLERANCE_NM:
+            leg_notams.add(notam)
+    return leg_notams
+
+def collect_batch_notams(route_list : list, message_log : StringIO, flight_windows : list | None = None) -> tuple:
+    """Fetches the notams of several routes at once, without ranking them.
+
+    The request areas of every route are planned together and areas shared
+    between routes (e.g. a hub airport) are only fetched once. In snapshot
+    mode the areas are answered from the store. Each route's notams are then
+    filtered like find_route_notams filters them, see
+    NotamFetch.filter_route_notams. An area that can't be fetched only fails
+    the routes that need it.
+
+    Parameters
+    ----------
+    route_list : list
+        (departure_airport, arrival_airport) pairs.
+    flight_windows : list
+        For each route, its (departure, arrival) UTC flight window or None.
+
+    Returns
+    -------
+    tuple
+        For each route in order, a leg dict with departure, arrival, "notams"
+        set to its filtered notams (copies the leg may score) or None, and
+        the "error" that stopped it. Legs stopped by an area that couldn't
+        be fetched also have "retryable" set. Then the stats dict of
+        get_all_notams_batch.
+    """
+
+    NotamFetch.credentials = NotamFetch.load_credentials()
+
+    flight_windows = flight_windows or [None] * len(route_list)
+    legs = []
+    leg_areas = []
+    leg_point_lists = []
+    for departure_airport, arrival_airport in route_list:
+        leg = {"departure": departure_airport, "arrival": arrival_airport, "notams": None, "error": None}
+        try:
+            point_list, request_radius = NotamFetch.plan_route(departure_airport, arrival_airport, message_log)
+            leg_areas.append([(point, request_radius) for point in point_list])
+            leg_point_lists.append(point_list)
+        except (ValueError, TypeError) as err:
+            leg["error"] = str(err)
+            leg_areas.append([])
+            leg_point_lists.append(None)
+        legs.append(leg)
+
+    unique_areas, leg_coverage = plan_batch_areas(leg_areas)
+    requested_area_count = sum(len(areas) for areas in leg_areas)
+    print(f"Fetching {len(unique_areas)} areas for {len(legs)} routes ({requested_area_count} without batching).", file=message_log)
+
+    def area_failed(index, err):
+        unique_areas[index].error = err
+        point = unique_areas[index].point
+        print(f"Fetching the area around {point.latitude:.2f}, {point.longitude:.2f} failed: {err}", file=message_log)
+
+    area_list = [(area.point, area.request_radius) for area in unique_areas]
+    if NotamFetch.notam_store is not None:
+        area_notam_sets = NotamFetch.notam_store.notams_for_areas(area_list, message_log, on_area_error=area_failed)
+    else:
+        area_notam_sets = NotamFetch.get_notams_for_areas(area_list, message_log, on_area_error=area_failed)
+    for area, area_notams in zip(unique_areas, area_notam_sets):
+        if area.error is None:
+            area.notams = area_notams
+
+    for leg, coverage, point_list, flight_window in zip(legs, leg_coverage, leg_point_lists, flight_windows):
+        if leg["error"] is not None:
+            continue
+        failed_area = next((covering_area for point, request_radius, covering_area in coverage if covering_area.error is not None), None)
+        if failed_area is not None:
+            leg["error"] = f"Fetching failed: {failed_area.error}"
+            leg["retryable"] = True
+            continue
+        leg_notams = set()
+        for point, request_radius, covering_area in coverage:
+            leg_notams.update(notams_for_leg_area(point, request_radius, covering_area))
+
+        # Scores depend on the leg's airports, so every leg ranks its own copies
+        leg["notams"] = [copy.copy(notam) for notam in NotamFetch.filter_route_notams(leg_notams, point_list, flight_window)]
+
+    stats = {
+        "routes": len(legs),
+        "requested_areas": requested_area_count,
+        "fetched_areas": len(unique_areas),
+        "api_calls_saved": requested_area_count - len(unique_areas),
+    }
+    return legs, stats
+
+def get_all_notams_batch(route_list : list, message_log : StringIO, flight_windows : list | None = None) -> dict:
+    """Finds and ranks the notams for several routes at once, the same way
+    find_route_notams ranks each of them.
+
+    The request areas of every route are planned together and areas shared
+    between routes (e.g. a hub airport) are only fetched once.
+
+    Parameters
+    ----------
+    route_list : list
+        (departure_airport, arrival_airport) pairs.
+    flight_windows : list
+        For each route, its (departure, arrival) UTC flight window or None.
+
+    Returns
+    -------
+    dict
+        "legs" holds, for each route in order, a dict with departure, arrival
+        and either its sorted "notams" or the "error" that stopped it.
+        "stats" reports the requested and fetched areas and how many API
+        calls the batching saved.
+    """
+
+    if not(isinstance(route_list, list)):
+        raise ValueError(f"Error: route_list is of the wrong type, expected list and got {type(route_list)}")
+    if len(route_list) > MAX_BATCH_ROUTES:
+        raise ValueError(f"Error: a batch can have at most {MAX_BATCH_ROUTES} routes, got {len(route_list)}")
+
+    legs, stats = collect_batch_notams(route_list, message_log, flight_windows)
+
+    sort_list = NotamSort.RatingSort()
+    for leg in legs:
+        if leg["error"] is None:
+            leg["notams"] = sort_list.sort(leg["notams"], leg["departure"], leg["arrival"])
+
+    return {"legs": legs, "stats": stats}
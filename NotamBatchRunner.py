@@ -0,0 +1,253 @@
+import argparse
+import concurrent.futures
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures.process import BrokenProcessPool
+from io import StringIO
+import NotamBatch
+import NotamFetch
+import NotamSort
+
+# Legs planned and fetched together, so request areas shared between them
+# are only fetched once. Also the most legs waiting to be ranked.
+DEFAULT_CHUNK_SIZE = 50
+# Header line an input file may start with
+INPUT_HEADER = ("DEPARTURE", "ARRIVAL")
+
+class BatchLeg:
+    """One leg of the input file."""
+
+    def __init__(self, index : int, departure : str, arrival : str, flight_window : tuple | None = None, error : str | None = None):
+        self.index = index
+        self.departure = departure
+        self.arrival = arrival
+        self.flight_window = flight_window
+        # Set when the leg can't be searched, e.g. its times can't be read
+        self.error = error
+
+    def record(self, notam_dicts : list | None = None, error : str | None = None, retryable : bool = False) -> str:
+        """Returns the output line of the leg. Legs that failed with a
+        retryable error are searched again when the run is resumed."""
+        record = {
+            "leg": self.index,
+            "departure": self.departure,
+            "arrival": self.arrival,
+            "flight_window": None if self.flight_window is None else [f"{moment:%Y-%m-%dT%H:%M}Z" for moment in self.flight_window],
+            "notams": notam_dicts,
+            "error": error,
+        }
+        if error is not None:
+            record["retryable"] = retryable
+        return json.dumps(record, separators=(",", ":")) + "\n"
+
+def read_legs(file_name : str) -> list:
+    """Returns the BatchLegs of an input file, numbered by their order in it."""
+    legs = []
+    with open(file_name, newline="") as input_file:
+        for row in csv.reader(input_file):
+            row = [value.strip() for value in row]
+            if not row or not row[0] or row[0].startswith("#"):
+                continue
+            if not legs and tuple(value.upper() for value in row[:2]) == INPUT_HEADER:
+                continue
+            index = len(legs)
+            if len(row) < 2:
+                legs.append(BatchLeg(index, row[0], "", error=f"Leg {index} needs a departure and an arrival airport"))
+                continue
+            departure_time, arrival_time = (row[2:4] + ["", ""])[:2]
+            try:
+                flight_window = NotamFetch.parse_flight_window(departure_time or None, arrival_time or None)
+            except ValueError as err:
+                legs.append(BatchLeg(index, row[0], row[1], error=str(err)))
+                continue
+            legs.append(BatchLeg(index, row[0], row[1], flight_window))
+    return legs
+
+def is_retryable(record : dict) -> bool:
+    return record["error"] is not None and bool(record.get("retryable"))
+
+def load_finished_legs(output_file_name : str) -> set:
+    """Returns the indexes of the legs already written to an output file,
+    leaving out those that failed with a retryable error.
+
+    The records of those legs are removed, as they are searched again, so
+    the output ends up with one record per leg. A line cut short by an
+    interrupted run is removed too, so the next record starts on a line of
+    its own.
+    """
+    if not os.path.exists(output_file_name):
+        return set()
+    finished_legs = set()
+    complete_size = 0
+    retryable_records = 0
+    with open(output_file_name, "rb") as output_file:
+        for line in output_file:
+            if not line.endswith(b"\n"):
+                break
+            complete_size += len(line)
+            record = json.loads(line)
+            if is_retryable(record):
+                retryable_records += 1
+            else:
+                finished_legs.add(record["leg"])
+    if retryable_records:
+        remove_retryable_records(output_file_name)
+    elif complete_size < os.path.getsize(output_file_name):
+        os.truncate(output_file_name, complete_size)
+    return finished_legs
+
+def remove_retryable_records(output_file_name : str) -> None:
+    """Rewrites an output file without the records of legs that failed with
+    a retryable error, or the line cut short at its end."""
+    temporary_file_name = output_file_name + ".tmp"
+    with open(output_file_name, "rb") as output_file, open(temporary_file_name, "wb") as temporary_file:
+        for line in output_file:
+            if line.endswith(b"\n") and not is_retryable(json.loads(line)):
+                temporary_file.write(line)
+    os.replace(temporary_file_name, output_file_name)
+
+def rank_leg(leg : BatchLeg, notams : list) -> tuple:
+    """Ranks the notams of a leg, already filtered by collect_batch_notams,
+    in a worker process. Returns the leg's output line and the number of
+    notams in it."""
+    sorted_notams = NotamSort.RatingSort().sort(notams, leg.departure, leg.arrival)
+    return leg.record([notam.to_dict() for notam in sorted_notams]), len(sorted_notams)
+
+def run_batch(legs : list, output_file_name : str, workers : int | None = None,
+              chunk_size : int = DEFAULT_CHUNK_SIZE, message_log : StringIO | None = None) -> dict:
+    """Searches and ranks every leg not already in output_file_name.
+
+    Legs are fetched a chunk at a time in this process, so every FAA API
+    request goes through the same rate limiter and concurrency limit, and
+    ranked in a pool of worker processes while the next chunk is fetched.
+    If the pool breaks, e.g. a worker is killed, the legs it was ranking are
+    recorded as retryable and the legs after them are left for the next run.
+
+    Returns
+    -------
+    dict
+        Throughput summary of the run.
+    """
+    message_log = message_log if message_log is not None else StringIO()
+    finished_legs = load_finished_legs(output_file_name)
+    pending_legs = [leg for leg in legs if leg.index not in finished_legs]
+    summary = {"legs": len(legs), "resumed": len(legs) - len(pending_legs), "ranked": 0, "failed": 0, "not_run": 0, "notams": 0,
+               "fetched_areas": 0, "api_calls_saved": 0, "fetch_seconds": 0.0}
+    faa_requests_before = NotamFetch.FAA_RESPONSES.total()
+    start_time = time.perf_counter()
+
+    # Workers are spawned rather than forked, as forking a process that is
+    # running fetch threads can copy their locks mid use
+    with open(output_file_name, "a") as output_file, \
+         concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+
+        def write_ranked(futures):
+            for future in futures:
+                leg = ranking_legs.pop(future)
+                try:
+                    line, notam_count = future.result()
+                except Exception as err:
+                    line, notam_count = leg.record(error=f"Ranking failed: {err}", retryable=True), None
+                output_file.write(line)
+                output_file.flush()
+                if notam_count is None:
+                    summary["failed"] += 1
+                else:
+                    summary["ranked"] += 1
+                    summary["notams"] += notam_count
+
+        # future -> BatchLeg being ranked
+        ranking_legs = {}
+        pool_broken = False
+        for chunk_start in range(0, len(pending_legs), chunk_size):
+            if pool_broken:
+                summary["not_run"] = len(pending_legs) - chunk_start
+                print(f"The ranking pool broke, leaving {summary['not_run']} legs for the next run.", file=message_log)
+                break
+            chunk = pending_legs[chunk_start:chunk_start + chunk_size]
+            searchable_legs = []
+            for leg in chunk:
+                if leg.error is not None:
+                    output_file.write(leg.record(error=leg.error))
+                    summary["failed"] += 1
+                else:
+                    searchable_legs.append(leg)
+
+            fetch_start = time.perf_counter()
+            try:
+                found_legs, stats = NotamBatch.collect_batch_notams([(leg.departure, leg.arrival) for leg in searchable_legs], message_log,
+                                                                 [leg.flight_window for leg in searchable_legs])
+            except Exception as err:
+                # Nothing was ranked, so the whole chunk is tried again on resume
+                for leg in searchable_legs:
+                    output_file.write(leg.record(error=f"Fetching failed: {err}", retryable=True))
+                summary["failed"] += len(searchable_legs)
+                output_file.flush()
+                continue
+            finally:
+                summary["fetch_seconds"] += time.perf_counter() - fetch_start
+            summary["fetched_areas"] += stats["fetched_areas"]
+            summary["api_calls_saved"] += stats["api_calls_saved"]
+
+            for leg, found_leg in zip(searchable_legs, found_legs):
+                if found_leg["error"] is not None:
+                    output_file.write(leg.record(error=found_leg["error"], retryable=found_leg.get("retryable", False)))
+                    summary["failed"] += 1
+                    continue
+                try:
+                    ranking_legs[pool.submit(rank_leg, leg, found_leg["notams"])] = leg
+                except BrokenProcessPool as err:
+                    output_file.write(leg.record(error=f"Ranking failed: {err}", retryable=True))
+                    summary["failed"] += 1
+                    pool_broken = True
+            output_file.flush()
+
+            write_ranked([future for future in list(ranking_legs) if future.done()])
+            # Let at most one chunk wait for ranking while the next is fetched
+            while len(ranking_legs) > chunk_size:
+                done, not_done = concurrent.futures.wait(ranking_legs, return_when=concurrent.futures.FIRST_COMPLETED)
+                write_ranked(done)
+
+        write_ranked(concurrent.futures.as_completed(list(ranking_legs)))
+
+    elapsed = time.perf_counter() - start_time
+    summary["faa_requests"] = int(NotamFetch.FAA_RESPONSES.total() - faa_requests_before)
+    summary["elapsed_seconds"] = round(elapsed, 3)
+    summary["fetch_seconds"] = round(summary["fetch_seconds"], 3)
+    summary["legs_per_second"] = round((summary["ranked"] + summary["failed"]) / elapsed, 2) if elapsed > 0 else None
+    return summary
+
+def format_summary(summary : dict) -> str:
+    return (f"{summary['ranked']} legs ranked, {summary['failed']} failed, {summary['not_run']} not run "
+            f"and {summary['resumed']} already done of {summary['legs']}.\n"
+            f"{summary['notams']} NOTAMs written in {summary['elapsed_seconds']:.1f} s ({summary['legs_per_second']} legs/s), "
+            f"{summary['fetch_seconds']:.1f} s of it fetching.\n"
+            f"{summary['faa_requests']} FAA API responses for {summary['fetched_areas']} areas, "
+            f"{summary['api_calls_saved']} requests saved by sharing areas between legs.")
+
+def main(argv : list | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Rank the NOTAMs of every leg in a file.")
+    parser.add_argument("legs", help="CSV file of departure,arrival[,departure time,arrival time] lines")
+    parser.add_argument("--output", required=True, help="NDJSON file the ranked legs are appended to, resumed if it exists")
+    parser.add_argument("--workers", type=int, default=None, help="ranking processes, defaults to the number of CPUs")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="legs fetched together")
+    parser.add_argument("--summary", help="also write the throughput summary to this JSON file")
+    args = parser.parse_args(argv)
+
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+
+    legs = read_legs(args.legs)
+    summary = run_batch(legs, args.output, args.workers, args.chunk_size)
+    print(format_summary(summary), file=sys.stderr)
+    if args.summary:
+        with open(args.summary, "w") as summary_file:
+            json.dump(summary, summary_file, indent=2)
+    return 0 if summary["failed"] == 0 and summary["not_run"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
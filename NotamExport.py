@@ -0,0 +1,131 @@
+import gzip
+import json
+import zlib
+from Notam import Notam
+
+# First bytes of a columnar export
+COLUMNAR_MAGIC = b"NOTAMCOL1\n"
+# NOTAMs per row group of a columnar export, which is also the most a
+# writer or reader holds in memory at once
+DEFAULT_ROW_GROUP_SIZE = 4096
+# NDJSON lines joined into one chunk before it is written or sent
+NDJSON_CHUNK_LINES = 256
+# zlib level for columnar exports, columns of repeated values compress well
+# even at the fast levels
+COLUMN_COMPRESSION_LEVEL = 6
+# Export format -> file extension
+EXPORT_FORMATS = {"ndjson": ".ndjson", "columnar": ".notamcol"}
+# Export format -> content type of the results API download
+EXPORT_CONTENT_TYPES = {"ndjson": "application/x-ndjson", "columnar": "application/octet-stream"}
+# Columns of a columnar export, the keys of Notam.to_dict
+EXPORT_COLUMNS = tuple(property_name for attribute, property_name in Notam.PROPERTY_ATTRIBUTES) + ("latitude", "longitude", "score")
+
+def iter_ndjson_chunks(notams) -> iter:
+    """Yields NOTAMs as NDJSON, one line per NOTAM in the order given.
+
+    notams may be any iterable, e.g. a generator producing ranked NOTAMs,
+    and is consumed as the chunks are, so memory use doesn't grow with it.
+    """
+    lines = []
+    for notam in notams:
+        lines.append(json.dumps(notam.to_dict(), separators=(",", ":")))
+        if len(lines) == NDJSON_CHUNK_LINES:
+            yield ("\n".join(lines) + "\n").encode()
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
+
+def encode_row_group(rows : list) -> bytes:
+    """Returns one row group of a columnar export: a JSON header line with
+    the row count and the compressed size of every column, followed by the
+    columns as zlib compressed JSON arrays."""
+    column_data = [zlib.compress(json.dumps([row[column] for row in rows], separators=(",", ":")).encode(), COLUMN_COMPRESSION_LEVEL)
+                   for column in EXPORT_COLUMNS]
+    header = {"rows": len(rows), "columns": [[column, len(data)] for column, data in zip(EXPORT_COLUMNS, column_data)]}
+    return json.dumps(header, separators=(",", ":")).encode() + b"\n" + b"".join(column_data)
+
+def iter_columnar_chunks(notams, row_group_size : int = DEFAULT_ROW_GROUP_SIZE) -> iter:
+    """Yields NOTAMs in the columnar format, one row group at a time.
+
+    Storing each column apart lets readers load only the columns they need
+    and compresses repeated values such as locations and types far better
+    than NDJSON.
+    """
+    yield COLUMNAR_MAGIC
+    rows = []
+    for notam in notams:
+        rows.append(notam.to_dict())
+        if len(rows) == row_group_size:
+            yield encode_row_group(rows)
+            rows = []
+    if rows:
+        yield encode_row_group(rows)
+
+def iter_export_chunks(notams, export_format : str) -> iter:
+    """Yields NOTAMs in export_format, see EXPORT_FORMATS."""
+    if export_format == "ndjson":
+        return iter_ndjson_chunks(notams)
+    if export_format == "columnar":
+        return iter_columnar_chunks(notams)
+    raise ValueError(f"Unknown export format {export_format}, expected any of {', '.join(EXPORT_FORMATS)}")
+
+def open_export_file(file_name : str, mode : str):
+    """Opens an export file, gzip compressed if the name ends in .gz."""
+    return gzip.open(file_name, mode) if file_name.endswith(".gz") else open(file_name, mode)
+
+def export_notams(notams, file_name : str, export_format : str = "ndjson") -> int:
+    """Writes NOTAMs to file_name as they are produced and returns how many
+    were written."""
+    notam_count = 0
+    def counted(notams):
+        nonlocal notam_count
+        for notam in notams:
+            notam_count += 1
+            yield notam
+
+    with open_export_file(file_name, "wb") as export_file:
+        for chunk in iter_export_chunks(counted(notams), export_format):
+            export_file.write(chunk)
+    return notam_count
+
+def iter_columnar_groups(export_file, columns : tuple | None = None) -> iter:
+    """Yields {column: list of values} for each row group of a columnar
+    export. Columns not asked for are skipped without being decompressed."""
+    if export_file.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError("Error: not a columnar NOTAM export")
+    while True:
+        header_line = export_file.readline()
+        if not header_line:
+            return
+        header = json.loads(header_line)
+        group = {}
+        for column, data_size in header["columns"]:
+            if columns is None or column in columns:
+                group[column] = json.loads(zlib.decompress(export_file.read(data_size)))
+            else:
+                export_file.seek(data_size, 1)
+        yield group
+
+def iter_notam_dicts(file_name : str, columns : tuple | None = None) -> iter:
+    """Yields the NOTAM dictionaries of an NDJSON or columnar export, one at
+    a time. With columns, a columnar export only decodes those columns."""
+    with open_export_file(file_name, "rb") as export_file:
+        is_columnar = export_file.peek(len(COLUMNAR_MAGIC))[:len(COLUMNAR_MAGIC)] == COLUMNAR_MAGIC
+        if is_columnar:
+            for group in iter_columnar_groups(export_file, columns):
+                column_names = list(group)
+                for values in zip(*(group[column] for column in column_names)):
+                    yield dict(zip(column_names, values))
+        else:
+            for line in export_file:
+                if line.strip():
+                    yield json.loads(line)
+
+def load_notams(file_name : str) -> iter:
+    """Yields the NOTAMs of an NDJSON or columnar export as Notam objects."""
+    for notam_dict in iter_notam_dicts(file_name):
+        yield Notam.from_dict(notam_dict)
+
+def is_columnar_export(file_name : str) -> bool:
+    with open_export_file(file_name, "rb") as export_file:
+        return export_file.read(len(COLUMNAR_MAGIC)) == COLUMNAR_MAGIC
@@ -1,19 +1,26 @@
-import requests
-import json
+import math
 import os
+import random
 import sys
-from dotenv import load_dotenv
-from Notam import Notam
+import threading
+import time
+from Notam import parse_notam_date, parse_notam_interval
+import NotamIngest
 import NotamSort
-from NavigationTools import *
+from NavigationTools import PointObject, RouteCorridor, get_distance, get_bearing, get_next_point_manual, get_valid_US_airport
 from io import StringIO
 import concurrent.futures
-import plotly.graph_objects as go
-from datetime import datetime
-figure = go.Figure()
-
-# link to the FAA API
-FAA_API_ENTRYPOINT = "https://external-api.faa.gov/notamapi/v1/notams"
+from datetime import datetime, timezone
+from RateLimiter import RateLimiter
+from AdaptiveConcurrency import AdaptiveLimiter, DEFAULT_INITIAL_LIMIT
+from LatencyTracker import LatencyTracker
+import Metrics
+
+# link to the FAA API, override with NOTAM_FAA_API_ENTRYPOINT to point
+# searches at a stand-in such as benchmarks/FaaMockServer.py
+FAA_API_ENTRYPOINT = os.getenv("NOTAM_FAA_API_ENTRYPOINT", "https://external-api.faa.gov/notamapi/v1/notams")
+# file the credentials are read from, override with NOTAM_ENV_FILE
+ENV_FILE_DIR = os.getenv("NOTAM_ENV_FILE", ".env")
 # spacing between the center of our notam requests in nautical miles
 DEFAULT_PATH_STEP_SIZE_NM = 40
 # max number of NOTAMs we can grab in one call
@@ -25,17 +32,90 @@ NOTAM_REQUEST_PARAMS = {
     "pageSize" : str(MAX_NOTAMS),
     "locationRadius" : str(NOTAM_RADIUS),
 }
+# NOTAMs whose area is farther than this many nautical miles from the route
+# are dropped before ranking. The request circles reach NOTAM_RADIUS off the
+# route, so smaller values narrow the results. 0 keeps every NOTAM fetched.
+CORRIDOR_HALF_WIDTH_NM = float(os.getenv("NOTAM_CORRIDOR_HALF_WIDTH_NM", 0))
+
+# requests per minute allowed by the FAA API for our credentials
+FAA_REQUESTS_PER_MINUTE = int(os.getenv("NOTAM_FAA_REQUESTS_PER_MINUTE", 50))
+# longest time a request waits for the rate limit before giving up, in seconds
+MAX_RATE_LIMIT_WAIT = 120
+# Create as many threads as needed until 
+# hitting the FAA API request per minute cap.
+# Essentially, every request will have its own thread.
+MAX_NUMBER_OF_THREADS = 50
+
+# seconds to wait for the FAA API to respond before trying again
+FAA_REQUEST_TIMEOUT = float(os.getenv("NOTAM_FAA_REQUEST_TIMEOUT", 30))
+# attempts made for each page before giving up, including the first one
+FAA_MAX_ATTEMPTS = int(os.getenv("NOTAM_FAA_MAX_ATTEMPTS", 4))
+# the wait before retry n is random, up to FAA_RETRY_BASE_DELAY * 2**(n-1)
+# seconds but never more than FAA_RETRY_MAX_DELAY, unless the API's
+# Retry-After asks for longer
+FAA_RETRY_BASE_DELAY = 0.5
+FAA_RETRY_MAX_DELAY = 30
+# Send a second, hedged request for a page that takes longer than the
+# FAA_HEDGE_PERCENTILE of recent pages, and use whichever answers first.
+# Turn on with NOTAM_FAA_HEDGE=1.
+FAA_HEDGE_ENABLED = os.getenv("NOTAM_FAA_HEDGE", "0") == "1"
+FAA_HEDGE_PERCENTILE = 0.95
+# pages timed before hedging starts, and the shortest hedge delay in seconds
+FAA_HEDGE_MIN_SAMPLES = 20
+FAA_HEDGE_MIN_DELAY = 0.05
 
 # client's credentials to the FAA API
 credentials = None
 
+# Every call to the FAA API takes a token from this limiter, so single
+# searches, batches and anything else running in this process share one
+# request budget.
+rate_limiter = RateLimiter(FAA_REQUESTS_PER_MINUTE)
+
+# Adapts the number of FAA API requests in flight to how the API is
+# responding, see AdaptiveConcurrency. Starts at NOTAM_FAA_INITIAL_CONCURRENCY
+# and stays between NOTAM_FAA_MIN_CONCURRENCY and NOTAM_FAA_MAX_CONCURRENCY.
+concurrency_limiter = AdaptiveLimiter(
+    initial_limit = int(os.getenv("NOTAM_FAA_INITIAL_CONCURRENCY", DEFAULT_INITIAL_LIMIT)),
+    min_limit = int(os.getenv("NOTAM_FAA_MIN_CONCURRENCY", 1)),
+    max_limit = int(os.getenv("NOTAM_FAA_MAX_CONCURRENCY", MAX_NUMBER_OF_THREADS)))
+
+# Latencies of recent successful FAA API page requests
+page_latencies = LatencyTracker()
+
+# Runs the requests of hedged pages. Threads are only started when needed.
+hedge_executor = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_NUMBER_OF_THREADS * 2, thread_name_prefix="notam-faa-hedge")
+
+# Functions called as listener(point, request_radius, notam_set) every time
+# the NOTAMs for a request area are fetched. Caches use this to notice when
+# an area's NOTAMs have changed.
+area_listeners = []
+
+# NotamStore.NotamStore answering searches from a nationwide snapshot, or
+# None to always fetch from the FAA API. Areas the snapshot is stale for
+# are still fetched live.
+notam_store = None
+
+FAA_RESPONSES = Metrics.registry.counter("notam_faa_responses_total", "Responses from the FAA API by HTTP status code.", ("status",))
+FAA_ERROR_MESSAGES = Metrics.registry.counter("notam_faa_error_messages_total", "HTTP 200 responses from the FAA API that only held an error message.")
+FAA_RETRIES = Metrics.registry.counter("notam_faa_retries_total", "FAA API requests sent again after a failed attempt, by reason.", ("reason",))
+CORRIDOR_PRUNED = Metrics.registry.counter("notam_corridor_pruned_total", "NOTAMs dropped for being outside the route corridor.")
+CORRIDOR_SAVED_SECONDS = Metrics.registry.counter("notam_corridor_saved_seconds_total", "Estimated filtering and ranking time saved by the route corridor.")
+FAA_HEDGES = Metrics.registry.counter("notam_faa_hedges_total", "Hedged FAA API requests sent, how many answered first, and how many were skipped for lack of rate limit tokens.", ("outcome",))
+Metrics.registry.gauge("notam_faa_rate_limit_tokens", "FAA API requests that can be sent right away.", function=lambda: rate_limiter.available())
+Metrics.registry.gauge("notam_faa_concurrency_limit", "FAA API requests allowed in flight at once.", function=lambda: concurrency_limiter.limit)
+Metrics.registry.gauge("notam_faa_requests_in_flight", "FAA API requests currently in flight.", function=lambda: concurrency_limiter.in_flight)
+Metrics.registry.counter("notam_faa_concurrency_decreases_total", "Times the FAA API concurrency limit backed off.", function=lambda: concurrency_limiter.decreases)
+
 def load_credentials() -> dict:
     """Returns the client's credentials for querying the FAA's API. 
     
     Querying the FAA NOTAM API requires authorization. There are two components
     required--a client_id and a client_secret. We store these values in a .env
     file in the root directory. If running locally, it is required to set up
-    these credentials in the .env file manually.
+    these credentials in the .env file manually. Credentials already set as
+    environment variables are used as they are, so no .env file is needed
+    when running against a local stand-in of the API.
 
     Returns
     -------
@@ -43,10 +123,12 @@ def load_credentials() -> dict:
         A dict containing client_id and client_secret.
     """
 
-    if not os.path.exists('.env'):
-        raise FileNotFoundError('.env file not found in root directory. Have you set up a .env file for credentials?')
-
-    load_dotenv()
+    if os.path.exists(ENV_FILE_DIR):
+        # dotenv is only needed once the first search starts
+        from dotenv import load_dotenv
+        load_dotenv(ENV_FILE_DIR)
+    elif not (os.getenv('client_id') and os.getenv('client_secret')):
+        raise FileNotFoundError(f'{ENV_FILE_DIR} file not found in root directory. Have you set up a .env file for credentials?')
 
     client_id = os.getenv('client_id')
     client_secret = os.getenv('client_secret')
@@ -64,6 +146,176 @@ def load_credentials() -> dict:
         "client_secret": client_secret,
     }
 
+class RetryableFAAError(RuntimeError):
+    """A failed FAA API request that may succeed if sent again.
+
+    reason is a short label for metrics (e.g. "429", "timeout") and
+    retry_after the seconds the API asked us to wait, if it did.
+    """
+
+    def __init__(self, message : str, reason : str, retry_after : float | None = None):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+def parse_retry_after(retry_after : str | None) -> float | None:
+    """Converts a Retry-After header, in seconds or an HTTP date, into seconds from now."""
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+    try:
+        retry_date = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_date - datetime.now(retry_date.tzinfo)).total_seconds())
+
+def send_page_request(request_params : dict, on_sending = None) -> dict:
+    """Sends one FAA API request after taking a token from the rate limiter.
+
+    on_sending, if given, is called with no arguments once the request has
+    its token and concurrency slot, right before it is sent.
+
+    Returns the parsed response. Raises RetryableFAAError for responses
+    worth sending again (429, 5xx, timeouts, dropped connections) and
+    RuntimeError for everything else.
+    """
+
+    # requests takes a while to import, so wait until the first API call
+    import requests
+
+    with Metrics.span("rate_limit_wait"):
+        if not rate_limiter.acquire(timeout=MAX_RATE_LIMIT_WAIT):
+            raise RuntimeError(f"Waited over {MAX_RATE_LIMIT_WAIT} seconds for the FAA API request limit, please try again later.")
+
+    with Metrics.span("concurrency_wait"):
+        if not concurrency_limiter.acquire(timeout=MAX_RATE_LIMIT_WAIT):
+            raise RuntimeError(f"Waited over {MAX_RATE_LIMIT_WAIT} seconds for a free FAA API request slot, please try again later.")
+    if on_sending is not None:
+        on_sending()
+
+    # Tell the concurrency limiter how the API coped with this request
+    latency = None
+    overloaded = False
+    start_time = time.perf_counter()
+    try:
+        with Metrics.span("faa_page"):
+            api_response = requests.get(url=FAA_API_ENTRYPOINT, params=request_params, headers=credentials, timeout=FAA_REQUEST_TIMEOUT)
+        latency = time.perf_counter() - start_time
+        overloaded = api_response.status_code == 429 or api_response.status_code >= 500
+    except requests.Timeout as err:
+        overloaded = True
+        raise RetryableFAAError(f"The FAA API did not respond within {FAA_REQUEST_TIMEOUT} seconds.", "timeout") from err
+    except requests.ConnectionError as err:
+        overloaded = True
+        raise RetryableFAAError(f"Could not connect to the FAA API at \"{FAA_API_ENTRYPOINT}\": {err}", "connection") from err
+    finally:
+        concurrency_limiter.release(latency, overloaded)
+    FAA_RESPONSES.inc(status=api_response.status_code)
+
+    if api_response.status_code == 401:
+        raise RuntimeError( f"HTTP 401 return code from FAA API. Are you authenticated?" )
+    if api_response.status_code == 404:
+        raise RuntimeError( f"HTTP 404 return code from FAA API. Has the URL moved? Accessed url \"{FAA_API_ENTRYPOINT}\"" )
+    if api_response.status_code == 429:
+        raise RetryableFAAError( f"HTTP 429 return code from FAA API. Your request limit has been reached, please wait 1 minute and try again.",
+                                 "429", parse_retry_after(api_response.headers.get("Retry-After")) )
+    if api_response.status_code >= 500:
+        raise RetryableFAAError( f"Received non-HTTP 200 status code {api_response.status_code} from FAA API", "5xx",
+                                 parse_retry_after(api_response.headers.get("Retry-After")) )
+    if api_response.status_code != 200:
+        raise RuntimeError( f"Received non-HTTP 200 status code {api_response.status_code} from FAA API" )
+
+    # Large pages are decoded on the ingest process pool
+    with Metrics.span("notam_decode"):
+        api_response_json = NotamIngest.decode_page(api_response.content)
+
+    # The FAA API often does not follow good HTTP response code practices. For
+    # example, instead of returning an HTTP 400 Bad Request, the API will
+    # respond with HTTP 200 but include a single message about what was wrong.
+    # In these cases, we want to ensure that we fail appropriately.
+    if "message" in api_response_json.keys() and len(api_response_json.keys()) == 1:
+        FAA_ERROR_MESSAGES.inc()
+        raise RuntimeError( f"Received error message from FAA API: {api_response_json['message']}" )
+
+    page_latencies.add(latency)
+    return api_response_json
+
+def send_hedged_page_request(request_params : dict) -> dict:
+    """send_page_request, but if the page takes longer than the
+    FAA_HEDGE_PERCENTILE of recent pages a duplicate request is sent, and
+    the first successful response is used.
+
+    The page's time is counted from when the first request is sent, as
+    time spent queueing for the rate limiter says nothing about the API.
+    No duplicate is sent while the rate limiter has no token to spare, as
+    it would take one that other requests are waiting for."""
+
+    if page_latencies.count() < FAA_HEDGE_MIN_SAMPLES:
+        return send_page_request(request_params)
+    hedge_delay = max(page_latencies.percentile(FAA_HEDGE_PERCENTILE), FAA_HEDGE_MIN_DELAY)
+
+    sending = threading.Event()
+    first_request = hedge_executor.submit(send_page_request, request_params, sending.set)
+    # A request that fails before it is sent is done waiting as well
+    first_request.add_done_callback(lambda request_future: sending.set())
+    sending.wait()
+    done, pending = concurrent.futures.wait([first_request], timeout=hedge_delay)
+    if done:
+        return first_request.result()
+    if rate_limiter.available() < 1:
+        FAA_HEDGES.inc(outcome="skipped")
+        return first_request.result()
+
+    FAA_HEDGES.inc(outcome="sent")
+    hedged_request = hedge_executor.submit(send_page_request, request_params)
+    pending = {first_request, hedged_request}
+    first_error = None
+    while pending:
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for request_future in done:
+            if request_future.exception() is None:
+                if request_future is hedged_request:
+                    FAA_HEDGES.inc(outcome="won")
+                # The slower request can't be cancelled, its response is dropped
+                return request_future.result()
+            first_error = first_error or request_future.exception()
+    raise first_error
+
+def retry_wait(retry_state) -> float:
+    """Seconds to wait before the next attempt: exponential backoff with full
+    jitter, or the API's Retry-After if that is longer."""
+    backoff = random.uniform(0, min(FAA_RETRY_MAX_DELAY, FAA_RETRY_BASE_DELAY * 2 ** (retry_state.attempt_number - 1)))
+    retry_after = getattr(retry_state.outcome.exception(), "retry_after", None)
+    if retry_after is not None:
+        return min(max(retry_after, backoff), MAX_RATE_LIMIT_WAIT)
+    return backoff
+
+def record_retry(retry_state) -> None:
+    FAA_RETRIES.inc(reason=retry_state.outcome.exception().reason)
+
+def fetch_notam_page(request_params : dict) -> dict:
+    """Returns one page of the FAA API's response for request_params.
+
+    Retryable failures are sent again up to FAA_MAX_ATTEMPTS times in all,
+    see retry_wait. Every attempt takes a token from the shared rate limiter.
+    """
+
+    # tenacity is only needed once the first search starts
+    from tenacity import Retrying, retry_if_exception_type, stop_after_attempt
+
+    retrying = Retrying(
+        stop=stop_after_attempt(FAA_MAX_ATTEMPTS),
+        wait=retry_wait,
+        retry=retry_if_exception_type(RetryableFAAError),
+        before_sleep=record_retry,
+        reraise=True)
+    send_request = send_hedged_page_request if FAA_HEDGE_ENABLED else send_page_request
+    return retrying(send_request, dict(request_params))
+
 def get_notams_at(request_location : PointObject, request_radius : int, message_log : StringIO, additional_params = {}) -> set:
     """ 
     This function takes the notam request, requests the api for the notams, and then returns the output.
@@ -87,99 +339,122 @@ def get_notams_at(request_location : PointObject, request_radius : int, message_
 
     # set() Will only contain unique elements.
     notam_set = set()
+    returned_notam_count = 0
     num_pages = 1
     current_page = 1
     while current_page <= num_pages :
         NOTAM_REQUEST_PARAMS.update({"pageNum" : str(current_page)})
-        
-        api_response = requests.get(url=FAA_API_ENTRYPOINT, params=NOTAM_REQUEST_PARAMS, headers=credentials)
-
-        if api_response.status_code == 401:
-            raise RuntimeError( f"HTTP 401 return code from FAA API. Are you authenticated?" )
-        if api_response.status_code == 404:
-            raise RuntimeError( f"HTTP 404 return code from FAA API. Has the URL moved? Accessed url \"{FAA_API_ENTRYPOINT}\"" )
-        if api_response.status_code == 429:
-            raise RuntimeError( f"HTTP 429 return code from FAA API. Your request limit has been reached, please wait 1 minute and try again." )
-        if api_response.status_code != 200:
-            raise RuntimeError( f"Received non-HTTP 200 status code {api_response.status_code} from FAA API" )
-
-        api_response_json = json.loads(api_response.text)
-
-        # The FAA API often does not follow good HTTP response code practices. For
-        # example, instead of returning an HTTP 400 Bad Request, the API will
-        # respond with HTTP 200 but include a single message about what was wrong.
-        # In these cases, we want to ensure that we fail appropriately.
-        if "message" in api_response_json.keys() and len(api_response_json.keys()) == 1:
-            raise RuntimeError( f"Received error message from FAA API: {api_response_json['message']}" )
+
+        api_response_json = fetch_notam_page(NOTAM_REQUEST_PARAMS)
         
         num_pages = api_response_json.get("totalPages")
         total_notams_count = api_response_json.get("totalCount")
-        returned_notam_list = api_response_json.get("items")
-        returned_notam_count = len(returned_notam_list)
-        for notam in returned_notam_list:
-            # Create a Notam object and append to the notam list. The Notam
-            # class contains constants to get specific properties from the 
-            # FAA api easily.
-            notam_set.add(Notam(notam))
+        page_notam_count = NotamIngest.page_item_count(api_response_json)
+        returned_notam_count += page_notam_count
+        with Metrics.span("notam_parse"):
+            # Create a Notam object for each item and add it to the notam set.
+            # Pages decoded on the ingest pool come with their Notams built.
+            notam_set.update(NotamIngest.page_notams(api_response_json))
         
-        print(f"Found {len(returned_notam_list)} notams at {request_location}", file=message_log)
+        print(f"Found {page_notam_count} notams at {request_location}", file=message_log)
         current_page += 1
 
     if (returned_notam_count < total_notams_count) :
         raise RuntimeError(f"Unable to retrieve all notams at {request_location}, expected {total_notams_count} and got {returned_notam_count}")
     return notam_set
 
-def get_notams_from_point_list(point_list : list, request_radius : int, message_log : StringIO) -> list:
+def get_notams_from_point_list(point_list : list, request_radius : int, message_log : StringIO, flight_window : tuple | None = None,
+                               on_area = None) -> list:
     """
     point_list: The list of points that should be requested at
 
     request_radius: The radius that requests are given when issued at a point
 
+    flight_window: (departure, arrival) UTC datetimes. The snapshot store
+    drops NOTAMs not in effect during it, including those of areas it
+    fetches live. Without a store, notams are returned as they are.
+
+    on_area: Called with the index of each point in point_list and the set of
+    notams found there, as soon as that point's notams are in.
+
     Returns a list of notams at each point within point_list
     """
     
-    # Create as many threads as needed until 
-    # hitting the FAA API request per minute cap.
-    # Essentially, every request will have its own thread.
-    MAX_NUMBER_OF_THREADS = 50
-    
     # Good code for debugging without overloading the FAA API
     # Note that the API may still return a 429 if you make two
     # separate queries too quickly.
     if len(point_list) > MAX_NUMBER_OF_THREADS:
         raise RuntimeError(f"Flight path is too long, attempting to send {len(point_list)} requests which is over the {MAX_NUMBER_OF_THREADS} request limit! Not all NOTAMs can be retrieved from the FAA API server!")
 
-    thread_list = []
-
-    # Creates a thread pool which executes until all of the threads are finished
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-
-        # Create a thread for every request
-        for point in point_list:
-            thread = executor.submit(get_notams_at, point, request_radius, message_log)
-            thread_list.append(thread)
+    area_list = [(point, request_radius) for point in point_list]
 
     # We start off with a set to avoid duplicate NOTAMs, 
     # but will convert and return a list, as sets cannot be sorted.
     notam_set = set()
 
-    # Each request has a list of notams, so concatenate each thread's output into the notam list
-    while len(thread_list) > 0:
-        thread_list_copy = thread_list.copy()
+    with Metrics.span("faa_fetch"):
+        if notam_store is not None:
+            area_notam_sets = notam_store.notams_for_areas(area_list, message_log, flight_window)
+            if on_area is not None:
+                for index, area_notams in enumerate(area_notam_sets):
+                    on_area(index, area_notams)
+        else:
+            area_notam_sets = get_notams_for_areas(area_list, message_log, on_area)
 
-        for i in range(len(thread_list_copy)):
-            request = thread_list_copy[i]
+    # Each request has a set of notams, so concatenate each area's output into the notam set
+    with Metrics.span("dedup"):
+        for area_notams in area_notam_sets:
+            notam_set.update(area_notams)
 
-            # Only check threads that are done.
-            # Remove threads after retrieving their data.
-            if(request.done()):
-                notam_set.update(request.result())
-                thread_list.remove(request)
-
-    build_map(point_list)
-    
     return list(notam_set) #return as list to allow sorting
 
+def timed_get_notams_at(request_location : PointObject, request_radius : int, message_log : StringIO) -> set:
+    """get_notams_at, recorded as one faa_area span."""
+    with Metrics.span("faa_area"):
+        return get_notams_at(request_location, request_radius, message_log)
+
+def get_notams_for_areas(area_list : list, message_log : StringIO, on_area = None, on_area_error = None) -> list:
+    """
+    area_list: (point, request_radius) tuples, one for each area to request
+
+    on_area: Called on this thread with the index of each area in area_list
+    and its set of notams, in the order the requests finish.
+
+    on_area_error: Called on this thread with the index of an area that
+    couldn't be fetched and the exception. That area is then None in the
+    result. Without it, the first failed area raises its exception.
+
+    Returns a list with the set of notams found in each area, in the same
+    order as area_list. Every area is reported to area_listeners.
+    """
+
+    area_notam_sets = [None] * len(area_list)
+
+    # Creates a thread pool which executes until all of the threads are finished
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_NUMBER_OF_THREADS) as executor:
+
+        # Create a thread for every request
+        thread_indexes = {executor.submit(timed_get_notams_at, point, request_radius, message_log): index
+                          for index, (point, request_radius) in enumerate(area_list)}
+
+        for thread in concurrent.futures.as_completed(thread_indexes):
+            index = thread_indexes[thread]
+            point, request_radius = area_list[index]
+            try:
+                area_notams = thread.result()
+            except Exception as err:
+                if on_area_error is None:
+                    raise
+                on_area_error(index, err)
+                continue
+            area_notam_sets[index] = area_notams
+            for listener in area_listeners:
+                listener(point, request_radius, area_notams)
+            if on_area is not None:
+                on_area(index, area_notams)
+
+    return area_notam_sets
+
 def find_min_step_size(airport_distance : float):
     """
     Parameters
@@ -197,19 +472,16 @@ def find_min_step_size(airport_distance : float):
     
     return math.ceil(airport_distance/MAX_IN_FLIGHT_REQUESTS)
 
-# Currently returns the union of the depature and arrival airport notams.
-# Looking to add in-flight notams and figure out a way to remove any intersecting notams.
-# Additionally, the resulting list should be sorted.
-def get_all_notams(departure_airport : str, arrival_airport : str, message_log : StringIO) -> list:
-    """This is the starting point for the program, the front end should call this function.
-        From there, this function should call other functions to 
-        retrieve depature and arrival airport notams as well as in-flight notams,
-        get these notams sorted, and return the sorted list back to the front end."""
-    
-    global credentials
-    credentials = load_credentials()
-    sort_list = NotamSort.RatingSort()
-    
+def plan_route(departure_airport : str, arrival_airport : str, message_log : StringIO) -> tuple:
+    """Finds the points along the flight path that NOTAMs are requested at.
+
+    Returns
+    -------
+    tuple
+        The list of request points, starting at the departure airport and
+        ending at the arrival airport, and the radius used for every request.
+    """
+
     error_log = []
     if not(isinstance(departure_airport, str)) :
         error_log.append(f"Error: departure_airport is of the wrong type, expected str and got {type(departure_airport)}")
@@ -219,8 +491,9 @@ def get_all_notams(departure_airport : str, arrival_airport : str, message_log :
         error_message = "\n".join(error_log)
         raise ValueError(error_message)
     
-    departure_point = PointObject.from_airport_code(message_log, departure_airport)
-    arrival_point = PointObject.from_airport_code(message_log, arrival_airport)
+    with Metrics.span("airport_lookup"):
+        departure_point = PointObject.from_airport_code(message_log, departure_airport)
+        arrival_point = PointObject.from_airport_code(message_log, arrival_airport)
 
     step_size = DEFAULT_PATH_STEP_SIZE_NM
     request_radius = NOTAM_RADIUS
@@ -233,28 +506,196 @@ def get_all_notams(departure_airport : str, arrival_airport : str, message_log :
         # request_radius = (step_size*1.2)/2
         request_radius = math.floor(step_size*0.6)
 
-    point_list = get_points_between(departure_point, arrival_point, step_size)
+    with Metrics.span("path_generation"):
+        point_list = get_points_between(departure_point, arrival_point, step_size)
 
     # point_list currently has only the in-flight points.
     # Add the departure and arrival points.
     point_list.insert(0, departure_point)
     point_list.append(arrival_point)
 
-    full_notam_list = get_notams_from_point_list(point_list, request_radius, message_log)
+    return point_list, request_radius
+
+def remove_expired_notams(notam_list : list) -> list:
+    """Returns the notams from notam_list that have not ended yet."""
 
-    #Iterate through the notams to find notams that have already ended
-    for notam in full_notam_list.copy():
-        today = datetime.utcnow()
+    today = datetime.utcnow()
+    current_notams = []
+    for notam in notam_list:
         try:
-            if(notam.effective_end != "PERM"):
-                given_date = datetime.strptime(notam.effective_end, "%Y-%m-%dT%H:%M:%S.%fZ")
-                if given_date <= today:
-                    full_notam_list.remove(notam)
+            end_date = parse_notam_date(notam.effective_end)
+            if end_date is not None and end_date <= today:
+                continue
         except Exception as e:
             #If there is any format besides the date or a Permanent notam
             print(e)
+        current_notams.append(notam)
+    return current_notams
+
+def parse_flight_time(flight_time : str | None) -> datetime | None:
+    """Converts an ISO 8601 time such as 2024-03-01T14:30 or
+    2024-03-01T14:30:00Z into a naive UTC datetime. Times without a time
+    zone are taken as UTC, like NOTAM times. Returns None when empty."""
+    if flight_time is None or not flight_time.strip():
+        return None
+    try:
+        parsed_time = datetime.fromisoformat(flight_time.strip())
+    except ValueError:
+        raise ValueError(f"Error: flight times are expected like 2024-03-01T14:30 (UTC), got {flight_time}")
+    if parsed_time.tzinfo is not None:
+        parsed_time = parsed_time.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed_time
+
+def parse_flight_window(departure_time : str | None, arrival_time : str | None) -> tuple | None:
+    """Returns the (departure, arrival) UTC datetimes of a flight, or None if
+    no departure time is given. Without an arrival time the window is just
+    the moment of departure."""
+    departure = parse_flight_time(departure_time)
+    arrival = parse_flight_time(arrival_time)
+    if departure is None:
+        if arrival is not None:
+            raise ValueError("Error: an arrival time needs a departure time")
+        return None
+    if arrival is None:
+        arrival = departure
+    if arrival < departure:
+        raise ValueError(f"Error: arrival time {arrival:%Y-%m-%d %H:%M} is before departure time {departure:%Y-%m-%d %H:%M}")
+    return (departure, arrival)
+
+def flight_window_timestamps(flight_window : tuple) -> tuple:
+    """Returns the (departure, arrival) of a flight window as UTC timestamps."""
+    return tuple(moment.replace(tzinfo=timezone.utc).timestamp() for moment in flight_window)
+
+def filter_flight_window(notam_list : list, flight_window : tuple) -> list:
+    """Returns the notams in effect at some point during the flight window.
+    PERM notams never end."""
+    window_start, window_end = flight_window_timestamps(flight_window)
+    window_notams = []
+    for notam in notam_list:
+        start, end = parse_notam_interval(notam.effective_start, notam.effective_end)
+        if start <= window_end and end >= window_start:
+            window_notams.append(notam)
+    return window_notams
+
+def filter_route_corridor(notam_list : list, point_list : list, half_width_nm : float) -> list:
+    """Returns the notams whose area comes within half_width_nm of the route.
+
+    A notam's area is the circle of its radius_nm around its location. The
+    route is the great circle from the first to the last point of
+    point_list, which get_points_between follows. Notams without a location
+    can't be measured, so they are kept.
+    """
+    corridor = RouteCorridor([(point_list[0].latitude, point_list[0].longitude), (point_list[-1].latitude, point_list[-1].longitude)])
+    corridor_notams = []
+    for notam in notam_list:
+        if notam.latitude is None or notam.longitude is None:
+            corridor_notams.append(notam)
+        elif corridor.distance_nm(notam.latitude, notam.longitude) <= half_width_nm + (notam.radius_nm or 0):
+            corridor_notams.append(notam)
+    return corridor_notams
+
+def filter_route_notams(notams, point_list : list, flight_window : tuple | None = None) -> list:
+    """Drops the notams of a route that find_route_notams would drop before
+    ranking: those off the route corridor, expired, or not in effect during
+    flight_window."""
+
+    notam_list = list(notams)
+    if CORRIDOR_HALF_WIDTH_NM > 0:
+        notam_list = filter_route_corridor(notam_list, point_list, CORRIDOR_HALF_WIDTH_NM)
+    notam_list = remove_expired_notams(notam_list)
+    if flight_window is not None:
+        notam_list = filter_flight_window(notam_list, flight_window)
+    return notam_list
+
+def rank_route_subset(notams, point_list : list, departure_airport : str, arrival_airport : str,
+                      flight_window : tuple | None = None) -> list:
+    """Filters and ranks some of a route's notams, such as those of the
+    departure and arrival areas, the same way find_route_notams ranks the
+    whole route."""
+
+    return NotamSort.RatingSort().sort(filter_route_notams(notams, point_list, flight_window), departure_airport, arrival_airport)
+
+def find_route_notams(departure_airport : str, arrival_airport : str, message_log : StringIO, flight_window : tuple | None = None,
+                      on_endpoints = None) -> tuple:
+    """Runs the full search for a route.
+
+    With a flight_window of (departure, arrival) UTC datetimes, only the
+    notams in effect at some point during the flight are kept.
+
+    on_endpoints is called with the ranked notams of the departure and
+    arrival areas as soon as both are in, while the rest of the route is
+    still being fetched.
 
-    return sort_list.sort(full_notam_list, departure_airport, arrival_airport)
+    Returns
+    -------
+    tuple
+        The sorted notams, the request points and the request radius. The
+        points and radius identify which areas the result was built from.
+    """
+    
+    global credentials
+    with Metrics.span("credentials"):
+        credentials = load_credentials()
+    sort_list = NotamSort.RatingSort()
+
+    point_list, request_radius = plan_route(departure_airport, arrival_airport, message_log)
+
+    if on_endpoints is not None:
+        endpoint_indexes = {0, len(point_list) - 1}
+        # index -> notams of the endpoint areas found so far
+        endpoint_notam_sets = {}
+        def collect_endpoint(index, area_notams):
+            if index in endpoint_indexes:
+                endpoint_notam_sets[index] = area_notams
+                if len(endpoint_notam_sets) == len(endpoint_indexes):
+                    with Metrics.span("endpoint_ranking"):
+                        # The store has already dropped the notams outside the flight window
+                        on_endpoints(rank_route_subset(set().union(*endpoint_notam_sets.values()), point_list,
+                                                       departure_airport, arrival_airport,
+                                                       flight_window if notam_store is None else None))
+
+    full_notam_list = get_notams_from_point_list(point_list, request_radius, message_log, flight_window,
+                                                 collect_endpoint if on_endpoints is not None else None)
+
+    # Drop the notams that are too far off the route to matter
+    fetched_count = len(full_notam_list)
+    if CORRIDOR_HALF_WIDTH_NM > 0:
+        with Metrics.span("corridor_filter"):
+            full_notam_list = filter_route_corridor(full_notam_list, point_list, CORRIDOR_HALF_WIDTH_NM)
+    corridor_count = len(full_notam_list)
+    downstream_start = time.perf_counter()
+
+    #Drop the notams that have already ended
+    with Metrics.span("expiry_filter"):
+        full_notam_list = remove_expired_notams(full_notam_list)
+
+    if flight_window is not None:
+        if notam_store is None:
+            with Metrics.span("flight_window_filter"):
+                full_notam_list = filter_flight_window(full_notam_list, flight_window)
+        print(f"Keeping the NOTAMs in effect between {flight_window[0]:%Y-%m-%d %H:%M} and {flight_window[1]:%Y-%m-%d %H:%M} UTC.", file=message_log)
+
+    with Metrics.span("scoring"):
+        sorted_notams = sort_list.sort(full_notam_list, departure_airport, arrival_airport)
+
+    pruned_count = fetched_count - corridor_count
+    if pruned_count:
+        # Filtering and ranking take about the same time per notam, so the
+        # pruned notams would have cost their share of it
+        saved_seconds = (time.perf_counter() - downstream_start) / max(corridor_count, 1) * pruned_count
+        CORRIDOR_PRUNED.inc(pruned_count)
+        CORRIDOR_SAVED_SECONDS.inc(saved_seconds)
+        print(f"Dropped {pruned_count} of {fetched_count} NOTAMs more than {CORRIDOR_HALF_WIDTH_NM:g} NM off the route, saving about {saved_seconds * 1000:.1f} ms of filtering and ranking.", file=message_log)
+    return sorted_notams, point_list, request_radius
+
+def get_all_notams(departure_airport : str, arrival_airport : str, message_log : StringIO) -> list:
+    """This is the starting point for the program, the front end should call this function.
+        From there, this function should call other functions to 
+        retrieve depature and arrival airport notams as well as in-flight notams,
+        get these notams sorted, and return the sorted list back to the front end."""
+
+    sorted_notams, point_list, request_radius = find_route_notams(departure_airport, arrival_airport, message_log)
+    return sorted_notams
 
 
 def get_points_between(point_one: PointObject, point_two: PointObject, spacing: float | int) -> list :
@@ -293,14 +734,17 @@ def get_points_between(point_one: PointObject, point_two: PointObject, spacing:
         bearing = get_bearing(current_point, point_two)
     return point_list
 
-def save_to_file(output_file_name : str, notam_list: list) :
+def save_to_file(output_file_name : str, notam_list: list, export_format : str = "ndjson") :
+    """Writes NOTAMs to output_file_name plus the extension of export_format,
+    see NotamExport. Returns the path written, or None if there were no NOTAMs."""
     if notam_list :
-        output_file = open(output_file_name+".json", "w")
-        for notam in notam_list :
-            output_file.write(notam)
-        output_file.close()
+        import NotamExport
+        output_path = output_file_name + NotamExport.EXPORT_FORMATS[export_format]
+        NotamExport.export_notams(notam_list, output_path, export_format)
+        return output_path
     else :
         print("No Notams Retrieved Yet")
+        return None
 
 # For testing purposes, this function will output any list of notams it is given.
 def print_to_console(notam_list : list):
@@ -329,39 +773,3 @@ def is_valid_US_airport_code(user_input : str, message_log : StringIO) -> bool:
     else:
         return False
 
-
-def build_map(point_list : list) :
-    longitudes = [p.longitude for p in point_list]
-    latitudes = [p.latitude for p in point_list]
-    figure.add_trace(go.Scattergeo(
-        lon=[*longitudes],
-        lat=[*latitudes],
-        mode = 'lines+markers',
-        line = dict(width = 1,color = 'red'),
-    ))
-
-    figure.update_layout(
-        showlegend=False,
-        margin=dict(l=10,r=10,t=10,b=10),
-        geo = dict(
-            scope = 'north america',
-            projection_type = 'azimuthal equal area',
-            #projection_scale=2.25,
-            resolution=50,
-            center_lat=point_list[0].latitude,
-            center_lon=point_list[0].longitude,
-            showland = True,
-            showcountries=True,
-            landcolor = 'rgb(243, 243, 243)',
-            countrycolor = 'rgb(160, 160, 160)',
-        )
-    )
-
-def get_map() :
-    # Get map
-    return figure
-
-def clear_map():
-    # Reset the map
-    global figure
-    figure = go.Figure()
\ No newline at end of file
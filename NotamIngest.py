@@ -0,0 +1,119 @@
+import concurrent.futures
+import json
+import os
+import threading
+from collections import namedtuple
+from itertools import repeat
+import Metrics
+import NotamSort
+from Notam import Notam
+
+# Most processes an ingest pool starts. Every web worker process has a pool
+# of its own, so it is kept small.
+MAX_INGEST_WORKERS = 4
+# Processes that decode large FAA API pages and score long notam lists, so
+# that work isn't done one core at a time under the GIL. Off unless
+# NOTAM_INGEST_WORKERS is set, as on the hosts measured so far shipping the
+# work to a pool cost more than it saved. Capped at MAX_INGEST_WORKERS and
+# the number of CPUs.
+INGEST_WORKERS = min(int(os.getenv("NOTAM_INGEST_WORKERS", 0)), MAX_INGEST_WORKERS, os.cpu_count() or 1)
+# Smaller pages are decoded on the fetch thread, shipping them costs more than it saves
+MIN_POOL_PAGE_BYTES = int(os.getenv("NOTAM_INGEST_MIN_PAGE_BYTES", 256 * 1024))
+# Shorter notam lists are scored in this process
+MIN_POOL_SCORE_NOTAMS = int(os.getenv("NOTAM_INGEST_MIN_SCORE_NOTAMS", 2000))
+# notams scored by one pool task
+SCORE_CHUNK_NOTAMS = 1000
+# Notam attributes RatingSort reads, sent to the pool instead of whole notams
+SCORE_ATTRIBUTES = ("type", "issued", "classification", "location", "icao_location", "traffic", "purpose",
+                    "scope", "radius", "selection_code")
+
+ScoreFields = namedtuple("ScoreFields", SCORE_ATTRIBUTES)
+
+INGEST_TASKS = Metrics.registry.counter("notam_ingest_pool_tasks_total", "Pages decoded and notam chunks scored on the ingest process pool.", ("task",))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Returns the ingest process pool, started on first use, or None when
+    it's turned off or this is already a worker process."""
+    global _pool
+
+    if INGEST_WORKERS <= 0:
+        return None
+    # multiprocessing takes a while to import, so wait until the pool is needed
+    import multiprocessing
+    if multiprocessing.parent_process() is not None:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # Workers are spawned rather than forked, as forking a process
+            # that is running fetch threads can copy their locks mid use
+            _pool = concurrent.futures.ProcessPoolExecutor(max_workers=INGEST_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def _drop_broken_pool(pool) -> None:
+    """Forgets a pool whose worker died, the next call starts a new one."""
+    global _pool
+
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+def parse_page_bytes(body : bytes) -> dict:
+    """Decodes an FAA API page on a pool worker. The page's items are
+    replaced by notam_rows, one Notam.to_row tuple for each."""
+    page = json.loads(body)
+    items = page.pop("items", None)
+    if items is not None:
+        page["notam_rows"] = [Notam(item).to_row() for item in items]
+    return page
+
+def score_rows(rows : list, departure, arrival, today) -> list:
+    """Scores SCORE_ATTRIBUTES rows on a pool worker."""
+    tables = NotamSort.load_ranking_tables()
+    return [NotamSort.score_notam(ScoreFields(*row), tables, departure, arrival, today) for row in rows]
+
+def decode_page(body : bytes) -> dict:
+    """Returns an FAA API response page. Large pages are decoded and their
+    notams built on the pool, read them with page_notams."""
+    pool = get_pool() if len(body) >= MIN_POOL_PAGE_BYTES else None
+    if pool is not None:
+        INGEST_TASKS.inc(task="page")
+        try:
+            return pool.submit(parse_page_bytes, body).result()
+        except concurrent.futures.BrokenExecutor:
+            _drop_broken_pool(pool)
+    return json.loads(body)
+
+def page_notams(page : dict) -> list:
+    """Returns the Notams of a page from decode_page."""
+    if "notam_rows" in page:
+        return [Notam.from_row(row) for row in page["notam_rows"]]
+    return [Notam(item) for item in page.get("items")]
+
+def page_item_count(page : dict) -> int:
+    return len(page["notam_rows"]) if "notam_rows" in page else len(page.get("items"))
+
+def score_notams(notam_list : list, departure, arrival, today) -> list | None:
+    """Returns RatingSort's scores of a long notam list, worked out on the
+    pool a chunk at a time. Returns None when the list should be scored in
+    this process instead."""
+    if len(notam_list) < MIN_POOL_SCORE_NOTAMS:
+        return None
+    pool = get_pool()
+    if pool is None:
+        return None
+
+    rows = [tuple(getattr(notam, attribute) for attribute in SCORE_ATTRIBUTES) for notam in notam_list]
+    chunks = [rows[chunk_start:chunk_start + SCORE_CHUNK_NOTAMS] for chunk_start in range(0, len(rows), SCORE_CHUNK_NOTAMS)]
+    INGEST_TASKS.inc(len(chunks), task="score")
+    scores = []
+    try:
+        for chunk_scores in pool.map(score_rows, chunks, repeat(departure), repeat(arrival), repeat(today)):
+            scores.extend(chunk_scores)
+    except concurrent.futures.BrokenExecutor:
+        _drop_broken_pool(pool)
+        return None
+    return scores
@@ -0,0 +1,107 @@
+import math
+
+# NOTAM markers are grouped on a grid with at most this many cells across
+# the route, so the number of markers stays flat as NOTAM counts grow.
+MAX_CLUSTER_GRID_CELLS = 48
+# smallest grid cell in degrees, so short routes don't get a marker per NOTAM
+MIN_CLUSTER_CELL_DEGREES = 0.05
+# number of notam ids listed on each cluster for the map's hover text
+MAX_CLUSTER_SAMPLE_IDS = 5
+
+def cluster_cell_size(point_list : list) -> float:
+    """Returns the grid cell size in degrees used to cluster a route's NOTAMs."""
+    latitudes = [point.latitude for point in point_list]
+    longitudes = [point.longitude for point in point_list]
+    route_extent = max(max(latitudes) - min(latitudes), max(longitudes) - min(longitudes))
+    return max(route_extent / MAX_CLUSTER_GRID_CELLS, MIN_CLUSTER_CELL_DEGREES)
+
+def cluster_notams(notam_list : list, cell_size : float) -> list:
+    """Groups notams that fall in the same grid cell.
+
+    Returns
+    -------
+    list
+        GeoJSON Point features, one per non-empty cell, placed at the average
+        location of the cell's notams. Notams without a location are skipped.
+    """
+    cells = {}
+    for notam in notam_list:
+        if notam.latitude is None or notam.longitude is None:
+            continue
+        cell_key = (math.floor(notam.latitude / cell_size), math.floor(notam.longitude / cell_size))
+        cell = cells.get(cell_key)
+        if cell is None:
+            cell = cells[cell_key] = {"count": 0, "latitude_sum": 0.0, "longitude_sum": 0.0, "top_score": None, "notam_ids": []}
+        cell["count"] += 1
+        cell["latitude_sum"] += notam.latitude
+        cell["longitude_sum"] += notam.longitude
+        score = getattr(notam, "score", None)
+        if score is not None and (cell["top_score"] is None or score > cell["top_score"]):
+            cell["top_score"] = score
+        if len(cell["notam_ids"]) < MAX_CLUSTER_SAMPLE_IDS:
+            cell["notam_ids"].append(notam.id)
+
+    features = []
+    for cell in cells.values():
+        features.append({
+            "type": "Feature",
+            "geometry": {
+                "type": "Point",
+                "coordinates": [round(cell["longitude_sum"] / cell["count"], 5), round(cell["latitude_sum"] / cell["count"], 5)],
+            },
+            "properties": {
+                "kind": "notam_cluster",
+                "count": cell["count"],
+                "top_score": cell["top_score"],
+                "notam_ids": cell["notam_ids"],
+            },
+        })
+    return features
+
+def build_map_payload(point_list : list, request_radius : int | float, notam_list : list) -> dict:
+    """Builds the map for a route as a compact GeoJSON FeatureCollection.
+
+    Parameters
+    ----------
+    point_list : list
+        The request points, from the departure airport to the arrival airport.
+    request_radius : int | float
+        Radius in nautical miles of the circle requested around each point.
+    notam_list : list
+        The route's notams, shown as clustered markers.
+
+    Returns
+    -------
+    dict
+        A FeatureCollection with the route line, one Point per request circle
+        (its radius is a property, the browser draws the circle) and the
+        NOTAM clusters. A new payload is built for every call, so nothing is
+        shared between requests.
+    """
+    if not point_list:
+        raise ValueError("Error: point_list must contain at least one point")
+
+    route_coordinates = [[round(point.longitude, 5), round(point.latitude, 5)] for point in point_list]
+    features = [{
+        "type": "Feature",
+        "geometry": {"type": "LineString", "coordinates": route_coordinates},
+        "properties": {"kind": "route"},
+    }]
+    for coordinates in route_coordinates:
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": coordinates},
+            "properties": {"kind": "request_area", "radius_nm": request_radius},
+        })
+    features += cluster_notams(notam_list, cluster_cell_size(point_list))
+
+    return {
+        "type": "FeatureCollection",
+        "bbox": [
+            min(coordinates[0] for coordinates in route_coordinates),
+            min(coordinates[1] for coordinates in route_coordinates),
+            max(coordinates[0] for coordinates in route_coordinates),
+            max(coordinates[1] for coordinates in route_coordinates),
+        ],
+        "features": features,
+    }
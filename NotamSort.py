@@ -1,6 +1,56 @@
 from abc import ABC, abstractmethod
 from datetime import datetime
+import hashlib
 import json
+import os
+
+# Folder with the reference json files used by RatingSort
+RANKING_DIR = "./ranking"
+# (file modification times, digest) of the last hashed ranking files
+_ranking_digest = (None, None)
+# (file modification times, {file name without .json: contents}) of the last loaded ranking files
+_ranking_tables = (None, None)
+
+def ranking_file_times() -> tuple:
+    """Returns the names of the ranking json files and their modification times."""
+    file_names = sorted(name for name in os.listdir(RANKING_DIR) if name.endswith(".json"))
+    return file_names, tuple(os.path.getmtime(os.path.join(RANKING_DIR, name)) for name in file_names)
+
+def load_ranking_tables() -> dict:
+    """Returns the contents of every ranking json file by name, e.g.
+    tables["Type"]. The files are only read again when one of them changes."""
+    global _ranking_tables
+
+    file_names, modified_times = ranking_file_times()
+    if _ranking_tables[0] != modified_times:
+        tables = {}
+        for file_name in file_names:
+            with open(os.path.join(RANKING_DIR, file_name)) as ranking_file:
+                tables[file_name[:-len(".json")]] = json.load(ranking_file)
+        _ranking_tables = (modified_times, tables)
+    return _ranking_tables[1]
+
+def ranking_version() -> str:
+    """Returns a string that changes whenever RatingSort would rank the same
+    notams differently.
+
+    This covers the contents of the ranking json files as well as the current
+    UTC date, since part of each score depends on days since issue.
+    """
+    global _ranking_digest
+
+    file_names, modified_times = ranking_file_times()
+
+    # Only re-hash the files when one of them has changed
+    if _ranking_digest[0] != modified_times:
+        digest = hashlib.sha1()
+        for file_name in file_names:
+            digest.update(file_name.encode())
+            with open(os.path.join(RANKING_DIR, file_name), "rb") as ranking_file:
+                digest.update(ranking_file.read())
+        _ranking_digest = (modified_times, digest.hexdigest()[:12])
+
+    return f"{_ranking_digest[1]}-{datetime.utcnow().date().isoformat()}"
 
 class SortStategyInterface(ABC):
 
@@ -26,117 +76,136 @@ class RatingSort(SortStategyInterface):
         return notam_list
     
     def is_float(self, value):
-        try:
-            float(value)
-            return True
-        except ValueError:
-            return False
+        return is_float(value)
 
     # Designate scores to the given notams for later sorting
-    def scoring(self, notam_list, departure, arrival):
-        today = datetime.utcnow()
-
-        # load in reference json files
-        classification = json.load(open('./ranking/Classification.json'))
-        traffic = json.load(open('./ranking/Traffic.json'))
-        purpose = json.load(open('./ranking/Purpose.json'))
-        scope = json.load(open('./ranking/Scope.json'))
-        selection_code23 = json.load(open('./ranking/Selection_Code_23.json'))
-        selection_code45 = json.load(open('./ranking/Selection_Code_45.json'))
-
-        for notam in notam_list:
-            score = 0
-
-            if notam.type != None:
-                type = json.load(open('./ranking/Type.json'))
-                try:
-                    score += type['MaxValue'] / type['dataScores'].get(notam.type, 0)
-                except (ZeroDivisionError, KeyError):
-                    score += type['MinValue']
+    def scoring(self, notam_list, departure, arrival, today = None):
+        if today is None:
+            today = datetime.utcnow()
+
+        # Long lists are scored on the ingest process pool when there is one
+        import NotamIngest
+        scores = NotamIngest.score_notams(notam_list, departure, arrival, today)
+        if scores is None:
+            tables = load_ranking_tables()
+            scores = [score_notam(notam, tables, departure, arrival, today) for notam in notam_list]
+
+        for notam, score in zip(notam_list, scores):
+            notam.score = score
 
-            # scoring based on days since date issued
-            given_date = datetime.strptime(notam.issued, "%Y-%m-%dT%H:%M:%S.%fZ")
-            difference = given_date - today
-            difference_in_days = abs(difference.days)
-            try:
-                score += 10 / difference_in_days
-            except (ZeroDivisionError):
-                # provide a score higher in the case current date is exactly issued date
-                score += 11
+def is_float(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+def score_notam(notam, tables : dict, departure, arrival, today : datetime) -> float:
+    """Returns RatingSort's score of one notam.
 
-            if notam.classification != None:
+    notam can be anything with the notam attributes scoring reads, such as
+    NotamIngest.ScoreFields. tables comes from load_ranking_tables.
+    """
+
+    # reference json files
+    type = tables['Type']
+    classification = tables['Classification']
+    traffic = tables['Traffic']
+    purpose = tables['Purpose']
+    scope = tables['Scope']
+    selection_code23 = tables['Selection_Code_23']
+    selection_code45 = tables['Selection_Code_45']
+
+    score = 0
+
+    if notam.type != None:
+        try:
+            score += type['MaxValue'] / type['dataScores'].get(notam.type, 0)
+        except (ZeroDivisionError, KeyError):
+            score += type['MinValue']
+
+    # scoring based on days since date issued
+    given_date = datetime.strptime(notam.issued, "%Y-%m-%dT%H:%M:%S.%fZ")
+    difference = given_date - today
+    difference_in_days = abs(difference.days)
+    try:
+        score += 10 / difference_in_days
+    except (ZeroDivisionError):
+        # provide a score higher in the case current date is exactly issued date
+        score += 11
+
+    if notam.classification != None:
+        try:
+            score += classification['MaxValue'] / classification['dataScores'].get(notam.classification, 0)
+        except (ZeroDivisionError, KeyError):
+            score += classification['MinValue']
+
+    # large score boost for arrival and departure related notams
+    if notam.location == departure or notam.icao_location == departure:
+        score += 20000
+    elif notam.location == arrival or notam.icao_location == arrival:
+        score += 10000
+
+    if notam.traffic != None:
+        # parse through multiple character property
+        for char in str(notam.traffic):
+            try:
+                score += traffic['MaxValue'] / traffic['dataScores'].get(char, 0)
+            except (ZeroDivisionError, KeyError):
+                score += traffic['MinValue']
+
+    if notam.purpose != None:
+        if notam.purpose == "SCHEDULED":
+            score += purpose['MaxValue'] / purpose['dataScores'].get('SCHEDULED')
+        else:
+            # parse through multiple character property
+            for char in str(notam.purpose):
                 try:
-                    score += classification['MaxValue'] / classification['dataScores'].get(notam.classification, 0)
+                    score += purpose['MaxValue'] / purpose['dataScores'].get(char, 0)
                 except (ZeroDivisionError, KeyError):
-                    score += classification['MinValue']
-
-            # large score boost for arrival and departure related notams
-            if notam.location == departure or notam.icao_location == departure:
-                score += 20000
-            elif notam.location == arrival or notam.icao_location == arrival:
-                score += 10000
-
-            if notam.traffic != None:
-                # parse through multiple character property
-                for char in str(notam.traffic):
-                    try:
-                        score += traffic['MaxValue'] / traffic['dataScores'].get(char, 0)
-                    except (ZeroDivisionError, KeyError):
-                        score += traffic['MinValue']
-
-            if notam.purpose != None:
-                if notam.purpose == "SCHEDULED":
-                    score += purpose['MaxValue'] / purpose['dataScores'].get('SCHEDULED')
-                else:
-                    # parse through multiple character property
-                    for char in str(notam.purpose):
-                        try:
-                            score += purpose['MaxValue'] / purpose['dataScores'].get(char, 0)
-                        except (ZeroDivisionError, KeyError):
-                            score += purpose['MinValue']
-
-            if notam.scope != None:
-                # parse through multiple character property
-                for char in str(notam.scope):
-                    try:
-                        score += scope['MaxValue'] / scope['dataScores'].get(char, 0)
-                    except (ZeroDivisionError, KeyError):
-                        score += scope['MinValue']
-
-            if notam.radius != None and self.is_float(notam.radius):
-                score += float(notam.radius)
-            elif "IC" in str(notam.radius):
-                score += 200
-
-            # Selection codes are determined by pairs of characters
-            # Characters 2 and 3 can determine subject being reported
-            # Characters 4 and 5 determine status of the given subject
-            # Each pair combination has been given ranks based on Selection_Code related json
-            if notam.selection_code != None:
-                # characters 2 and 3
-                
-                char2 = notam.selection_code[1]
-                char3 = notam.selection_code[2]
+                    score += purpose['MinValue']
 
-                try:
-                    category_rank = selection_code23['SubCategories'][char2].get('categoryRank', 0)
-                    subsub_category = selection_code23['SubCategories'][char2].get(char3, 0)
+    if notam.scope != None:
+        # parse through multiple character property
+        for char in str(notam.scope):
+            try:
+                score += scope['MaxValue'] / scope['dataScores'].get(char, 0)
+            except (ZeroDivisionError, KeyError):
+                score += scope['MinValue']
+
+    if notam.radius != None and is_float(notam.radius):
+        score += float(notam.radius)
+    elif "IC" in str(notam.radius):
+        score += 200
+
+    # Selection codes are determined by pairs of characters
+    # Characters 2 and 3 can determine subject being reported
+    # Characters 4 and 5 determine status of the given subject
+    # Each pair combination has been given ranks based on Selection_Code related json
+    if notam.selection_code != None:
+        # characters 2 and 3
+        
+        char2 = notam.selection_code[1]
+        char3 = notam.selection_code[2]
 
-                    score += selection_code23['MinValue'] + ( selection_code23['MaxValue']- selection_code23['MinValue'] ) * (1 / category_rank) * (1 / subsub_category)
-                except (ZeroDivisionError, KeyError):
-                    score += selection_code23['MinValue']
+        try:
+            category_rank = selection_code23['SubCategories'][char2].get('categoryRank', 0)
+            subsub_category = selection_code23['SubCategories'][char2].get(char3, 0)
 
-                # characters 4 and 5
-                char4 = notam.selection_code[3]
-                char5 = notam.selection_code[4]
+            score += selection_code23['MinValue'] + ( selection_code23['MaxValue']- selection_code23['MinValue'] ) * (1 / category_rank) * (1 / subsub_category)
+        except (ZeroDivisionError, KeyError):
+            score += selection_code23['MinValue']
 
-                try:
-                    category_rank = selection_code45['SubCategories'][char4].get('categoryRank', 0)
-                    subsub_category = selection_code45['SubCategories'][char4].get(char5, 0)
+        # characters 4 and 5
+        char4 = notam.selection_code[3]
+        char5 = notam.selection_code[4]
 
-                    score += selection_code45['MinValue'] + ( selection_code45['MaxValue']- selection_code45['MinValue'] ) * (1 / category_rank) * (1 / subsub_category)
-                except (ZeroDivisionError, KeyError):
-                    score += selection_code45['MinValue']
+        try:
+            category_rank = selection_code45['SubCategories'][char4].get('categoryRank', 0)
+            subsub_category = selection_code45['SubCategories'][char4].get(char5, 0)
 
-            notam.score = score
-            # print(notam.score)
+            score += selection_code45['MinValue'] + ( selection_code45['MaxValue']- selection_code45['MinValue'] ) * (1 / category_rank) * (1 / subsub_category)
+        except (ZeroDivisionError, KeyError):
+            score += selection_code45['MinValue']
+
+    return score
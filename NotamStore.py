@@ -0,0 +1,352 @@
+import concurrent.futures
+import copy
+import math
+import threading
+import time
+from io import StringIO
+import Metrics
+import NotamFetch
+from IntervalIndex import IntervalIndex
+from NavigationTools import PointObject, get_distance_nm
+from Notam import parse_notam_interval
+from SpatialIndex import SpatialIndex
+
+# Snapshot mode: the NOTAMs of the whole continental US are downloaded by a
+# periodic sweep of covering request areas and kept in memory, so route
+# searches are answered from the store without calling the FAA API. Areas
+# whose last sweep failed or is too old are fetched live instead.
+
+# (south, west, north, east) bounds of the continental US in degrees
+CONUS_BOUNDS = (24.0, -125.0, 50.0, -66.0)
+# radius in nautical miles of each area requested by the sweep
+SWEEP_RADIUS_NM = 100
+# seconds a swept region is used before it counts as stale
+DEFAULT_MAX_AGE_SECONDS = 1800
+# seconds between the start of two sweeps
+DEFAULT_REFRESH_INTERVAL = 900
+# nautical miles per degree of latitude
+NM_PER_DEGREE = 60
+
+def plan_sweep(bounds : tuple = CONUS_BOUNDS, radius : float = SWEEP_RADIUS_NM) -> list:
+    """Returns the centers of request areas of the given radius that together
+    cover bounds.
+
+    The centers form a grid spaced radius * sqrt(2) apart, so the square
+    around each center fits inside its circle and neighbouring squares
+    touch. Longitude spacing widens with latitude.
+    """
+    south, west, north, east = bounds
+    spacing_nm = radius * math.sqrt(2)
+    latitude_step = spacing_nm / NM_PER_DEGREE
+    row_count = max(1, math.ceil((north - south) / latitude_step))
+
+    centers = []
+    for row in range(row_count):
+        latitude = south + (row + 0.5) * (north - south) / row_count
+        # Size columns for the row's edge nearest the pole, where longitude degrees are shortest
+        edge_latitude = min(abs(latitude) + latitude_step / 2, 89.0)
+        longitude_step = latitude_step / math.cos(math.radians(edge_latitude))
+        column_count = max(1, math.ceil((east - west) / longitude_step))
+        for column in range(column_count):
+            centers.append(PointObject(latitude, west + (column + 0.5) * (east - west) / column_count))
+    return centers
+
+def circle_in_bounds(point : PointObject, radius : float, bounds : tuple) -> bool:
+    """Returns whether a circle lies entirely inside lat/lon bounds."""
+    south, west, north, east = bounds
+    latitude_margin = radius / NM_PER_DEGREE
+    longitude_margin = latitude_margin / max(math.cos(math.radians(min(abs(point.latitude) + latitude_margin, 89.0))), 0.01)
+    return (south <= point.latitude - latitude_margin and point.latitude + latitude_margin <= north
+            and west <= point.longitude - longitude_margin and point.longitude + longitude_margin <= east)
+
+class SweepRegion:
+    """One request area of the sweep and the NOTAMs it returned."""
+
+    def __init__(self, point : PointObject, radius : float):
+        self.point = point
+        self.radius = radius
+        self.notam_ids = frozenset()
+        # NOTAMs of the region without coordinates, which the spatial index can't hold
+        self.unlocated_ids = frozenset()
+        # time.time() of the last successful fetch, None if never fetched
+        self.fetched_at = None
+        self.error = None
+
+    def age(self, now : float) -> float | None:
+        return None if self.fetched_at is None else now - self.fetched_at
+
+class NotamStore:
+    """Keeps the NOTAMs of every swept region and answers route searches from them.
+
+    Parameters
+    ----------
+    bounds : tuple
+        (south, west, north, east) area covered by the sweep.
+    sweep_radius : float
+        Radius of each swept request area, in nautical miles.
+    max_age : float
+        Seconds a region's NOTAMs are used before the region counts as stale.
+    """
+
+    def __init__(self, bounds : tuple = CONUS_BOUNDS, sweep_radius : float = SWEEP_RADIUS_NM,
+                 max_age : float = DEFAULT_MAX_AGE_SECONDS):
+        self.bounds = bounds
+        self.max_age = max_age
+        self.regions = [SweepRegion(point, sweep_radius) for point in plan_sweep(bounds, sweep_radius)]
+        # notam id -> Notam, for every NOTAM in any region
+        self.notams = {}
+        # Locations and radii of the NOTAMs that have coordinates
+        self.index = SpatialIndex()
+        # When each NOTAM is in effect, as UTC timestamps
+        self.time_index = IntervalIndex()
+        self.last_sweep_started = None
+        self.last_sweep_finished = None
+        # Functions called with no arguments after a sweep changes the store
+        self.refresh_listeners = []
+        self._lock = threading.RLock()
+
+    def sweep(self, message_log : StringIO | None = None, max_workers : int = NotamFetch.MAX_NUMBER_OF_THREADS) -> int:
+        """Fetches every region again. Requests go through NotamFetch, so they
+        share its rate limiter, retries and concurrency limit.
+
+        A region that fails keeps its previous NOTAMs and goes stale once
+        they are older than max_age.
+
+        Returns
+        -------
+        int
+            Number of regions that failed.
+        """
+        message_log = message_log or StringIO()
+        if NotamFetch.credentials is None:
+            NotamFetch.credentials = NotamFetch.load_credentials()
+
+        self.last_sweep_started = time.time()
+        failed_regions = 0
+        changed = False
+        with Metrics.span("snapshot_sweep"):
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="notam-sweep") as executor:
+                region_fetches = {executor.submit(NotamFetch.get_notams_at, region.point, region.radius, message_log): region
+                                  for region in self.regions}
+                for region_fetch in concurrent.futures.as_completed(region_fetches):
+                    region = region_fetches[region_fetch]
+                    try:
+                        region_notams = region_fetch.result()
+                    except Exception as err:
+                        failed_regions += 1
+                        region.error = str(err)
+                        print(f"Snapshot of {region.point} failed: {err}", file=message_log)
+                        continue
+                    changed = self.update_region(region, region_notams) or changed
+            # Fold the sweep's changes into the time index without holding up searches
+            self.time_index.rebuild(self._lock)
+
+        self.last_sweep_finished = time.time()
+        if changed:
+            for listener in self.refresh_listeners:
+                listener()
+        return failed_regions
+
+    def update_region(self, region : SweepRegion, region_notams : set) -> bool:
+        """Replaces a region's NOTAMs. Returns whether any of them changed."""
+        with self._lock:
+            old_ids = region.notam_ids
+            changed = old_ids != {notam.id for notam in region_notams}
+            for notam in region_notams:
+                stored_notam = self.notams.get(notam.id)
+                if stored_notam is None or (stored_notam.text, stored_notam.effective_start, stored_notam.effective_end) != (notam.text, notam.effective_start, notam.effective_end):
+                    changed = True
+                self.notams[notam.id] = notam
+                self.time_index.insert(notam.id, *parse_notam_interval(notam.effective_start, notam.effective_end))
+                if notam.latitude is not None and notam.longitude is not None:
+                    self.index.insert(notam.id, notam.latitude, notam.longitude, notam.radius_nm or 0, notam)
+            region.notam_ids = frozenset(notam.id for notam in region_notams)
+            region.unlocated_ids = frozenset(notam.id for notam in region_notams if notam.latitude is None or notam.longitude is None)
+            region.fetched_at = time.time()
+            region.error = None
+
+            # Drop NOTAMs that are no longer in any region
+            for notam_id in old_ids - region.notam_ids:
+                if not any(notam_id in other_region.notam_ids for other_region in self.regions):
+                    del self.notams[notam_id]
+                    self.index.remove(notam_id)
+                    self.time_index.remove(notam_id)
+            return changed
+
+    def regions_near(self, point : PointObject, radius : float) -> list:
+        """Returns the regions whose circle overlaps the given circle."""
+        return [region for region in self.regions
+                if get_distance_nm(point.latitude, point.longitude, region.point.latitude, region.point.longitude) <= radius + region.radius]
+
+    def is_fresh(self, point : PointObject, radius : float, now : float | None = None) -> bool:
+        """Returns whether the store can answer for a circle: it lies inside
+        the swept bounds and every region overlapping it is fresh."""
+        now = time.time() if now is None else now
+        if not circle_in_bounds(point, radius, self.bounds):
+            return False
+        with self._lock:
+            return all(region.fetched_at is not None and now - region.fetched_at <= self.max_age
+                       for region in self.regions_near(point, radius))
+
+    def notams_in_circle(self, point : PointObject, radius : float) -> set:
+        """Returns copies of the stored NOTAMs located within radius of point.
+
+        NOTAMs without coordinates can't be placed, so they are included
+        whenever a region that returned them overlaps the circle. Searches
+        score the NOTAMs they get, so each gets its own copies rather than
+        the store's.
+        """
+        return {copy.copy(notam) for notam in self._stored_notams_in_circle(point, radius)}
+
+    def _stored_notams_in_circle(self, point : PointObject, radius : float) -> set:
+        """notams_in_circle, returning the stored NOTAMs themselves."""
+        with self._lock:
+            # The index finds NOTAMs whose area overlaps the circle, of those
+            # keep the ones located inside it like the FAA API does
+            found_notams = {notam for notam in self.index.query_circle(point.latitude, point.longitude, radius)
+                            if get_distance_nm(point.latitude, point.longitude, notam.latitude, notam.longitude) <= radius}
+            for region in self.regions_near(point, radius):
+                found_notams.update(self.notams[notam_id] for notam_id in region.unlocated_ids)
+        return found_notams
+
+    def active_notam_ids(self, flight_window : tuple) -> set:
+        """Returns the ids of every stored NOTAM in effect at some point during
+        the (departure, arrival) UTC datetimes of flight_window. Most NOTAMs
+        are in effect during any flight, so searches check the intervals of
+        their own candidates instead, see notams_for_areas."""
+        with self._lock:
+            return set(self.time_index.overlapping(*NotamFetch.flight_window_timestamps(flight_window)))
+
+    def notams_for_areas(self, area_list : list, message_log : StringIO, flight_window : tuple | None = None,
+                         on_area_error = None) -> list:
+        """Like NotamFetch.get_notams_for_areas, but areas the store is fresh
+        for are answered from it. Only the rest are fetched live.
+
+        With a flight_window, every area only holds the NOTAMs in effect
+        during it. For areas answered from the store, only the NOTAMs found
+        in them have their stored interval checked, once each. Their NOTAMs
+        are copies made for this call, one per NOTAM however many areas it
+        is in, so scoring them doesn't change the store or other searches.
+
+        on_area_error is passed on for the areas fetched live, see
+        NotamFetch.get_notams_for_areas.
+
+        Returns a list with the set of notams found in each area, in the
+        same order as area_list.
+        """
+        now = time.time()
+        stale_indexes = [index for index, area in enumerate(area_list) if not self.is_fresh(area[0], area[1], now)]
+        live_notams = fetch_stale_areas(area_list, stale_indexes, message_log, flight_window, on_area_error)
+
+        area_notam_sets = []
+        # notam id -> this call's copy of the stored notam, None if it isn't
+        # in effect during the flight window
+        search_copies = {}
+        with Metrics.span("snapshot_query"):
+            window = NotamFetch.flight_window_timestamps(flight_window) if flight_window is not None else None
+            for index, area in enumerate(area_list):
+                if index in live_notams:
+                    area_notam_sets.append(live_notams[index])
+                    continue
+                area_copies = set()
+                for notam in self._stored_notams_in_circle(area[0], area[1]):
+                    if notam.id not in search_copies:
+                        search_copies[notam.id] = copy.copy(notam) if window is None or self._in_window(notam.id, window) else None
+                    if search_copies[notam.id] is not None:
+                        area_copies.add(search_copies[notam.id])
+                area_notam_sets.append(area_copies)
+        if len(stale_indexes) < len(area_list):
+            print(f"Answered {len(area_list) - len(stale_indexes)} areas from the NOTAM snapshot, up to {self.oldest_age(now) / 60:.0f} minutes old.", file=message_log)
+        return area_notam_sets
+
+    def _in_window(self, notam_id : str, window : tuple) -> bool:
+        """Returns whether the stored interval of the NOTAM overlaps the
+        (start, end) timestamps of window."""
+        interval = self.time_index.get(notam_id)
+        # A notam dropped by a sweep since it was found is left out
+        return interval is not None and interval[0] <= window[1] and interval[1] >= window[0]
+
+    def oldest_age(self, now : float | None = None) -> float | None:
+        """Seconds since the least recently fetched region was fetched, None
+        if some region has never been fetched."""
+        now = time.time() if now is None else now
+        with self._lock:
+            ages = [region.age(now) for region in self.regions]
+        return None if not ages or None in ages else max(ages)
+
+    def __len__(self):
+        return len(self.notams)
+
+    def status(self) -> dict:
+        now = time.time()
+        with self._lock:
+            fresh_regions = sum(1 for region in self.regions if region.fetched_at is not None and now - region.fetched_at <= self.max_age)
+            return {
+                "regions": len(self.regions),
+                "fresh_regions": fresh_regions,
+                "stale_regions": len(self.regions) - fresh_regions,
+                "failed_regions": sum(1 for region in self.regions if region.error is not None),
+                "notam_count": len(self.notams),
+                "oldest_age_seconds": self.oldest_age(now),
+                "last_sweep_started": self.last_sweep_started,
+                "last_sweep_finished": self.last_sweep_finished,
+                "max_age_seconds": self.max_age,
+            }
+
+def fetch_stale_areas(area_list : list, stale_indexes : list, message_log : StringIO, flight_window : tuple | None = None,
+                      on_area_error = None) -> dict:
+    """Fetches the areas of area_list at stale_indexes live, for stores that
+    can't answer for them. With a flight_window, only the notams in effect
+    during it are kept. on_area_error is called with the index in area_list
+    of each area that failed, see NotamFetch.get_notams_for_areas.
+    Returns {index: set of notams, None for failed areas}."""
+    if not stale_indexes:
+        return {}
+    stale_areas = [area_list[index] for index in stale_indexes]
+    SNAPSHOT_LIVE_FALLBACKS.inc(len(stale_areas))
+    print(f"Snapshot is stale for {len(stale_areas)} of {len(area_list)} areas, fetching them live.", file=message_log)
+    def stale_area_error(stale_index, err):
+        on_area_error(stale_indexes[stale_index], err)
+    area_notam_sets = NotamFetch.get_notams_for_areas(stale_areas, message_log,
+                                                      on_area_error=stale_area_error if on_area_error is not None else None)
+    if flight_window is not None:
+        area_notam_sets = [None if area_notams is None else set(NotamFetch.filter_flight_window(area_notams, flight_window))
+                           for area_notams in area_notam_sets]
+    return dict(zip(stale_indexes, area_notam_sets))
+
+class SnapshotRefresher:
+    """Sweeps a NotamStore on a background thread every interval seconds.
+    after_sweep, if given, is called with no arguments after every sweep,
+    whether or not it changed the store."""
+
+    def __init__(self, store : NotamStore, interval : float = DEFAULT_REFRESH_INTERVAL, after_sweep=None):
+        self.store = store
+        self.interval = interval
+        self.after_sweep = after_sweep
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="notam-snapshot", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            sweep_log = StringIO()
+            try:
+                failed_regions = self.store.sweep(sweep_log)
+                if failed_regions:
+                    print(f"NOTAM snapshot sweep: {failed_regions} of {len(self.store.regions)} regions failed", flush=True)
+            except Exception as err:
+                print(f"NOTAM snapshot sweep failed: {err}", flush=True)
+            if self.after_sweep is not None:
+                try:
+                    self.after_sweep()
+                except Exception as err:
+                    print(f"NOTAM snapshot publishing failed: {err}", flush=True)
+            self._stop.wait(self.interval)
+
+    def start(self) -> "SnapshotRefresher":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+SNAPSHOT_LIVE_FALLBACKS = Metrics.registry.counter("notam_snapshot_live_fallbacks_total", "Route areas fetched live because the snapshot was stale for them.")
@@ -0,0 +1,166 @@
+import concurrent.futures
+import threading
+import time
+import uuid
+from io import StringIO
+
+# number of worker threads that run queued queries
+DEFAULT_WORKER_COUNT = 4
+# max number of jobs that can be waiting or running at the same time
+DEFAULT_MAX_PENDING_JOBS = 32
+# seconds a finished job (and its result) is kept before it expires
+DEFAULT_RESULT_TTL_SECONDS = 600
+
+class JobQueueFullError(RuntimeError):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+def normalize_route(departure_airport : str, arrival_airport : str) -> tuple:
+    """Returns the key used to detect identical routes.
+
+    Airport codes are case insensitive, so "okc" and "OKC" are the same route.
+    """
+    return (departure_airport.strip().upper(), arrival_airport.strip().upper())
+
+class QueryJob:
+    """A single queued /query search.
+
+    Each job has its own message log so messages from different searches
+    don't get mixed together.
+    """
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, job_id : str, departure_airport : str, arrival_airport : str, flight_window : tuple | None = None):
+        self.id = job_id
+        self.departure_airport = departure_airport
+        self.arrival_airport = arrival_airport
+        self.flight_window = flight_window
+        self.route_key = normalize_route(departure_airport, arrival_airport) + (flight_window,)
+        self.status = QueryJob.PENDING
+        self.result = None
+        self.error = None
+        self.message_log = StringIO()
+        self.submitted_at = time.time()
+        self.finished_at = None
+
+    def is_finished(self) -> bool:
+        return self.status in (QueryJob.DONE, QueryJob.FAILED)
+
+    def messages(self) -> str:
+        return self.message_log.getvalue()
+
+    def to_dict(self) -> dict:
+        """Returns the job's status in a JSON friendly form. The result itself
+        is not included, as it is rendered separately."""
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "departure_airport": self.departure_airport,
+            "arrival_airport": self.arrival_airport,
+            "flight_window": None if self.flight_window is None else [moment.isoformat() + "Z" for moment in self.flight_window],
+            "submitted_at": self.submitted_at,
+            "finished_at": self.finished_at,
+            "error": None if self.error is None else str(self.error),
+            "messages": self.messages(),
+        }
+
+class QueryJobQueue:
+    """Runs searches on a bounded pool of worker threads.
+
+    Submitting a route that already has a pending, running or unexpired
+    finished job returns that job instead of starting a new search. Failed
+    jobs are never reused so the user can retry.
+
+    Parameters
+    ----------
+    run_query : callable
+        Called as run_query(departure_airport, arrival_airport, message_log)
+        on a worker thread, with a flight_window keyword argument for jobs
+        that have one. Its return value becomes the job's result.
+    worker_count : int
+        Number of searches that run at the same time.
+    max_pending_jobs : int
+        Number of unfinished jobs allowed before submit() raises JobQueueFullError.
+    result_ttl : float
+        Seconds a finished job is kept before it expires.
+    """
+
+    def __init__(self, run_query, worker_count : int = DEFAULT_WORKER_COUNT,
+                 max_pending_jobs : int = DEFAULT_MAX_PENDING_JOBS,
+                 result_ttl : float = DEFAULT_RESULT_TTL_SECONDS):
+        if worker_count < 1:
+            raise ValueError(f"Error: worker_count must be at least 1, got {worker_count}")
+        if max_pending_jobs < 1:
+            raise ValueError(f"Error: max_pending_jobs must be at least 1, got {max_pending_jobs}")
+
+        self.run_query = run_query
+        self.worker_count = worker_count
+        self.max_pending_jobs = max_pending_jobs
+        self.result_ttl = result_ttl
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix="notam-query")
+        self._lock = threading.Lock()
+        # job id -> QueryJob
+        self._jobs = {}
+        # normalized route -> id of the newest job for that route
+        self._route_jobs = {}
+
+    def submit(self, departure_airport : str, arrival_airport : str, flight_window : tuple | None = None) -> QueryJob:
+        """Queues a search, or returns the existing job for an identical route
+        and flight window."""
+
+        if not(isinstance(departure_airport, str)) or not(isinstance(arrival_airport, str)):
+            raise ValueError(f"Error: airports are of the wrong type, expected str and got {type(departure_airport)} and {type(arrival_airport)}")
+
+        route_key = normalize_route(departure_airport, arrival_airport) + (flight_window,)
+        with self._lock:
+            self._expire_jobs(time.time())
+
+            existing_job = self._jobs.get(self._route_jobs.get(route_key))
+            if existing_job is not None and existing_job.status != QueryJob.FAILED:
+                return existing_job
+
+            unfinished_jobs = sum(1 for job in self._jobs.values() if not job.is_finished())
+            if unfinished_jobs >= self.max_pending_jobs:
+                raise JobQueueFullError(f"Too many searches in progress ({unfinished_jobs}), please try again shortly.")
+
+            job = QueryJob(uuid.uuid4().hex, departure_airport, arrival_airport, flight_window)
+            self._jobs[job.id] = job
+            self._route_jobs[route_key] = job.id
+
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id : str) -> QueryJob | None:
+        """Returns the job with the given id, or None if it is unknown or has expired."""
+        with self._lock:
+            self._expire_jobs(time.time())
+            return self._jobs.get(job_id)
+
+    def shutdown(self, wait : bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job : QueryJob) -> None:
+        job.status = QueryJob.RUNNING
+        try:
+            window_argument = {} if job.flight_window is None else {"flight_window": job.flight_window}
+            job.result = self.run_query(job.departure_airport, job.arrival_airport, job.message_log, **window_argument)
+            final_status = QueryJob.DONE
+        except Exception as err:
+            job.error = err
+            final_status = QueryJob.FAILED
+        # A finished job must have its finished_at by the time expiry sees it
+        with self._lock:
+            job.finished_at = time.time()
+            job.status = final_status
+
+    def _expire_jobs(self, now : float) -> None:
+        # Caller must hold self._lock.
+        expired_ids = [job.id for job in self._jobs.values()
+                       if job.is_finished() and now - job.finished_at >= self.result_ttl]
+        for job_id in expired_ids:
+            job = self._jobs.pop(job_id)
+            if self._route_jobs.get(job.route_key) == job_id:
+                del self._route_jobs[job.route_key]
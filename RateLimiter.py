@@ -0,0 +1,62 @@
+import threading
+import time
+
+class RateLimiter:
+    """A token bucket shared by every caller of an API.
+
+    Tokens refill continuously at requests_per_minute, up to burst tokens.
+    Each request takes one token, waiting for one to refill if the bucket
+    is empty.
+
+    Parameters
+    ----------
+    requests_per_minute : float
+        Sustained number of requests allowed per minute.
+    burst : int
+        Number of requests that can be sent back to back after the limiter
+        has been idle. Defaults to requests_per_minute.
+    """
+
+    def __init__(self, requests_per_minute : float, burst : int | None = None):
+        if requests_per_minute <= 0:
+            raise ValueError(f"Error: requests_per_minute must be positive, got {requests_per_minute}")
+
+        self.requests_per_minute = requests_per_minute
+        self.burst = burst if burst is not None else max(1, int(requests_per_minute))
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now : float) -> None:
+        # Caller must hold self._lock.
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.requests_per_minute / 60)
+        self._last_refill = now
+
+    def acquire(self, timeout : float | None = None) -> bool:
+        """Takes one token, waiting up to timeout seconds (forever if None).
+
+        Returns
+        -------
+        bool
+            True if a token was taken, False if the timeout ran out first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait_time = (1 - self._tokens) * 60 / self.requests_per_minute
+
+            if deadline is not None:
+                if now + wait_time > deadline:
+                    return False
+            time.sleep(wait_time)
+
+    def available(self) -> float:
+        """Returns the number of tokens currently in the bucket."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
@@ -0,0 +1,241 @@
+import hmac
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+# Opt-in profiling of single requests. A request asks for a profile with the
+# X-Notam-Profile header (or profile query parameter) and proves it is an
+# admin with the X-Notam-Admin-Token header. Profiling is off entirely unless
+# NOTAM_ADMIN_TOKEN is set.
+
+# Profiling modes a request can ask for
+CPU_MODE = "cpu"            # cProfile of the request thread
+SAMPLE_MODE = "sample"      # stack samples of every thread, e.g. the FAA fetch pool
+MEMORY_MODE = "memory"      # tracemalloc allocations during the request
+PROFILE_MODES = (CPU_MODE, SAMPLE_MODE, MEMORY_MODE)
+
+# directory profiles are saved to
+DEFAULT_PROFILE_DIR = "profiles"
+# number of profiles kept, older ones are deleted
+DEFAULT_MAX_PROFILES = 20
+# seconds between stack samples in sample mode
+SAMPLE_INTERVAL = 0.005
+# frames kept for each tracemalloc allocation
+TRACEMALLOC_FRAMES = 25
+# number of entries in a profile's summary
+SUMMARY_LENGTH = 30
+
+PROFILE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+def is_authorized(admin_token : str | None, given_token : str | None) -> bool:
+    """Returns whether given_token matches admin_token. Always False when no
+    admin token is configured."""
+    if not admin_token or not given_token:
+        return False
+    return hmac.compare_digest(admin_token.encode(), given_token.encode())
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+class StackSampler:
+    """Samples the stacks of every other thread at a fixed interval.
+
+    The samples are kept as collapsed stacks (root first, separated by ";"),
+    the input format of flame graph tools.
+    """
+
+    def __init__(self, interval : float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="notam-stack-sampler", daemon=True)
+
+    def _run(self) -> None:
+        sampler_thread_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == sampler_thread_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_name(frame))
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def summary(self) -> list:
+        """Returns the frames most often on top of a stack, with their share of samples."""
+        total_samples = sum(self.samples.values()) or 1
+        leaf_counts = Counter()
+        for stack, count in self.samples.items():
+            leaf_counts[stack.rsplit(";", 1)[-1]] += count
+        return [f"{count / total_samples:6.1%} {leaf}" for leaf, count in leaf_counts.most_common(SUMMARY_LENGTH)]
+
+class ProfileStore:
+    """Runs profiled calls and keeps their results in a bounded directory.
+
+    Each profile is saved as <profile_id>.json (route, timings, mode and a
+    summary) next to the raw profile: <profile_id>.prof for cProfile (load
+    with pstats), <profile_id>.collapsed for stack samples and
+    <profile_id>.tracemalloc for memory snapshots (load with
+    tracemalloc.Snapshot.load).
+
+    Only one profile runs at a time; profilers hook the whole interpreter.
+    """
+
+    RAW_EXTENSIONS = {CPU_MODE: ".prof", SAMPLE_MODE: ".collapsed", MEMORY_MODE: ".tracemalloc"}
+
+    def __init__(self, directory : str = DEFAULT_PROFILE_DIR, max_profiles : int = DEFAULT_MAX_PROFILES):
+        if max_profiles < 1:
+            raise ValueError(f"Error: max_profiles must be at least 1, got {max_profiles}")
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+
+    def run(self, mode : str, function, annotations : dict) -> tuple:
+        """Calls function() under the profiler for mode.
+
+        Returns
+        -------
+        tuple
+            function's return value and the saved profile's id, or None for
+            the id if another profile was already running. Exceptions from
+            function are raised after the profile is saved.
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode}, expected any of {', '.join(PROFILE_MODES)}")
+        if not self._lock.acquire(blocking=False):
+            return function(), None
+
+        try:
+            profile_id = self.new_profile_id(mode, annotations)
+            profiler = self.start_profiler(mode)
+            started = datetime.utcnow().isoformat() + "Z"
+            start_time = time.perf_counter()
+            error = None
+            try:
+                result = function()
+            except Exception as err:
+                error = err
+            duration = time.perf_counter() - start_time
+            summary = self.stop_profiler(mode, profiler, os.path.join(self.directory, profile_id + self.RAW_EXTENSIONS[mode]))
+
+            metadata = {
+                "id": profile_id,
+                "mode": mode,
+                "started": started,
+                "duration_seconds": duration,
+                "error": None if error is None else repr(error),
+                "annotations": annotations,
+                "raw_file": profile_id + self.RAW_EXTENSIONS[mode],
+                "summary": summary,
+            }
+            with open(os.path.join(self.directory, profile_id + ".json"), "w") as metadata_file:
+                json.dump(metadata, metadata_file, indent=2)
+            self.remove_old_profiles()
+        finally:
+            self._lock.release()
+
+        if error is not None:
+            raise error
+        return result, profile_id
+
+    def new_profile_id(self, mode : str, annotations : dict) -> str:
+        route = "-".join(re.sub(r"[^A-Za-z0-9]", "", str(annotations.get(name, ""))) for name in ("departure", "arrival"))
+        return f"{datetime.utcnow():%Y%m%dT%H%M%S}-{route}-{mode}-{uuid.uuid4().hex[:8]}"
+
+    def start_profiler(self, mode : str):
+        os.makedirs(self.directory, exist_ok=True)
+        if mode == CPU_MODE:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+            return profiler
+        if mode == SAMPLE_MODE:
+            sampler = StackSampler()
+            sampler.start()
+            return sampler
+        import tracemalloc
+        already_tracing = tracemalloc.is_tracing()
+        if not already_tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        tracemalloc.reset_peak()
+        return (already_tracing, tracemalloc.take_snapshot())
+
+    def stop_profiler(self, mode : str, profiler, raw_file_name : str) -> dict:
+        """Stops the profiler, saves its raw output and returns a summary."""
+        if mode == CPU_MODE:
+            import pstats
+            profiler.disable()
+            profiler.dump_stats(raw_file_name)
+            stats_text = io.StringIO()
+            pstats.Stats(profiler, stream=stats_text).sort_stats("cumulative").print_stats(SUMMARY_LENGTH)
+            return {"top_cumulative": stats_text.getvalue().splitlines()}
+        if mode == SAMPLE_MODE:
+            profiler.stop()
+            with open(raw_file_name, "w") as raw_file:
+                raw_file.write(profiler.collapsed())
+            return {"samples": sum(profiler.samples.values()), "top_frames": profiler.summary()}
+
+        import tracemalloc
+        already_tracing, snapshot_before = profiler
+        snapshot_after = tracemalloc.take_snapshot()
+        current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        if not already_tracing:
+            tracemalloc.stop()
+        snapshot_after.dump(raw_file_name)
+        growth = snapshot_after.compare_to(snapshot_before, "lineno")
+        return {
+            "traced_bytes": current_bytes,
+            "peak_traced_bytes": peak_bytes,
+            "top_growth": [str(stat) for stat in growth[:SUMMARY_LENGTH]],
+        }
+
+    def remove_old_profiles(self) -> None:
+        """Deletes the oldest profiles beyond max_profiles."""
+        metadata_files = sorted((entry for entry in os.scandir(self.directory) if entry.name.endswith(".json")),
+                                key=lambda entry: entry.stat().st_mtime)
+        for entry in metadata_files[:max(0, len(metadata_files) - self.max_profiles)]:
+            profile_id = entry.name[:-len(".json")]
+            for extension in (".json", *self.RAW_EXTENSIONS.values()):
+                try:
+                    os.remove(os.path.join(self.directory, profile_id + extension))
+                except FileNotFoundError:
+                    pass
+
+    def list_profiles(self) -> list:
+        """Returns the metadata of every saved profile, newest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                with open(entry.path) as metadata_file:
+                    profiles.append(json.load(metadata_file))
+        return sorted(profiles, key=lambda profile: profile["started"], reverse=True)
+
+    def file_path(self, file_name : str) -> str | None:
+        """Returns the path of a saved profile file, or None if file_name
+        isn't one."""
+        profile_id, extension = os.path.splitext(file_name)
+        if not PROFILE_ID_PATTERN.match(profile_id) or extension not in (".json", *self.RAW_EXTENSIONS.values()):
+            return None
+        path = os.path.join(self.directory, file_name)
+        return path if os.path.isfile(path) else None
@@ -0,0 +1,169 @@
+import base64
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from TextIndex import TextIndex
+
+# brotli is optional, responses fall back to gzip when it isn't installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# number of notams per page when the client doesn't ask for a size
+DEFAULT_PAGE_SIZE = 50
+# largest page a client can ask for
+MAX_PAGE_SIZE = 500
+# number of ranked results kept for paging
+DEFAULT_MAX_RESULTS = 128
+# responses smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 1024
+
+# Notam attributes that can be requested with the fields parameter
+NOTAM_FIELDS = ("id", "location", "number", "effective_start", "effective_end", "text", "type",
+                "selection_code", "traffic", "purpose", "score", "issued", "classification",
+                "icao_location", "scope", "radius")
+# Fields returned when none are requested, the same as the results table
+DEFAULT_FIELDS = ("id", "location", "number", "effective_start", "effective_end", "text", "type",
+                  "selection_code", "traffic", "purpose", "score")
+# Column headers of the results table, in the order of DEFAULT_FIELDS
+TABLE_HEADERS = ("ID", "Location", "Number", "Effective Start", "Effective End", "Description", "Type",
+                 "Selection Code", "Traffic", "Purpose", "Score")
+
+def result_id_for(notams : list) -> str:
+    """Returns an id that only depends on the ranked notams' contents.
+
+    Searching again and getting the same ranking gives the same id, so pages
+    the client has already seen keep their ETag.
+    """
+    digest = hashlib.sha1()
+    for notam in notams:
+        digest.update(f"{notam.id}\x1f{notam.score}\x1f{notam.effective_start}\x1f{notam.effective_end}\x1f{notam.text}\x1e".encode())
+    return digest.hexdigest()[:20]
+
+def encode_cursor(result_id : str, offset : int, text_query : str = "") -> str:
+    """Returns the opaque cursor pointing at offset within a result, or
+    within the part of it matching text_query."""
+    cursor_fields = [result_id, offset, text_query] if text_query else [result_id, offset]
+    cursor = json.dumps(cursor_fields, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(cursor).decode().rstrip("=")
+
+def decode_cursor(cursor : str, result_id : str, text_query : str = "") -> int:
+    """Returns the offset a cursor points at. Raises ValueError if the cursor
+    is malformed or belongs to a different result or text query."""
+    try:
+        padded_cursor = cursor + "=" * (-len(cursor) % 4)
+        cursor_result_id, offset, *cursor_query = json.loads(base64.urlsafe_b64decode(padded_cursor))
+    except (ValueError, TypeError) as err:
+        raise ValueError(f"Invalid cursor {cursor}") from err
+    if cursor_result_id != result_id or not isinstance(offset, int) or offset < 0:
+        raise ValueError(f"Cursor {cursor} does not belong to result {result_id}")
+    if (cursor_query[0] if cursor_query else "") != text_query:
+        raise ValueError(f"Cursor {cursor} belongs to a different text query")
+    return offset
+
+def parse_fields(fields : str | None) -> tuple:
+    """Converts a comma separated fields parameter into a tuple of fields."""
+    if not fields:
+        return DEFAULT_FIELDS
+    requested_fields = tuple(field.strip() for field in fields.split(",") if field.strip())
+    unknown_fields = [field for field in requested_fields if field not in NOTAM_FIELDS]
+    if unknown_fields:
+        raise ValueError(f"Unknown field(s) {', '.join(unknown_fields)}, expected any of {', '.join(NOTAM_FIELDS)}")
+    return requested_fields
+
+def parse_page_size(limit : str | None) -> int:
+    if not limit:
+        return DEFAULT_PAGE_SIZE
+    try:
+        page_size = int(limit)
+    except ValueError as err:
+        raise ValueError(f"limit must be an integer, got {limit}") from err
+    if page_size < 1:
+        raise ValueError(f"limit must be at least 1, got {page_size}")
+    return min(page_size, MAX_PAGE_SIZE)
+
+def page_items(notams : list, fields : tuple) -> list:
+    """Returns the requested fields of each notam, as they appear in a page."""
+    return [{field: getattr(notam, field, None) for field in fields} for notam in notams]
+
+def build_page(result_id : str, notams : list, offset : int, page_size : int, fields : tuple, text_query : str = "") -> dict:
+    """Returns one page of a ranked result with only the requested fields.
+    With a text_query, notams is the part of the result matching it."""
+    page_notams = notams[offset:offset + page_size]
+    next_offset = offset + len(page_notams)
+    return {
+        "result_id": result_id,
+        "total_count": len(notams),
+        "offset": offset,
+        "fields": list(fields),
+        "items": page_items(page_notams, fields),
+        "next_cursor": encode_cursor(result_id, next_offset, text_query) if next_offset < len(notams) else None,
+    }
+
+def page_etag(result_id : str, offset : int, page_size : int, fields : tuple, text_query : str = "") -> str:
+    """Returns the ETag of a page. Results never change once stored, so the
+    page's parameters are enough to identify its contents."""
+    return hashlib.sha1(f"{result_id}:{offset}:{page_size}:{','.join(fields)}:{text_query}".encode()).hexdigest()[:20]
+
+def compress(body : bytes, accept_encoding : str) -> tuple:
+    """Compresses body with the best encoding the client accepts.
+
+    Returns
+    -------
+    tuple
+        The (possibly) compressed body and its Content-Encoding, or None if
+        it was left uncompressed.
+    """
+    if len(body) < MIN_COMPRESS_BYTES:
+        return body, None
+    accepted_encodings = {encoding.split(";")[0].strip().lower() for encoding in accept_encoding.split(",")}
+    if brotli is not None and "br" in accepted_encodings:
+        return brotli.compress(body), "br"
+    if "gzip" in accepted_encodings:
+        return gzip.compress(body, compresslevel=6), "gzip"
+    return body, None
+
+class ResultStore:
+    """Keeps recent ranked results so they can be served a page at a time.
+
+    Results are stored under result_id_for(notams) and the least recently
+    used ones are dropped once there are more than max_results. The text of
+    every stored notam is kept in text_index so results can be filtered by
+    keywords.
+    """
+
+    def __init__(self, max_results : int = DEFAULT_MAX_RESULTS):
+        self.max_results = max_results
+        self.text_index = TextIndex()
+        self._lock = threading.Lock()
+        # result id -> ranked list of notams
+        self._results = OrderedDict()
+
+    def add(self, notams : list) -> str:
+        """Stores a ranked result and returns its id."""
+        result_id = result_id_for(notams)
+        with self._lock:
+            if result_id not in self._results:
+                self._results[result_id] = list(notams)
+                for notam in notams:
+                    self.text_index.add(notam.id, notam.text)
+            self._results.move_to_end(result_id)
+            while len(self._results) > self.max_results:
+                dropped_result_id, dropped_notams = self._results.popitem(last=False)
+                for notam in dropped_notams:
+                    self.text_index.remove(notam.id)
+        return result_id
+
+    def get(self, result_id : str, text_query : str = "") -> list | None:
+        """Returns a stored result, or only its notams whose text holds every
+        term of text_query (see TextIndex.tokenize)."""
+        with self._lock:
+            notams = self._results.get(result_id)
+            if notams is not None:
+                self._results.move_to_end(result_id)
+        if notams is None or not text_query:
+            return notams
+        return self.text_index.filter(notams, text_query)
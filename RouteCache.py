@@ -0,0 +1,225 @@
+import contextlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import timezone
+import NotamSort
+from Notam import parse_notam_date
+from QueryJobs import normalize_route
+
+# max number of routes kept in the cache
+DEFAULT_MAX_ENTRIES = 256
+# seconds a route is served from the cache even if nothing has changed
+DEFAULT_MAX_AGE_SECONDS = 900
+# decimal places kept when identifying a request area by its center
+AREA_KEY_PRECISION = 4
+
+def area_key(point, request_radius : int | float) -> tuple:
+    """Returns the key identifying a request area (a circle around a point)."""
+    return (round(point.latitude, AREA_KEY_PRECISION), round(point.longitude, AREA_KEY_PRECISION), request_radius)
+
+def area_fingerprint(notam_set) -> int:
+    """Returns a value that changes when any NOTAM in an area is added,
+    cancelled or edited."""
+    return hash(frozenset((notam.id, notam.text, notam.effective_start, notam.effective_end) for notam in notam_set))
+
+class FetchRecord:
+    """The areas one search fetched, see RouteCache.recording."""
+
+    def __init__(self, clear_count : int):
+        # RouteCache.clear calls before the search started
+        self.clear_count = clear_count
+        # area key -> fingerprint of the NOTAMs the search fetched there
+        self.area_fingerprints = {}
+
+class RouteCacheEntry:
+    """The stored result of one route search: the ranked notams and the
+    route's map payload (see NotamMap.build_map_payload)."""
+
+    def __init__(self, notams : list, map_payload : dict, area_keys : frozenset, expires_at : float):
+        self.notams = list(notams)
+        # sorted notam ids, in ranked order
+        self.notam_ids = [notam.id for notam in self.notams]
+        self.map_payload = map_payload
+        self.area_keys = area_keys
+        self.created_at = time.time()
+        self.expires_at = expires_at
+
+    def age(self) -> float:
+        return time.time() - self.created_at
+
+class RouteCache:
+    """Caches search results by normalized (departure, arrival, ranking version).
+
+    An entry stops being served as soon as one of these happens:
+        - a NOTAM in the result reaches its effective_end
+        - a later fetch of one of the route's request areas returns different
+          NOTAMs than before (see area_fetched)
+        - the cache is cleared, e.g. when the snapshot store changes
+        - the entry is older than max_age
+
+    Register area_fetched in NotamFetch.area_listeners so that every fetch
+    can invalidate the routes built from that area. Areas are matched by
+    their exact center and radius, and other routes rarely fetch the same
+    circles, so outside snapshot mode entries mostly last until a NOTAM
+    ends or max_age. Watched routes (see RouteWatch) refetch their own
+    areas and do invalidate them.
+
+    Run each search inside recording() and pass the record to put, so a
+    result built from NOTAMs that changed or were cleared while the search
+    ran isn't stored.
+    """
+
+    def __init__(self, max_entries : int = DEFAULT_MAX_ENTRIES, max_age : float = DEFAULT_MAX_AGE_SECONDS):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # results not stored because their areas changed during the search
+        self.rejected_puts = 0
+
+        self._lock = threading.Lock()
+        self._clear_count = 0
+        # .record is the FetchRecord of the search running on this thread
+        self._recording = threading.local()
+        # route key -> RouteCacheEntry, least recently used first
+        self._entries = OrderedDict()
+        # area key -> fingerprint of the area's NOTAMs the last time it was fetched
+        self._area_fingerprints = {}
+        # area key -> set of route keys built from that area
+        self._area_routes = {}
+
+    def route_key(self, departure_airport : str, arrival_airport : str, flight_window : tuple | None = None) -> tuple:
+        return normalize_route(departure_airport, arrival_airport) + (NotamSort.ranking_version(), flight_window)
+
+    def get(self, departure_airport : str, arrival_airport : str, flight_window : tuple | None = None) -> RouteCacheEntry | None:
+        """Returns the fresh cached result for a route and flight window, or None."""
+
+        key = self.route_key(departure_airport, arrival_airport, flight_window)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.time():
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    @contextlib.contextmanager
+    def recording(self):
+        """Records the areas fetched on this thread while the block runs.
+        Yields the FetchRecord to pass to put."""
+        record = FetchRecord(self._clear_count)
+        previous_record = getattr(self._recording, "record", None)
+        self._recording.record = record
+        try:
+            yield record
+        finally:
+            self._recording.record = previous_record
+
+    def put(self, departure_airport : str, arrival_airport : str, notams : list, map_payload : dict,
+            point_list : list, request_radius : int | float, flight_window : tuple | None = None,
+            record : FetchRecord | None = None) -> RouteCacheEntry | None:
+        """Stores the result of a search built from the areas around point_list.
+
+        With the search's record, the result is only stored if the cache
+        hasn't been cleared since the search started and the areas it
+        fetched haven't been fetched since with different NOTAMs. Returns
+        None when it isn't stored.
+        """
+
+        expires_at = time.time() + self.max_age
+        for notam in notams:
+            try:
+                end_date = parse_notam_date(notam.effective_end)
+            except (TypeError, ValueError):
+                continue
+            if end_date is not None:
+                expires_at = min(expires_at, end_date.replace(tzinfo=timezone.utc).timestamp())
+
+        area_keys = frozenset(area_key(point, request_radius) for point in point_list)
+        entry = RouteCacheEntry(notams, map_payload, area_keys, expires_at)
+        key = self.route_key(departure_airport, arrival_airport, flight_window)
+
+        with self._lock:
+            if record is not None and self._is_outdated(record):
+                self.rejected_puts += 1
+                return None
+            self._remove(key)
+            self._entries[key] = entry
+            for area in area_keys:
+                self._area_routes.setdefault(area, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        return entry
+
+    def area_fetched(self, point, request_radius : int | float, notam_set) -> None:
+        """Records the NOTAMs just fetched for an area and invalidates the
+        routes built from it if they have changed."""
+
+        key = area_key(point, request_radius)
+        fingerprint = area_fingerprint(notam_set)
+        record = getattr(self._recording, "record", None)
+        if record is not None:
+            record.area_fingerprints[key] = fingerprint
+        with self._lock:
+            previous_fingerprint = self._area_fingerprints.get(key)
+            self._area_fingerprints[key] = fingerprint
+            if previous_fingerprint is not None and previous_fingerprint != fingerprint:
+                self._invalidate_area(key)
+            self._prune_area_fingerprints()
+
+    def invalidate_area(self, key : tuple) -> None:
+        """Drops every route built from the given area."""
+        with self._lock:
+            self._invalidate_area(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear_count += 1
+            self._entries.clear()
+            self._area_fingerprints.clear()
+            self._area_routes.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _is_outdated(self, record : FetchRecord) -> bool:
+        # Caller must hold self._lock.
+        if record.clear_count != self._clear_count:
+            return True
+        return any(self._area_fingerprints.get(key, fingerprint) != fingerprint
+                   for key, fingerprint in record.area_fingerprints.items())
+
+    def _invalidate_area(self, key : tuple) -> None:
+        # Caller must hold self._lock.
+        for route in list(self._area_routes.get(key, ())):
+            self._remove(route)
+            self.invalidations += 1
+
+    def _remove(self, route : tuple) -> None:
+        # Caller must hold self._lock.
+        entry = self._entries.pop(route, None)
+        if entry is None:
+            return
+        for area in entry.area_keys:
+            routes = self._area_routes.get(area)
+            if routes is not None:
+                routes.discard(route)
+                if not routes:
+                    del self._area_routes[area]
+
+    def _prune_area_fingerprints(self) -> None:
+        # Caller must hold self._lock.
+        # Forget areas that no cached route depends on once the table grows
+        # well past what the cached routes need.
+        if len(self._area_fingerprints) > self.max_entries * 64:
+            for area in [area for area in self._area_fingerprints if area not in self._area_routes]:
+                del self._area_fingerprints[area]
@@ -0,0 +1,475 @@
+import concurrent.futures
+import copy
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from io import StringIO
+import Metrics
+import NotamFetch
+import NotamSort
+import ResultPages
+from NotamFetch import flight_window_timestamps
+from QueryJobs import normalize_route
+from RouteCache import area_key
+
+# most watches held at once
+DEFAULT_MAX_WATCHES = 10000
+# seconds a watch is kept after it was last read
+DEFAULT_WATCH_TTL_SECONDS = 86400
+# seconds between two refreshes of every watched area
+DEFAULT_REFRESH_INTERVAL = 300
+# changes kept per watch, older ones can only be caught up with by reading the whole watch
+MAX_KEPT_CHANGES = 100
+# watched areas fetched together during a refresh
+REFRESH_CHUNK_AREAS = 50
+# most watched areas one refresh fetches from the FAA API without a snapshot
+# store, so watches leave most of the shared rate limit to searches
+DEFAULT_REFRESH_AREA_BUDGET = 25
+# notam fields sent for every added notam, the same as the results table
+CHANGE_FIELDS = ResultPages.DEFAULT_FIELDS
+# longest a request for changes can wait for one, in seconds
+MAX_CHANGES_WAIT_SECONDS = 30
+# seconds between keep-alive comments on an idle event stream
+EVENT_STREAM_HEARTBEAT_SECONDS = 15
+
+WATCH_CHANGES = Metrics.registry.counter("notam_watch_changes_total", "Changes pushed to route watches.")
+WATCH_REFRESH_FAILURES = Metrics.registry.counter("notam_watch_refresh_failures_total", "Watched areas whose refresh fetch failed.")
+WATCH_RERANKS = Metrics.registry.counter("notam_watch_reranks_total", "Route watches re-ranked because one of their areas changed or their scores aged.")
+
+class WatchLimitError(RuntimeError):
+    """Raised when a watch is added while the registry is full."""
+
+def notam_fingerprint(notam) -> tuple:
+    """Returns what identifies a notam's content, see RouteCache.area_fingerprint."""
+    return (notam.id, notam.text, notam.effective_start, notam.effective_end)
+
+def parse_seq(raw_seq : str | None) -> int:
+    """Returns the number of the last change a client saw, 0 if it hasn't
+    seen any. Raises ValueError if it isn't a whole number."""
+    if raw_seq is None or raw_seq == "":
+        return 0
+    try:
+        seq = int(raw_seq)
+    except ValueError as err:
+        raise ValueError(f"after must be an integer, got {raw_seq}") from err
+    if seq < 0:
+        raise ValueError(f"after can't be negative, got {seq}")
+    return seq
+
+def parse_wait(raw_wait : str | None) -> float:
+    """Returns the seconds to wait for a change. Raises ValueError if it
+    isn't a number between 0 and MAX_CHANGES_WAIT_SECONDS."""
+    if raw_wait is None or raw_wait == "":
+        return 0
+    try:
+        wait = float(raw_wait)
+    except ValueError as err:
+        raise ValueError(f"wait must be a number, got {raw_wait}") from err
+    if not 0 <= wait <= MAX_CHANGES_WAIT_SECONDS:
+        raise ValueError(f"wait must be between 0 and {MAX_CHANGES_WAIT_SECONDS}, got {raw_wait}")
+    return wait
+
+def fetch_area_notams(area_list : list, message_log : StringIO) -> list:
+    """Returns the set of notams in each (point, request_radius) area, from
+    the snapshot store in snapshot mode."""
+    if NotamFetch.notam_store is not None:
+        return NotamFetch.notam_store.notams_for_areas(area_list, message_log)
+    return NotamFetch.get_notams_for_areas(area_list, message_log)
+
+class RouteWatch:
+    """A route whose ranked notams are kept up to date.
+
+    The watch only holds each notam's score. The notams themselves are held
+    once per area by the WatchRegistry, however many watches share the area.
+    """
+
+    def __init__(self, departure_airport : str, arrival_airport : str, flight_window : tuple | None,
+                 point_list : list, request_radius : int | float):
+        self.id = uuid.uuid4().hex
+        self.departure_airport, self.arrival_airport = normalize_route(departure_airport, arrival_airport)
+        self.flight_window = flight_window
+        self.point_list = point_list
+        self.area_keys = frozenset(area_key(point, request_radius) for point in point_list)
+        # notam id -> score, for the notams currently on the route
+        self.scores = {}
+        # notam ids, in ranked order
+        self.ranking = []
+        self.ranking_version = None
+        # number of the latest change, 0 until something changes
+        self.seq = 0
+        self.changes = deque(maxlen=MAX_KEPT_CHANGES)
+        self.last_read = time.time()
+
+    def is_expired(self, ttl : float, now : float) -> bool:
+        """A watch expires when it hasn't been read for ttl seconds or its flight has landed."""
+        if now - self.last_read > ttl:
+            return True
+        return self.flight_window is not None and flight_window_timestamps(self.flight_window)[1] < now
+
+    def rerank(self, notams : list, gone_ids, ranking_version : str, edited_ids = ()) -> dict | None:
+        """Scores notams, the route's notams that are new, edited or need a
+        new score, and drops gone_ids, the ids of notams no longer on it.
+
+        Only the given notams are scored, the rest of the route keeps its
+        scores. Returns the change, or None when nothing a client shows has
+        changed.
+        """
+
+        # Scores are kept on copies, as the same notam is ranked for other routes
+        ranked = NotamFetch.rank_route_subset([copy.copy(notam) for notam in notams], self.point_list,
+                                              self.departure_airport, self.arrival_airport, self.flight_window)
+        # Notams that ended or left the flight window are cancelled too
+        filtered_ids = {notam.id for notam in notams} - {notam.id for notam in ranked}
+        cancelled = sorted(notam_id for notam_id in set(gone_ids) | filtered_ids if notam_id in self.scores)
+
+        previous_ranks = {notam_id: rank for rank, notam_id in enumerate(self.ranking)}
+        added_notams, reranked_ids = [], []
+        for notam in ranked:
+            previous_score = self.scores.get(notam.id)
+            # Edited notams are sent again in full, like new ones
+            if previous_score is None or notam.id in edited_ids:
+                added_notams.append(notam)
+            elif previous_score != notam.score:
+                reranked_ids.append(notam.id)
+            self.scores[notam.id] = notam.score
+        for notam_id in cancelled:
+            del self.scores[notam_id]
+        self.ranking = sorted(self.scores, key=lambda notam_id: (-self.scores[notam_id], notam_id))
+        self.ranking_version = ranking_version
+        if not (added_notams or cancelled or reranked_ids):
+            return None
+
+        ranks = {notam_id: rank for rank, notam_id in enumerate(self.ranking)}
+        return {
+            "added": [dict(item, rank=ranks[item["id"]]) for item in ResultPages.page_items(added_notams, CHANGE_FIELDS)],
+            "cancelled": cancelled,
+            "reranked": [{"id": notam_id, "rank": ranks[notam_id], "previous_rank": previous_ranks[notam_id], "score": self.scores[notam_id]}
+                         for notam_id in reranked_ids],
+            "total_count": len(self.ranking),
+        }
+
+    def record(self, change : dict) -> dict:
+        self.seq += 1
+        change = {"seq": self.seq, "time": f"{datetime.utcnow():%Y-%m-%dT%H:%M:%S}Z", **change}
+        self.changes.append(change)
+        WATCH_CHANGES.inc()
+        return change
+
+    def changes_after(self, seq : int) -> list | None:
+        """Returns the changes made after seq, or None if some of them are no
+        longer kept."""
+        if seq >= self.seq:
+            return []
+        if not self.changes or self.changes[0]["seq"] > seq + 1:
+            return None
+        return [change for change in self.changes if change["seq"] > seq]
+
+    def to_dict(self) -> dict:
+        return {
+            "watch_id": self.id,
+            "departure": self.departure_airport,
+            "arrival": self.arrival_airport,
+            "flight_window": None if self.flight_window is None else [f"{moment:%Y-%m-%dT%H:%M}Z" for moment in self.flight_window],
+            "seq": self.seq,
+            "total_count": len(self.ranking),
+        }
+
+class WatchRegistry:
+    """Holds the route watches and re-ranks them as their areas change.
+
+    The registry keeps the notams of every watched area. When a fetch of an
+    area returns different notams (see area_fetched, which can be added to
+    NotamFetch.area_listeners), only the watches built from that area are
+    re-ranked, and only the notams that were added or edited are scored.
+    Each change is numbered, so a client can ask for the changes after the
+    last one it saw.
+    """
+
+    def __init__(self, max_watches : int = DEFAULT_MAX_WATCHES, ttl : float = DEFAULT_WATCH_TTL_SECONDS,
+                 refresh_area_budget : int = DEFAULT_REFRESH_AREA_BUDGET):
+        self.max_watches = max_watches
+        self.ttl = ttl
+        self.refresh_area_budget = refresh_area_budget
+
+        # Notified whenever a watch changes or is removed
+        self._condition = threading.Condition()
+        # watch id -> RouteWatch
+        self._watches = {}
+        # area key -> ids of the watches built from that area
+        self._area_watches = {}
+        # area key -> {notam id: notam} of the area's last fetch
+        self._area_notams = {}
+        # area key -> (point, request_radius) to fetch the area again
+        self._areas = {}
+        # area key -> time.time() the area was last fetched, by a refresh or a search
+        self._area_fetched_at = {}
+        # Set on the thread running refresh
+        self._refreshing = threading.local()
+
+    def add(self, departure_airport : str, arrival_airport : str, message_log : StringIO,
+            flight_window : tuple | None = None) -> RouteWatch:
+        """Watches a route. Only the route's areas that no other watch holds
+        are fetched."""
+
+        if len(self) >= self.max_watches:
+            raise WatchLimitError(f"Error: Already watching {self.max_watches} routes, try again later")
+
+        point_list, request_radius = NotamFetch.plan_route(departure_airport, arrival_airport, message_log)
+        area_list = [(point, request_radius) for point in point_list]
+        watch = RouteWatch(departure_airport, arrival_airport, flight_window, point_list, request_radius)
+        # area key -> notams fetched by this call
+        fetched_notams = {}
+        while True:
+            with self._condition:
+                # Areas can be dropped by remove while this call is fetching, so
+                # check again which ones are missing before adding the watch
+                missing_areas = [area for area in area_list
+                                 if area_key(*area) not in self._area_notams and area_key(*area) not in fetched_notams]
+                if not missing_areas:
+                    if len(self._watches) >= self.max_watches:
+                        raise WatchLimitError(f"Error: Already watching {self.max_watches} routes, try again later")
+                    for area in area_list:
+                        key = area_key(*area)
+                        self._areas[key] = area
+                        self._area_watches.setdefault(key, set()).add(watch.id)
+                        if key not in self._area_notams:
+                            self._area_notams[key] = {notam.id: notam for notam in fetched_notams[key]}
+                            self._area_fetched_at[key] = time.time()
+                    self._watches[watch.id] = watch
+                    # The starting ranking isn't a change
+                    watch.rerank(self._route_notams(watch), (), NotamSort.ranking_version())
+                    return watch
+            fetched_notams.update(zip([area_key(*area) for area in missing_areas], fetch_area_notams(missing_areas, message_log)))
+
+    def get(self, watch_id : str) -> RouteWatch | None:
+        with self._condition:
+            watch = self._watches.get(watch_id)
+            if watch is not None:
+                watch.last_read = time.time()
+            return watch
+
+    def ranked_items(self, watch_id : str) -> list | None:
+        """Returns a watch's notams in ranked order, with their rank and score."""
+        with self._condition:
+            watch = self._watches.get(watch_id)
+            if watch is None:
+                return None
+            watch.last_read = time.time()
+            notams = {}
+            for key in watch.area_keys:
+                notams.update(self._area_notams[key])
+            return [dict(item, rank=rank, score=watch.scores[item["id"]])
+                    for rank, item in enumerate(ResultPages.page_items([notams[notam_id] for notam_id in watch.ranking], CHANGE_FIELDS))]
+
+    def remove(self, watch_id : str) -> bool:
+        with self._condition:
+            watch = self._watches.pop(watch_id, None)
+            if watch is None:
+                return False
+            for key in watch.area_keys:
+                watch_ids = self._area_watches[key]
+                watch_ids.discard(watch_id)
+                if not watch_ids:
+                    # Nothing watches the area any more
+                    del self._area_watches[key], self._area_notams[key], self._areas[key], self._area_fetched_at[key]
+            self._condition.notify_all()
+            return True
+
+    def changes_after(self, watch_id : str, seq : int, timeout : float = 0) -> tuple:
+        """Returns the watch and its changes after seq, waiting up to timeout
+        seconds for one if there are none yet.
+
+        Returns (None, None) when there's no such watch, and the watch with
+        None when the changes after seq are no longer kept.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: watch_id not in self._watches or self._watches[watch_id].seq > seq, timeout)
+            watch = self._watches.get(watch_id)
+            if watch is None:
+                return None, None
+            watch.last_read = time.time()
+            return watch, watch.changes_after(seq)
+
+    def area_fetched(self, point, request_radius : int | float, notam_set) -> None:
+        """Records the notams just fetched for an area and re-ranks the
+        watches built from it if they have changed."""
+
+        # refresh reports the areas it fetches itself, a chunk at a time
+        if not getattr(self._refreshing, "active", False):
+            self.areas_fetched([(point, request_radius, notam_set)])
+
+    def areas_fetched(self, fetched_areas : list) -> None:
+        """Records the notams just fetched for several (point, request_radius,
+        notam_set) areas. Each watch built from the areas that changed is
+        re-ranked once, as one change."""
+
+        with self._condition:
+            # watch id -> notams added to, or edited in, the watch's changed areas
+            watch_notams = {}
+            watch_edited_ids = {}
+            watch_removed_ids = {}
+            for point, request_radius, notam_set in fetched_areas:
+                key = area_key(point, request_radius)
+                watch_ids = self._area_watches.get(key)
+                if not watch_ids:
+                    continue
+                self._area_fetched_at[key] = time.time()
+                previous_notams = self._area_notams[key]
+                area_notams = {notam.id: notam for notam in notam_set}
+                changed_notams = [notam for notam_id, notam in area_notams.items()
+                                  if notam_id not in previous_notams or notam_fingerprint(previous_notams[notam_id]) != notam_fingerprint(notam)]
+                edited_ids = {notam.id for notam in changed_notams if notam.id in previous_notams}
+                removed_ids = previous_notams.keys() - area_notams.keys()
+                if not changed_notams and not removed_ids:
+                    continue
+                self._area_notams[key] = area_notams
+                for watch_id in watch_ids:
+                    watch_notams.setdefault(watch_id, {}).update((notam.id, notam) for notam in changed_notams)
+                    watch_edited_ids.setdefault(watch_id, set()).update(edited_ids)
+                    watch_removed_ids.setdefault(watch_id, set()).update(removed_ids)
+
+            ranking_version = NotamSort.ranking_version()
+            for watch_id, changed_notams in watch_notams.items():
+                watch = self._watches[watch_id]
+                if watch.ranking_version != ranking_version:
+                    self._rerank_whole_route(watch, ranking_version, watch_edited_ids[watch_id])
+                    continue
+                route_notam_ids = {notam.id for notam in self._route_notams(watch)}
+                # A notam still in another area of the route isn't cancelled
+                gone_ids = watch_removed_ids[watch_id] - route_notam_ids
+                edited_ids = watch_edited_ids[watch_id]
+                # Notams the route already has from another area are only scored again when edited
+                notams = [notam for notam in changed_notams.values() if notam.id not in watch.scores or notam.id in edited_ids]
+                WATCH_RERANKS.inc()
+                self._record(watch, watch.rerank(notams, gone_ids, ranking_version, edited_ids))
+
+    def refresh(self, message_log : StringIO) -> int:
+        """Drops expired watches, then fetches the watched areas again.
+        Watches still ranked with yesterday's scores are re-ranked in full.
+
+        With a snapshot store every area is answered from it. Without one,
+        only the refresh_area_budget areas fetched longest ago are fetched
+        from the FAA API, as they share its rate limit with searches. Each
+        chunk of areas is applied as soon as it is in, and an area whose
+        fetch fails is left as it was until the next refresh.
+
+        Returns the number of watches still held.
+        """
+
+        now = time.time()
+        with self._condition:
+            expired_ids = [watch_id for watch_id, watch in self._watches.items() if watch.is_expired(self.ttl, now)]
+        for watch_id in expired_ids:
+            self.remove(watch_id)
+
+        with self._condition:
+            area_keys = list(self._areas)
+            if NotamFetch.notam_store is None and len(area_keys) > self.refresh_area_budget:
+                area_keys = sorted(area_keys, key=self._area_fetched_at.__getitem__)[:self.refresh_area_budget]
+                print(f"Refreshing the {len(area_keys)} of {len(self._areas)} watched areas fetched longest ago.", file=message_log)
+            area_list = [self._areas[key] for key in area_keys]
+        for chunk_start in range(0, len(area_list), REFRESH_CHUNK_AREAS):
+            chunk = area_list[chunk_start:chunk_start + REFRESH_CHUNK_AREAS]
+            with concurrent.futures.ThreadPoolExecutor(max_workers=NotamFetch.MAX_NUMBER_OF_THREADS, thread_name_prefix="notam-watch-fetch") as executor:
+                area_fetches = [executor.submit(self._fetch_refresh_area, area, message_log) for area in chunk]
+            fetched_areas = []
+            for (point, request_radius), area_fetch in zip(chunk, area_fetches):
+                try:
+                    fetched_areas.append((point, request_radius, area_fetch.result()))
+                except Exception as err:
+                    WATCH_REFRESH_FAILURES.inc()
+                    print(f"Refreshing the watched area at {point} failed: {err}", file=message_log)
+            self.areas_fetched(fetched_areas)
+
+        ranking_version = NotamSort.ranking_version()
+        with self._condition:
+            for watch in self._watches.values():
+                if watch.ranking_version != ranking_version:
+                    self._rerank_whole_route(watch, ranking_version)
+            return len(self._watches)
+
+    def _fetch_refresh_area(self, area : tuple, message_log : StringIO) -> set:
+        # refresh reports the areas it fetches itself, a chunk at a time
+        self._refreshing.active = True
+        if NotamFetch.notam_store is not None:
+            return NotamFetch.notam_store.notams_for_areas([area], message_log)[0]
+        return NotamFetch.timed_get_notams_at(area[0], area[1], message_log)
+
+    def __len__(self):
+        with self._condition:
+            return len(self._watches)
+
+    def _route_notams(self, watch : RouteWatch) -> list:
+        # Caller must hold self._condition.
+        notams = {}
+        for key in watch.area_keys:
+            notams.update(self._area_notams[key])
+        return list(notams.values())
+
+    def _rerank_whole_route(self, watch : RouteWatch, ranking_version : str, edited_ids = ()) -> None:
+        # Caller must hold self._condition.
+        notams = self._route_notams(watch)
+        gone_ids = watch.scores.keys() - {notam.id for notam in notams}
+        WATCH_RERANKS.inc()
+        self._record(watch, watch.rerank(notams, gone_ids, ranking_version, edited_ids))
+
+    def _record(self, watch : RouteWatch, change : dict | None) -> None:
+        # Caller must hold self._condition.
+        if change is not None:
+            watch.record(change)
+            self._condition.notify_all()
+
+    def iter_events(self, watch_id : str, seq : int):
+        """Yields a watch's changes after seq as server-sent events, as they
+        happen, until the watch is removed."""
+        while True:
+            watch, changes = self.changes_after(watch_id, seq, EVENT_STREAM_HEARTBEAT_SECONDS)
+            if watch is None:
+                yield "event: removed\ndata: {}\n\n"
+                return
+            if changes is None:
+                # The client missed changes no longer kept, it has to read the whole watch again
+                yield f"event: reset\ndata: {json.dumps(watch.to_dict())}\n\n"
+                return
+            if not changes:
+                # Keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+            for change in changes:
+                yield f"id: {change['seq']}\nevent: change\ndata: {json.dumps(change)}\n\n"
+                seq = change["seq"]
+
+class WatchRefresher:
+    """Refreshes a WatchRegistry on a background thread every interval
+    seconds, or sooner when woken, e.g. by a snapshot sweep."""
+
+    def __init__(self, registry : WatchRegistry, interval : float = DEFAULT_REFRESH_INTERVAL):
+        self.registry = registry
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="notam-watch", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.registry.refresh(StringIO())
+            except Exception as err:
+                print(f"NOTAM route watch refresh failed: {err}", flush=True)
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def start(self) -> "WatchRefresher":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
@@ -0,0 +1,398 @@
+import bisect
+import functools
+import glob
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from io import StringIO
+import Metrics
+import NotamFetch
+import NotamStore
+from NavigationTools import PointObject, get_distance_nm
+from Notam import Notam, parse_notam_interval
+from SpatialIndex import circle_bounds
+
+# Shared snapshot mode: one process sweeps the NOTAM snapshot and publishes
+# it to a file that every other worker process memory maps. Readers look up
+# NOTAMs straight from the mapped arrays, so the operating system keeps a
+# single copy in its page cache however many workers there are.
+
+# First bytes of a snapshot file, followed by the length of its JSON header
+SNAPSHOT_MAGIC = b"NOTAMSHM"
+# Layout of the header length that follows SNAPSHOT_MAGIC
+HEADER_LENGTH_FORMAT = "<I"
+# Size in degrees of the grid cells NOTAMs are sorted by
+CELL_DEGREES = 0.5
+# Grid cell (row, column) -> sort key is row * CELL_KEY_ROW_WIDTH + column + CELL_KEY_COLUMN_OFFSET,
+# so the cells of one row sit next to each other in key order
+CELL_KEY_ROW_WIDTH = 1 << 20
+CELL_KEY_COLUMN_OFFSET = 1 << 19
+# Snapshot files kept besides the current one, for readers still using them
+KEEP_OLD_SNAPSHOTS = 2
+# NOTAMs decoded from a snapshot that each reader keeps ready, as Notam.to_row tuples
+DECODED_NOTAM_CACHE_SIZE = 20000
+# File naming the current snapshot, replaced atomically on every publish
+POINTER_FILE_NAME = "current.json"
+# File locked by the process that sweeps and publishes
+WRITER_LOCK_FILE_NAME = "writer.lock"
+
+# Open file holding the writer lock, kept for the life of the process
+_writer_lock_file = None
+
+def cell_key(latitude : float, longitude : float, cell_degrees : float = CELL_DEGREES) -> int:
+    return math.floor(latitude / cell_degrees) * CELL_KEY_ROW_WIDTH + math.floor(longitude / cell_degrees) + CELL_KEY_COLUMN_OFFSET
+
+def claim_writer(directory : str) -> bool:
+    """Returns whether this process is the one that sweeps and publishes
+    snapshots to directory. The first process to ask takes an exclusive
+    lock that lasts until it exits, so a restarted worker takes over."""
+    global _writer_lock_file
+    if _writer_lock_file is not None:
+        return True
+    try:
+        import fcntl
+    except ImportError as err:
+        raise RuntimeError("Error: sharing the NOTAM snapshot between processes needs POSIX file locks") from err
+
+    os.makedirs(directory, exist_ok=True)
+    lock_file = open(os.path.join(directory, WRITER_LOCK_FILE_NAME), "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return False
+    _writer_lock_file = lock_file
+    return True
+
+def snapshot_file_name(version : int) -> str:
+    return f"snapshot-{version:012d}.bin"
+
+def read_pointer(directory : str) -> dict | None:
+    """Returns the contents of the pointer file, None if nothing was published yet."""
+    try:
+        with open(os.path.join(directory, POINTER_FILE_NAME)) as pointer_file:
+            return json.load(pointer_file)
+    except FileNotFoundError:
+        return None
+
+def write_snapshot_file(path : str, store : NotamStore.NotamStore, version : int, content_version : int) -> None:
+    """Writes the NOTAMs and regions of a store to a snapshot file.
+
+    After the header come 8 byte aligned sections: the sorted cell keys and
+    where each cell starts, the latitude, longitude and effective times of
+    every NOTAM, the offsets of their JSON records, the records, and the
+    NOTAMs without coordinates listed by region. NOTAMs with coordinates
+    come first, sorted by cell. Arrays are in the machine's byte order, as
+    the file is only shared between processes on one host.
+    """
+    with store._lock:
+        notams = list(store.notams.values())
+        regions = [(region.point.latitude, region.point.longitude, region.radius, region.fetched_at, region.error, region.unlocated_ids)
+                   for region in store.regions]
+        sweep_times = (store.last_sweep_started, store.last_sweep_finished)
+
+    located = sorted((cell_key(notam.latitude, notam.longitude), notam.id, notam) for notam in notams
+                     if notam.latitude is not None and notam.longitude is not None)
+    ordered_notams = [notam for key, notam_id, notam in located] + [notam for notam in notams if notam.latitude is None or notam.longitude is None]
+    notam_indexes = {notam.id: index for index, notam in enumerate(ordered_notams)}
+
+    cell_keys, cell_starts = array("q"), array("Q")
+    for index, (key, notam_id, notam) in enumerate(located):
+        if not cell_keys or cell_keys[-1] != key:
+            cell_keys.append(key)
+            cell_starts.append(index)
+    cell_starts.append(len(located))
+
+    latitudes = array("d", (notam.latitude for key, notam_id, notam in located))
+    longitudes = array("d", (notam.longitude for key, notam_id, notam in located))
+    starts, ends = array("d"), array("d")
+    record_offsets, records = array("Q", [0]), bytearray()
+    for notam in ordered_notams:
+        start, end = parse_notam_interval(notam.effective_start, notam.effective_end)
+        starts.append(start)
+        ends.append(end)
+        notam_dict = notam.to_dict()
+        # Scores belong to the search that ranked a NOTAM, not to the store
+        notam_dict["score"] = None
+        records += json.dumps(notam_dict, separators=(",", ":")).encode()
+        record_offsets.append(len(records))
+
+    unlocated, region_entries = array("Q"), []
+    for latitude, longitude, radius, fetched_at, error, unlocated_ids in regions:
+        region_unlocated = sorted(notam_indexes[notam_id] for notam_id in unlocated_ids if notam_id in notam_indexes)
+        region_entries.append([latitude, longitude, radius, fetched_at, error, len(unlocated), len(region_unlocated)])
+        unlocated.extend(region_unlocated)
+
+    sections = [("cell_keys", cell_keys), ("cell_starts", cell_starts), ("latitudes", latitudes), ("longitudes", longitudes),
+                ("starts", starts), ("ends", ends), ("record_offsets", record_offsets), ("unlocated", unlocated), ("records", records)]
+    header = {
+        "version": version,
+        "content_version": content_version,
+        "published": time.time(),
+        "last_sweep_started": sweep_times[0],
+        "last_sweep_finished": sweep_times[1],
+        "bounds": list(store.bounds),
+        "cell_degrees": CELL_DEGREES,
+        "notam_count": len(ordered_notams),
+        "located_count": len(located),
+        "regions": region_entries,
+        "sections": {},
+    }
+    # Section offsets are part of the header, so place the sections after
+    # it and grow the header's space until it fits
+    data_start = 0
+    while True:
+        offset = data_start
+        for name, section in sections:
+            section_size = len(section) * (section.itemsize if isinstance(section, array) else 1)
+            header["sections"][name] = [offset, len(section)]
+            offset += section_size + (-section_size % 8)
+        header_bytes = json.dumps(header, separators=(",", ":")).encode()
+        prefix_size = len(SNAPSHOT_MAGIC) + struct.calcsize(HEADER_LENGTH_FORMAT) + len(header_bytes)
+        if prefix_size <= data_start:
+            break
+        data_start = prefix_size + (-prefix_size % 8)
+
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as snapshot_file:
+        snapshot_file.write(SNAPSHOT_MAGIC + struct.pack(HEADER_LENGTH_FORMAT, len(header_bytes)) + header_bytes)
+        for name, section in sections:
+            snapshot_file.seek(header["sections"][name][0])
+            snapshot_file.write(section.tobytes() if isinstance(section, array) else bytes(section))
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    os.replace(temporary_path, path)
+
+class SnapshotPublisher:
+    """Publishes a NotamStore to a directory after every sweep.
+
+    Each publish writes a new snapshot file, then atomically replaces the
+    pointer file naming it, so readers only ever open complete snapshots.
+    content_version only goes up when a sweep changed the NOTAMs, which
+    tells readers when to drop their cached routes.
+    """
+
+    def __init__(self, store : NotamStore.NotamStore, directory : str):
+        self.store = store
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        pointer = read_pointer(directory) or {}
+        self.version = pointer.get("version", 0)
+        self.content_version = pointer.get("content_version", 0)
+        self._changed = True
+        store.refresh_listeners.append(self._mark_changed)
+
+    def _mark_changed(self) -> None:
+        self._changed = True
+
+    def publish(self) -> int:
+        """Writes the store as the next snapshot and returns its version."""
+        with Metrics.span("snapshot_publish"):
+            version = self.version + 1
+            content_version = self.content_version + 1 if self._changed else self.content_version
+            self._changed = False
+            file_name = snapshot_file_name(version)
+            write_snapshot_file(os.path.join(self.directory, file_name), self.store, version, content_version)
+
+            pointer_path = os.path.join(self.directory, POINTER_FILE_NAME)
+            temporary_pointer = f"{pointer_path}.{os.getpid()}.tmp"
+            with open(temporary_pointer, "w") as pointer_file:
+                json.dump({"version": version, "content_version": content_version, "file": file_name}, pointer_file)
+            os.replace(temporary_pointer, pointer_path)
+            self.version, self.content_version = version, content_version
+
+            # Readers that mapped an old snapshot keep it until they let go
+            for old_file in sorted(glob.glob(os.path.join(self.directory, "snapshot-*.bin")))[:-(KEEP_OLD_SNAPSHOTS + 1)]:
+                try:
+                    os.remove(old_file)
+                except OSError:
+                    pass
+        return version
+
+class SharedSnapshot:
+    """One published snapshot, memory mapped read only. Never changes, so a
+    search that holds on to it sees one consistent version throughout."""
+
+    def __init__(self, path : str):
+        with open(path, "rb") as snapshot_file:
+            self._mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError(f"Error: {path} is not a NOTAM snapshot")
+        header_start = len(SNAPSHOT_MAGIC) + struct.calcsize(HEADER_LENGTH_FORMAT)
+        header_length, = struct.unpack_from(HEADER_LENGTH_FORMAT, self._mmap, len(SNAPSHOT_MAGIC))
+        self.header = json.loads(self._mmap[header_start:header_start + header_length])
+        self.version = self.header["version"]
+        self.content_version = self.header["content_version"]
+        self.bounds = tuple(self.header["bounds"])
+        self.regions = self.header["regions"]
+
+        view = memoryview(self._mmap)
+        def section(name, type_code):
+            offset, length = self.header["sections"][name]
+            return view[offset:offset + length * array(type_code).itemsize].cast(type_code)
+        self.cell_keys = section("cell_keys", "q")
+        self.cell_starts = section("cell_starts", "Q")
+        self.latitudes = section("latitudes", "d")
+        self.longitudes = section("longitudes", "d")
+        self.starts = section("starts", "d")
+        self.ends = section("ends", "d")
+        self.record_offsets = section("record_offsets", "Q")
+        self.unlocated = section("unlocated", "Q")
+        records_offset, records_length = self.header["sections"]["records"]
+        self.records = view[records_offset:records_offset + records_length]
+        self._row_at = functools.lru_cache(maxsize=DECODED_NOTAM_CACHE_SIZE)(self._decode_row)
+
+    def __len__(self):
+        return self.header["notam_count"]
+
+    def _decode_row(self, index : int) -> tuple:
+        return Notam.from_dict(json.loads(self.records[self.record_offsets[index]:self.record_offsets[index + 1]].tobytes())).to_row()
+
+    def notam_at(self, index : int) -> Notam:
+        """Returns a new Notam for the NOTAM at index. The decoding is cached,
+        the Notam isn't, as searches write their scores onto the NOTAMs they get."""
+        return Notam.from_row(self._row_at(index))
+
+    def regions_near(self, point : PointObject, radius : float) -> list:
+        return [region for region in self.regions
+                if get_distance_nm(point.latitude, point.longitude, region[0], region[1]) <= radius + region[2]]
+
+    def is_fresh(self, point : PointObject, radius : float, max_age : float, now : float) -> bool:
+        if not NotamStore.circle_in_bounds(point, radius, self.bounds):
+            return False
+        return all(region[3] is not None and now - region[3] <= max_age for region in self.regions_near(point, radius))
+
+    def _candidate_ranges(self, point : PointObject, radius : float) -> list:
+        """Returns (first, end) ranges of NOTAM indexes in the grid cells
+        around a circle."""
+        bounds = circle_bounds(point.latitude, point.longitude, radius)
+        if bounds is None:
+            return [(0, self.header["located_count"])]
+        south, west, north, east = bounds
+        cell_degrees = self.header["cell_degrees"]
+        ranges = []
+        for row in range(math.floor(south / cell_degrees), math.floor(north / cell_degrees) + 1):
+            row_key = row * CELL_KEY_ROW_WIDTH + CELL_KEY_COLUMN_OFFSET
+            first_cell = bisect.bisect_left(self.cell_keys, row_key + math.floor(west / cell_degrees))
+            end_cell = bisect.bisect_right(self.cell_keys, row_key + math.floor(east / cell_degrees))
+            if first_cell < end_cell:
+                ranges.append((self.cell_starts[first_cell], self.cell_starts[end_cell]))
+        return ranges
+
+    def notams_in_circle(self, point : PointObject, radius : float, window : tuple | None = None) -> set:
+        """Returns the NOTAMs located within radius of point, plus those
+        without coordinates from the regions overlapping it. With a window
+        of (start, end) timestamps, only those in effect during it."""
+        latitudes, longitudes, starts, ends = self.latitudes, self.longitudes, self.starts, self.ends
+        found_indexes = []
+        for first, end in self._candidate_ranges(point, radius):
+            for index in range(first, end):
+                if get_distance_nm(point.latitude, point.longitude, latitudes[index], longitudes[index]) <= radius:
+                    found_indexes.append(index)
+        for region in self.regions_near(point, radius):
+            found_indexes.extend(self.unlocated[region[5]:region[5] + region[6]])
+        if window is not None:
+            found_indexes = [index for index in found_indexes if starts[index] <= window[1] and ends[index] >= window[0]]
+        return {self.notam_at(index) for index in found_indexes}
+
+    def oldest_age(self, now : float) -> float | None:
+        ages = [None if region[3] is None else now - region[3] for region in self.regions]
+        return None if not ages or None in ages else max(ages)
+
+class SharedNotamStore:
+    """Answers route searches from the snapshots another process publishes
+    to directory, with the same interface as NotamStore.NotamStore.
+
+    The pointer file is checked on every search and a newer snapshot is
+    mapped as soon as it appears. refresh_listeners are called when the
+    NOTAMs of the new snapshot differ from the previous one.
+    """
+
+    def __init__(self, directory : str, max_age : float = NotamStore.DEFAULT_MAX_AGE_SECONDS):
+        self.directory = directory
+        self.max_age = max_age
+        self.refresh_listeners = []
+        self._snapshot = None
+        self._pointer_stat = None
+        self._lock = threading.Lock()
+
+    def current(self) -> SharedSnapshot | None:
+        """Returns the newest published snapshot, None if there is none yet."""
+        try:
+            pointer_stat = os.stat(os.path.join(self.directory, POINTER_FILE_NAME))
+        except FileNotFoundError:
+            return None
+        pointer_key = (pointer_stat.st_ino, pointer_stat.st_mtime_ns, pointer_stat.st_size)
+        if pointer_key == self._pointer_stat:
+            return self._snapshot
+
+        content_changed = False
+        with self._lock:
+            if pointer_key != self._pointer_stat:
+                pointer = read_pointer(self.directory)
+                try:
+                    snapshot = SharedSnapshot(os.path.join(self.directory, pointer["file"]))
+                except (FileNotFoundError, TypeError):
+                    # Replaced again while being read, the next search maps the newer one
+                    return self._snapshot
+                content_changed = self._snapshot is not None and snapshot.content_version != self._snapshot.content_version
+                self._snapshot, self._pointer_stat = snapshot, pointer_key
+            snapshot = self._snapshot
+        if content_changed:
+            for listener in self.refresh_listeners:
+                listener()
+        return snapshot
+
+    def __len__(self):
+        snapshot = self.current()
+        return 0 if snapshot is None else len(snapshot)
+
+    def notams_for_areas(self, area_list : list, message_log : StringIO, flight_window : tuple | None = None,
+                         on_area_error = None) -> list:
+        """Like NotamStore.NotamStore.notams_for_areas, answered from the
+        newest snapshot. All areas of one call use the same snapshot."""
+        now = time.time()
+        snapshot = self.current()
+        stale_indexes = [index for index, area in enumerate(area_list)
+                         if snapshot is None or not snapshot.is_fresh(area[0], area[1], self.max_age, now)]
+        live_notams = NotamStore.fetch_stale_areas(area_list, stale_indexes, message_log, flight_window, on_area_error)
+
+        area_notam_sets = []
+        with Metrics.span("snapshot_query"):
+            window = NotamFetch.flight_window_timestamps(flight_window) if flight_window is not None else None
+            for index, area in enumerate(area_list):
+                if index in live_notams:
+                    area_notam_sets.append(live_notams[index])
+                else:
+                    area_notam_sets.append(snapshot.notams_in_circle(area[0], area[1], window))
+        if len(stale_indexes) < len(area_list):
+            print(f"Answered {len(area_list) - len(stale_indexes)} areas from shared NOTAM snapshot {snapshot.version}, up to {snapshot.oldest_age(now) / 60:.0f} minutes old.", file=message_log)
+        return area_notam_sets
+
+    def oldest_age(self, now : float | None = None) -> float | None:
+        snapshot = self.current()
+        return None if snapshot is None else snapshot.oldest_age(time.time() if now is None else now)
+
+    def status(self) -> dict:
+        now = time.time()
+        snapshot = self.current()
+        regions = [] if snapshot is None else snapshot.regions
+        fresh_regions = sum(1 for region in regions if region[3] is not None and now - region[3] <= self.max_age)
+        return {
+            "shared": True,
+            "version": None if snapshot is None else snapshot.version,
+            "regions": len(regions),
+            "fresh_regions": fresh_regions,
+            "stale_regions": len(regions) - fresh_regions,
+            "failed_regions": sum(1 for region in regions if region[4] is not None),
+            "notam_count": 0 if snapshot is None else len(snapshot),
+            "oldest_age_seconds": None if snapshot is None else snapshot.oldest_age(now),
+            "last_sweep_started": None if snapshot is None else snapshot.header["last_sweep_started"],
+            "last_sweep_finished": None if snapshot is None else snapshot.header["last_sweep_finished"],
+            "max_age_seconds": self.max_age,
+        }
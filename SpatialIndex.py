@@ -0,0 +1,184 @@
+import math
+from NavigationTools import EARTH_RADIUS, get_distance_nm, get_distance_to_segment_nm
+
+# degrees of latitude and longitude covered by one grid cell
+DEFAULT_CELL_DEGREES = 0.5
+# circles wider than this (in nautical miles) are kept in a list every query
+# scans, so a few FIR-wide NOTAMs don't fill thousands of cells
+LARGE_RADIUS_NM = 250
+# polyline segments are split into pieces of at most this many nautical miles
+# when finding the cells they cross, so the great circle's bulge is covered
+SEGMENT_STEP_NM = 50
+# nautical miles added to the bounds of each polyline piece for the bulge
+# that is left between its end points
+SEGMENT_SLACK_NM = 1
+# nautical miles per degree of latitude, rounded down so margins in degrees
+# are never too small
+NM_PER_DEGREE = 60
+
+def intermediate_point(start_latitude : float, start_longitude : float, end_latitude : float, end_longitude : float,
+                       fraction : float) -> tuple:
+    """Returns the (latitude, longitude) at fraction (0 to 1) of the way
+    along the great circle from start to end."""
+    angle = get_distance_nm(start_latitude, start_longitude, end_latitude, end_longitude) / EARTH_RADIUS
+    if angle == 0:
+        return (start_latitude, start_longitude)
+    start_weight = math.sin((1 - fraction) * angle) / math.sin(angle)
+    end_weight = math.sin(fraction * angle) / math.sin(angle)
+    start_lat, start_lon = math.radians(start_latitude), math.radians(start_longitude)
+    end_lat, end_lon = math.radians(end_latitude), math.radians(end_longitude)
+    x = start_weight * math.cos(start_lat) * math.cos(start_lon) + end_weight * math.cos(end_lat) * math.cos(end_lon)
+    y = start_weight * math.cos(start_lat) * math.sin(start_lon) + end_weight * math.cos(end_lat) * math.sin(end_lon)
+    z = start_weight * math.sin(start_lat) + end_weight * math.sin(end_lat)
+    return (math.degrees(math.atan2(z, math.hypot(x, y))), math.degrees(math.atan2(y, x)))
+
+def circle_bounds(latitude : float, longitude : float, radius_nm : float) -> tuple | None:
+    """Returns the (south, west, north, east) bounds of a circle, or None if
+    they would reach a pole or cross the antimeridian."""
+    latitude_margin = radius_nm / NM_PER_DEGREE
+    south, north = latitude - latitude_margin, latitude + latitude_margin
+    if south <= -89 or north >= 89:
+        return None
+    longitude_margin = latitude_margin / math.cos(math.radians(max(abs(south), abs(north))))
+    west, east = longitude - longitude_margin, longitude + longitude_margin
+    if west < -180 or east > 180:
+        return None
+    return (south, west, north, east)
+
+class SpatialIndex:
+    """Index of circles (a center and a radius in nautical miles) on a grid
+    of lat/lon cells, for finding the NOTAMs that affect a point, an area or
+    a route without looking at every NOTAM.
+
+    Every circle is listed in each cell its bounding box touches. A query
+    only looks at the circles listed in the cells its own bounding box
+    touches, then checks the exact great circle distance. Circles wider than
+    LARGE_RADIUS_NM, or whose bounds reach a pole or the antimeridian, are
+    checked by every query instead.
+
+    The index is not thread safe; callers sharing one hold their own lock.
+
+    Parameters
+    ----------
+    cell_degrees : float
+        Size of a grid cell. Smaller cells mean fewer candidates per query
+        but more cells per circle.
+    """
+
+    def __init__(self, cell_degrees : float = DEFAULT_CELL_DEGREES):
+        if cell_degrees <= 0:
+            raise ValueError(f"Error: cell_degrees must be positive, got {cell_degrees}")
+        self.cell_degrees = cell_degrees
+        # key -> (latitude, longitude, radius_nm, item, cells)
+        self._entries = {}
+        # (row, column) -> set of keys
+        self._cells = {}
+        # keys of circles every query checks
+        self._large_keys = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _cell_range(self, bounds : tuple) -> list:
+        south, west, north, east = bounds
+        first_row, last_row = math.floor(south / self.cell_degrees), math.floor(north / self.cell_degrees)
+        first_column, last_column = math.floor(west / self.cell_degrees), math.floor(east / self.cell_degrees)
+        return [(row, column) for row in range(first_row, last_row + 1) for column in range(first_column, last_column + 1)]
+
+    def insert(self, key, latitude : float, longitude : float, radius_nm : float = 0, item=None) -> None:
+        """Adds a circle, replacing any circle already stored under key.
+        Queries return item, or key if no item is given."""
+        if key in self._entries:
+            self.remove(key)
+        bounds = circle_bounds(latitude, longitude, radius_nm) if radius_nm <= LARGE_RADIUS_NM else None
+        if bounds is None:
+            cells = ()
+            self._large_keys.add(key)
+        else:
+            cells = self._cell_range(bounds)
+            for cell in cells:
+                self._cells.setdefault(cell, set()).add(key)
+        self._entries[key] = (latitude, longitude, radius_nm, key if item is None else item, cells)
+
+    def remove(self, key) -> bool:
+        """Removes the circle stored under key. Returns whether there was one."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._large_keys.discard(key)
+        for cell in entry[4]:
+            cell_keys = self._cells[cell]
+            cell_keys.discard(key)
+            if not cell_keys:
+                del self._cells[cell]
+        return True
+
+    def _candidate_keys(self, bounds_list : list) -> set:
+        """Returns the keys of every circle that may overlap any of the
+        bounds, or of every circle if one of the bounds is None."""
+        if any(bounds is None for bounds in bounds_list):
+            return set(self._entries)
+        cells = set()
+        for bounds in bounds_list:
+            cells.update(self._cell_range(bounds))
+        candidate_keys = set(self._large_keys)
+        for cell in cells:
+            cell_keys = self._cells.get(cell)
+            if cell_keys:
+                candidate_keys.update(cell_keys)
+        return candidate_keys
+
+    def query_point(self, latitude : float, longitude : float) -> list:
+        """Returns the items whose circle contains the point."""
+        return self.query_circle(latitude, longitude, 0)
+
+    def query_circle(self, latitude : float, longitude : float, radius_nm : float) -> list:
+        """Returns the items whose circle overlaps the circle of radius_nm
+        around the point."""
+        found_items = []
+        for key in self._candidate_keys([circle_bounds(latitude, longitude, radius_nm)]):
+            entry_latitude, entry_longitude, entry_radius, item, cells = self._entries[key]
+            if get_distance_nm(latitude, longitude, entry_latitude, entry_longitude) <= radius_nm + entry_radius:
+                found_items.append(item)
+        return found_items
+
+    def query_polyline(self, points : list, buffer_nm : float) -> list:
+        """Returns the items whose circle comes within buffer_nm of the path
+        through points, a list of (latitude, longitude) joined by great
+        circle segments."""
+        if len(points) < 2:
+            return self.query_circle(points[0][0], points[0][1], buffer_nm) if points else []
+
+        # Candidates are only checked against the segments whose cells they were found in
+        segments = list(zip(points, points[1:]))
+        candidate_segments = {}
+        for segment in segments:
+            (start_latitude, start_longitude), (end_latitude, end_longitude) = segment
+            piece_count = max(1, math.ceil(get_distance_nm(start_latitude, start_longitude, end_latitude, end_longitude) / SEGMENT_STEP_NM))
+            piece_points = [intermediate_point(start_latitude, start_longitude, end_latitude, end_longitude, piece / piece_count)
+                            for piece in range(piece_count + 1)]
+            bounds_list = []
+            for piece_start, piece_end in zip(piece_points, piece_points[1:]):
+                start_bounds = circle_bounds(piece_start[0], piece_start[1], buffer_nm + SEGMENT_SLACK_NM)
+                end_bounds = circle_bounds(piece_end[0], piece_end[1], buffer_nm + SEGMENT_SLACK_NM)
+                if start_bounds is None or end_bounds is None:
+                    bounds_list.append(None)
+                    continue
+                bounds_list.append((min(start_bounds[0], end_bounds[0]), min(start_bounds[1], end_bounds[1]),
+                                    max(start_bounds[2], end_bounds[2]), max(start_bounds[3], end_bounds[3])))
+            for key in self._candidate_keys(bounds_list):
+                candidate_segments.setdefault(key, []).append(segment)
+
+        found_items = []
+        for key, key_segments in candidate_segments.items():
+            entry_latitude, entry_longitude, entry_radius, item, cells = self._entries[key]
+            if any(get_distance_to_segment_nm(entry_latitude, entry_longitude, start[0], start[1], end[0], end[1]) <= buffer_nm + entry_radius
+                   for start, end in key_segments):
+                found_items.append(item)
+        return found_items
+
+    def items(self) -> list:
+        return [entry[3] for entry in self._entries.values()]
@@ -0,0 +1,144 @@
+import re
+import threading
+
+# Words are runs of letters and digits. U/S (unserviceable) is the one
+# contraction with a slash, so it is kept whole.
+TOKEN_PATTERN = re.compile(r"U/S|[A-Z0-9]+")
+
+# FAA contractions and the plain words or phrases they stand for. Text and
+# queries are indexed by the contraction, so searching for RWY, RUNWAY or
+# RUNWAYS finds the same NOTAMs.
+CONTRACTIONS = {
+    "ACFT": ("AIRCRAFT",),
+    "AD": ("AERODROME",),
+    "AGL": ("ABOVE GROUND LEVEL",),
+    "AP": ("AIRPORT", "AIRPORTS"),
+    "APCH": ("APPROACH", "APPROACHES"),
+    "AVBL": ("AVAILABLE",),
+    "BCN": ("BEACON", "BEACONS"),
+    "BTN": ("BETWEEN",),
+    "CLSD": ("CLOSED", "CLOSURE"),
+    "COM": ("COMMUNICATION", "COMMUNICATIONS"),
+    "FREQ": ("FREQUENCY", "FREQUENCIES"),
+    "GP": ("GLIDE PATH", "GLIDEPATH"),
+    "GS": ("GLIDE SLOPE", "GLIDESLOPE"),
+    "LGT": ("LIGHT", "LIGHTS", "LIGHTING"),
+    "LGTD": ("LIGHTED",),
+    "LOC": ("LOCALIZER",),
+    "MSL": ("MEAN SEA LEVEL",),
+    "NAV": ("NAVIGATION",),
+    "OBST": ("OBSTACLE", "OBSTACLES", "OBSTRUCTION"),
+    "RWY": ("RUNWAY", "RUNWAYS"),
+    "SFC": ("SURFACE",),
+    "SVC": ("SERVICE",),
+    "TFR": ("TEMPORARY FLIGHT RESTRICTION", "TEMPORARY FLIGHT RESTRICTIONS"),
+    "TWR": ("TOWER",),
+    "TWY": ("TAXIWAY", "TAXIWAYS"),
+    "U/S": ("UNSERVICEABLE", "OUT OF SERVICE"),
+    "UAS": ("UNMANNED AIRCRAFT SYSTEM", "UNMANNED AIRCRAFT SYSTEMS", "DRONE", "DRONES"),
+    "UNAVBL": ("UNAVAILABLE",),
+    "WI": ("WITHIN",),
+}
+
+def build_phrase_table(contractions : dict) -> dict:
+    """Returns {tuple of words: contraction} for every expansion."""
+    return {tuple(expansion.split()): contraction for contraction, expansions in contractions.items() for expansion in expansions}
+
+# (word, ...) -> contraction
+PHRASES = build_phrase_table(CONTRACTIONS)
+# longest expansion in words
+MAX_PHRASE_WORDS = max(len(phrase) for phrase in PHRASES)
+
+def tokenize(text : str | None) -> list:
+    """Splits NOTAM text into upper case terms, with every FAA contraction
+    or expansion replaced by the contraction."""
+    words = TOKEN_PATTERN.findall((text or "").upper())
+    terms = []
+    position = 0
+    while position < len(words):
+        for phrase_length in range(min(MAX_PHRASE_WORDS, len(words) - position), 0, -1):
+            contraction = PHRASES.get(tuple(words[position:position + phrase_length]))
+            if contraction is not None:
+                terms.append(contraction)
+                position += phrase_length
+                break
+        else:
+            terms.append(words[position])
+            position += 1
+    return terms
+
+class TextIndex:
+    """Inverted index from terms to the ids of the NOTAMs whose text holds
+    them, for filtering results by keywords such as RWY, ILS or CRANE.
+
+    NOTAMs are added as they are stored and removed when nothing holds them
+    anymore. A NOTAM added several times, e.g. because it is part of several
+    results, stays indexed until it has been removed as many times.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # term -> set of notam ids
+        self._postings = {}
+        # notam id -> [reference count, frozenset of terms]
+        self._documents = {}
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, notam_id : str, text : str | None) -> None:
+        terms = frozenset(tokenize(text))
+        with self._lock:
+            document = self._documents.get(notam_id)
+            if document is not None:
+                document[0] += 1
+                if document[1] == terms:
+                    return
+                # The NOTAM was amended, index its new text
+                self._remove_postings(notam_id, document[1])
+                document[1] = terms
+            else:
+                self._documents[notam_id] = [1, terms]
+            for term in terms:
+                self._postings.setdefault(term, set()).add(notam_id)
+
+    def remove(self, notam_id : str) -> None:
+        with self._lock:
+            document = self._documents.get(notam_id)
+            if document is None:
+                return
+            document[0] -= 1
+            if document[0] <= 0:
+                del self._documents[notam_id]
+                self._remove_postings(notam_id, document[1])
+
+    def _remove_postings(self, notam_id : str, terms : frozenset) -> None:
+        # Caller must hold self._lock.
+        for term in terms:
+            term_ids = self._postings[term]
+            term_ids.discard(notam_id)
+            if not term_ids:
+                del self._postings[term]
+
+    def search(self, query : str) -> set:
+        """Returns the ids of the NOTAMs whose text holds every term of query."""
+        terms = set(tokenize(query))
+        if not terms:
+            return set()
+        with self._lock:
+            postings = sorted((self._postings.get(term, set()) for term in terms), key=len)
+            return set(postings[0]).intersection(*postings[1:])
+
+    def filter(self, notams : list, query : str) -> list:
+        """Returns the notams whose text holds every term of query, in their
+        original order.
+
+        Only the posting sets are looked up, so a filter costs one set
+        lookup per notam and term however many NOTAMs are indexed.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return list(notams)
+        with self._lock:
+            postings = [self._postings.get(term, set()) for term in terms]
+            return [notam for notam in notams if all(notam.id in term_ids for term_ids in postings)]
@@ -1,13 +1,143 @@
+import json
+import os
+import queue
+import threading
 from io import StringIO
-from flask import Flask, jsonify, request
-from flask import render_template
+from flask import Flask, jsonify, request, url_for, make_response, send_file
+from flask import render_template, stream_template
+import AirportIndex
+import Metrics
+import NotamBatch
+import NotamExport
 import NotamFetch
-from flask_table import Table, Col
+import NotamMap
+import NotamStore
+import QueryJobs
+import RequestProfiler
+import RouteCache
+import ResultPages
+import RouteWatch
+import SharedNotamStore
 
 app = Flask(__name__)
 # All print statements write to output, which is displayed on the homepage.
 message_log = StringIO()
-figure = None
+
+# Results of recent searches. Sized with NOTAM_ROUTE_CACHE_SIZE and
+# NOTAM_ROUTE_CACHE_MAX_AGE (seconds). Every area fetch is reported to the
+# cache so routes are dropped as soon as their NOTAMs change.
+route_cache = RouteCache.RouteCache(
+    max_entries = int(os.getenv("NOTAM_ROUTE_CACHE_SIZE", RouteCache.DEFAULT_MAX_ENTRIES)),
+    max_age = float(os.getenv("NOTAM_ROUTE_CACHE_MAX_AGE", RouteCache.DEFAULT_MAX_AGE_SECONDS)))
+NotamFetch.area_listeners.append(route_cache.area_fetched)
+Metrics.registry.counter("notam_route_cache_hits_total", "Searches answered from the route cache.", function=lambda: route_cache.hits)
+Metrics.registry.counter("notam_route_cache_misses_total", "Searches that missed the route cache.", function=lambda: route_cache.misses)
+Metrics.registry.counter("notam_route_cache_invalidations_total", "Cached routes dropped because an area's NOTAMs changed.", function=lambda: route_cache.invalidations)
+Metrics.registry.counter("notam_route_cache_rejected_total", "Search results not cached because their NOTAMs changed during the search.", function=lambda: route_cache.rejected_puts)
+
+# Snapshot mode, turned on with NOTAM_SNAPSHOT_MODE=1: the NOTAMs of the whole
+# continental US are swept every NOTAM_SNAPSHOT_INTERVAL seconds and searches
+# are answered from that store. Areas not swept within NOTAM_SNAPSHOT_MAX_AGE
+# seconds are fetched live. Cached routes are dropped when a sweep changes
+# the store. With NOTAM_SHARED_STORE_DIR set, only one worker process sweeps
+# and publishes the snapshot there, the others memory map it.
+notam_store = None
+if os.getenv("NOTAM_SNAPSHOT_MODE", "0") == "1":
+    snapshot_max_age = float(os.getenv("NOTAM_SNAPSHOT_MAX_AGE", NotamStore.DEFAULT_MAX_AGE_SECONDS))
+    shared_store_dir = os.getenv("NOTAM_SHARED_STORE_DIR")
+    if shared_store_dir and not SharedNotamStore.claim_writer(shared_store_dir):
+        notam_store = SharedNotamStore.SharedNotamStore(shared_store_dir, max_age = snapshot_max_age)
+    else:
+        notam_store = NotamStore.NotamStore(
+            sweep_radius = float(os.getenv("NOTAM_SNAPSHOT_SWEEP_RADIUS", NotamStore.SWEEP_RADIUS_NM)),
+            max_age = snapshot_max_age)
+        snapshot_publisher = SharedNotamStore.SnapshotPublisher(notam_store, shared_store_dir) if shared_store_dir else None
+        NotamStore.SnapshotRefresher(notam_store,
+            interval = float(os.getenv("NOTAM_SNAPSHOT_INTERVAL", NotamStore.DEFAULT_REFRESH_INTERVAL)),
+            after_sweep = snapshot_publisher.publish if snapshot_publisher is not None else None).start()
+    notam_store.refresh_listeners.append(route_cache.clear)
+    NotamFetch.notam_store = notam_store
+    Metrics.registry.gauge("notam_snapshot_age_seconds", "Seconds since the least recently swept snapshot region was fetched.",
+                           function=lambda: notam_store.oldest_age() or 0)
+    Metrics.registry.gauge("notam_snapshot_notams", "NOTAMs held in the snapshot.", function=lambda: len(notam_store))
+    Metrics.registry.gauge("notam_snapshot_stale_regions", "Snapshot regions older than the maximum age or never fetched.",
+                           function=lambda: notam_store.status()["stale_regions"])
+
+# Watched routes, see RouteWatch. Up to NOTAM_MAX_WATCHES routes are kept
+# until they go unread for NOTAM_WATCH_TTL seconds or their flight lands.
+# Watched areas are fetched again every NOTAM_WATCH_REFRESH_INTERVAL
+# seconds, and after every snapshot sweep that changes the store. Without
+# a snapshot store, a refresh fetches at most NOTAM_WATCH_REFRESH_AREAS areas
+# from the FAA API. Searches fetching a watched area update its watches too.
+watch_registry = RouteWatch.WatchRegistry(
+    max_watches = int(os.getenv("NOTAM_MAX_WATCHES", RouteWatch.DEFAULT_MAX_WATCHES)),
+    ttl = float(os.getenv("NOTAM_WATCH_TTL", RouteWatch.DEFAULT_WATCH_TTL_SECONDS)),
+    refresh_area_budget = int(os.getenv("NOTAM_WATCH_REFRESH_AREAS", RouteWatch.DEFAULT_REFRESH_AREA_BUDGET)))
+NotamFetch.area_listeners.append(watch_registry.area_fetched)
+watch_refresher = RouteWatch.WatchRefresher(watch_registry,
+    interval = float(os.getenv("NOTAM_WATCH_REFRESH_INTERVAL", RouteWatch.DEFAULT_REFRESH_INTERVAL))).start()
+if notam_store is not None:
+    notam_store.refresh_listeners.append(watch_refresher.wake)
+Metrics.registry.gauge("notam_watches", "Routes being watched.", function=lambda: len(watch_registry))
+
+# Ranked results that the results page loads a page at a time.
+result_store = ResultPages.ResultStore(
+    max_results = int(os.getenv("NOTAM_RESULT_STORE_SIZE", ResultPages.DEFAULT_MAX_RESULTS)))
+
+# Admins send this token in the X-Notam-Admin-Token header to profile a
+# request or download profiles. Profiling is disabled when it isn't set.
+ADMIN_TOKEN = os.getenv("NOTAM_ADMIN_TOKEN")
+# Profiles of single requests, see RequestProfiler. Stored in
+# NOTAM_PROFILE_DIR, keeping the newest NOTAM_PROFILE_MAX_FILES.
+profile_store = RequestProfiler.ProfileStore(
+    directory = os.getenv("NOTAM_PROFILE_DIR", RequestProfiler.DEFAULT_PROFILE_DIR),
+    max_profiles = int(os.getenv("NOTAM_PROFILE_MAX_FILES", RequestProfiler.DEFAULT_MAX_PROFILES)))
+
+def search_route(departure_airport : str, arrival_airport : str, search_log : StringIO, use_cache : bool = True,
+                 flight_window : tuple | None = None, on_endpoints = None) -> tuple:
+    """Returns the sorted notams and map payload for a route, from the route
+    cache when a fresh result is available and use_cache is set.
+
+    With a flight_window of (departure, arrival) UTC datetimes, only the
+    notams in effect during the flight are returned.
+
+    on_endpoints is called with the ranked departure and arrival notams
+    before the rest of the route is in, see NotamFetch.find_route_notams.
+    It isn't called when the route is cached.
+    """
+
+    cached_result = route_cache.get(departure_airport, arrival_airport, flight_window) if use_cache else None
+    if cached_result is not None:
+        print(f"Using results found {cached_result.age():.0f} seconds ago.", file=search_log)
+        return cached_result.notams, cached_result.map_payload
+
+    with route_cache.recording() as fetch_record:
+        all_notams, point_list, request_radius = NotamFetch.find_route_notams(
+            departure_airport = departure_airport,
+            arrival_airport = arrival_airport, message_log=search_log, flight_window=flight_window, on_endpoints=on_endpoints)
+    with Metrics.span("map_build"):
+        map_payload = NotamMap.build_map_payload(point_list, request_radius, all_notams)
+
+    route_cache.put(departure_airport, arrival_airport, all_notams, map_payload, point_list, request_radius, flight_window, fetch_record)
+    return all_notams, map_payload
+
+def run_query_job(departure_airport : str, arrival_airport : str, job_log : StringIO, flight_window : tuple | None = None) -> tuple:
+    """Runs a full search on a job worker thread.
+
+    Returns the sorted notams along with the route's map payload.
+    """
+    print(f"Finding all NOTAMs on flight path from {departure_airport} to {arrival_airport}.", file=job_log)
+    with Metrics.span("search"):
+        return search_route(departure_airport, arrival_airport, job_log, flight_window = flight_window)
+
+# Searches submitted in job mode run here instead of on the WSGI worker.
+# The pool can be sized with NOTAM_QUERY_WORKERS, NOTAM_MAX_PENDING_JOBS and
+# NOTAM_JOB_RESULT_TTL (seconds) environment variables.
+query_jobs = QueryJobs.QueryJobQueue(
+    run_query_job,
+    worker_count = int(os.getenv("NOTAM_QUERY_WORKERS", QueryJobs.DEFAULT_WORKER_COUNT)),
+    max_pending_jobs = int(os.getenv("NOTAM_MAX_PENDING_JOBS", QueryJobs.DEFAULT_MAX_PENDING_JOBS)),
+    result_ttl = float(os.getenv("NOTAM_JOB_RESULT_TTL", QueryJobs.DEFAULT_RESULT_TTL_SECONDS)))
 
 # Home displays the form for user input
 @app.route("/")
@@ -22,32 +152,464 @@ def query():
     """Search functionality using the search button is implemented here.
 
     When a user clicks the 'search' button, notamFetch is called to 
-    retreive all relevant notams, and this list is passed to webpage 
-    /query as a NotamTable.
+    retreive all relevant notams, and the first page of them is rendered
+    on webpage /query.
+
+    The optional DepartureTime and ArrivalTime fields (UTC, e.g.
+    2024-03-01T14:30) limit the results to the notams in effect during the
+    flight.
+
+    If the request includes mode=job (as a form field or query parameter), the
+    search is queued instead and a job id is returned right away. The job's
+    status and result are available from /query/jobs/<job_id>.
+
+    With mode=stream, the page is streamed as the search runs instead, see
+    stream_results.
+
+    Admins can profile the search by sending X-Notam-Profile (or the profile
+    query parameter) set to cpu, sample or memory along with the
+    X-Notam-Admin-Token header. Profiled searches skip the route cache, and
+    the response's X-Notam-Profile-Id names the saved profile.
     """
+    if request.method == 'POST' and request.values.get('mode') == 'job':
+        return submit_query_job()
+
     if request.method == 'POST':
+        profile_mode = request.headers.get('X-Notam-Profile') or request.args.get('profile')
+        if profile_mode:
+            if not RequestProfiler.is_authorized(ADMIN_TOKEN, request.headers.get('X-Notam-Admin-Token')):
+                return jsonify({"error": "Profiling requires a valid X-Notam-Admin-Token header."}), 403
+            if profile_mode not in RequestProfiler.PROFILE_MODES:
+                return jsonify({"error": f"Unknown profile mode {profile_mode}, expected any of {', '.join(RequestProfiler.PROFILE_MODES)}"}), 400
+
         clear_log()
-        NotamFetch.clear_map()
         
         departure_airport = request.form['DepartureAirport']
         arrival_airport = request.form['ArrivalAirport']
+        flight_window = NotamFetch.parse_flight_window(request.form.get('DepartureTime'), request.form.get('ArrivalTime'))
         
         print(f"Finding all NOTAMs on flight path from {departure_airport} to {arrival_airport}.", file=message_log)
 
-        # call backend to retrieve list of notams
-        all_notams = NotamFetch.get_all_notams(
-            departure_airport = departure_airport, 
-            arrival_airport = arrival_airport, message_log=message_log)
-        
-        figure = NotamFetch.get_map()
+        if request.values.get('mode') == 'stream' and not profile_mode:
+            return stream_results(departure_airport, arrival_airport, flight_window)
 
-        clear_log()
-        return render_template('query.html', 
-                               figure = figure,
-                               table = NotamTable(all_notams, border='1px solid black'),
-                               DepartureAirport = departure_airport, 
+        def run_search():
+            # call backend to retrieve list of notams
+            with Metrics.span("search"):
+                all_notams, map_payload = search_route(departure_airport, arrival_airport, message_log, use_cache = not profile_mode,
+                                                       flight_window = flight_window)
+
+            clear_log()
+            return make_response(render_results(all_notams, map_payload, departure_airport, arrival_airport))
+
+        if not profile_mode:
+            return run_search()
+
+        response, profile_id = profile_store.run(profile_mode, run_search, {
+            "departure": departure_airport,
+            "arrival": arrival_airport,
+            "path": request.path,
+        })
+        if profile_id is not None:
+            response.headers['X-Notam-Profile-Id'] = profile_id
+        return response
+
+def render_results(all_notams : list, map_payload : dict, departure_airport : str, arrival_airport : str):
+    """Renders the results page with only the first page of notams.
+
+    The rest of the table is loaded from /api/results/<result_id>/notams as
+    the user scrolls.
+    """
+    result_id = result_store.add(all_notams)
+    first_page = ResultPages.build_page(result_id, all_notams, 0, ResultPages.DEFAULT_PAGE_SIZE, ResultPages.DEFAULT_FIELDS)
+    with Metrics.span("render"):
+        return render_template('query.html',
+                               map_payload = map_payload,
+                               first_page = first_page,
+                               table_fields = ResultPages.DEFAULT_FIELDS,
+                               table_headers = ResultPages.TABLE_HEADERS,
+                               result_id = result_id,
+                               DepartureAirport = departure_airport,
                                ArrivalAirport = arrival_airport)
 
+def stream_results(departure_airport : str, arrival_airport : str, flight_window : tuple | None = None):
+    """Streams the results page while the search runs.
+
+    The page without any NOTAMs is sent right away. The ranked departure and
+    arrival NOTAMs follow as soon as those two areas are in, then the first
+    page of the whole route and the map once the search is done. Each stage
+    is sent as a script that fills in the page, see applyUpdate in query.html.
+    """
+
+    # Stages handed from the search thread to the response, None once it's done
+    updates = queue.Queue()
+
+    def send_endpoints(endpoint_notams):
+        updates.put({
+            "stage": "endpoints",
+            "total_count": len(endpoint_notams),
+            "items": ResultPages.page_items(endpoint_notams[:ResultPages.DEFAULT_PAGE_SIZE], ResultPages.DEFAULT_FIELDS),
+        })
+
+    def run_search():
+        try:
+            with Metrics.span("search"):
+                all_notams, map_payload = search_route(departure_airport, arrival_airport, message_log,
+                                                       flight_window = flight_window, on_endpoints = send_endpoints)
+            result_id = result_store.add(all_notams)
+            updates.put({
+                "stage": "results",
+                "result_id": result_id,
+                "page": ResultPages.build_page(result_id, all_notams, 0, ResultPages.DEFAULT_PAGE_SIZE, ResultPages.DEFAULT_FIELDS),
+                "map_payload": map_payload,
+            })
+        except Exception as err:
+            updates.put({"stage": "error", "error": str(err)})
+        finally:
+            updates.put(None)
+
+    def iter_updates():
+        while (update := updates.get()) is not None:
+            if update["stage"] == "results":
+                update["results_url"] = url_for('result_notams', result_id=update["result_id"])
+                update["export_url"] = url_for('export_result', result_id=update["result_id"])
+            yield update
+        clear_log()
+
+    # The search starts before the first byte is sent, so the shell costs it no time
+    threading.Thread(target=run_search, daemon=True).start()
+    response = app.response_class(stream_template('query.html',
+                                                  map_payload = None,
+                                                  first_page = ResultPages.build_page(None, [], 0, ResultPages.DEFAULT_PAGE_SIZE, ResultPages.DEFAULT_FIELDS),
+                                                  table_fields = ResultPages.DEFAULT_FIELDS,
+                                                  table_headers = ResultPages.TABLE_HEADERS,
+                                                  result_id = None,
+                                                  updates = iter_updates(),
+                                                  DepartureAirport = departure_airport,
+                                                  ArrivalAirport = arrival_airport))
+    # Keeps proxies such as nginx from holding the page back until it's complete
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/results/<result_id>/notams', methods=['GET'])
+def result_notams(result_id):
+    """Returns one page of a ranked result as JSON.
+
+    Query parameters
+    ----------------
+    cursor : str
+        The next_cursor from the previous page. Starts at the first notam if missing.
+    limit : int
+        Number of notams per page, up to ResultPages.MAX_PAGE_SIZE.
+    fields : str
+        Comma separated notam fields to include, defaults to the table's columns.
+    q : str
+        Keywords such as "RWY CLSD". Only notams whose text holds all of them
+        are returned. FAA contractions match their plain words, e.g. RWY
+        matches RUNWAY.
+    """
+
+    text_query = request.args.get('q', '').strip()
+    all_notams = result_store.get(result_id, text_query)
+    if all_notams is None:
+        return jsonify({"error": f"No results found with id {result_id}, please search again."}), 404
+
+    try:
+        offset = ResultPages.decode_cursor(request.args['cursor'], result_id, text_query) if request.args.get('cursor') else 0
+        page_size = ResultPages.parse_page_size(request.args.get('limit'))
+        fields = ResultPages.parse_fields(request.args.get('fields'))
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
+
+    etag = ResultPages.page_etag(result_id, offset, page_size, fields, text_query)
+    if etag in request.if_none_match:
+        response = make_response("", 304)
+    else:
+        page = ResultPages.build_page(result_id, all_notams, offset, page_size, fields, text_query)
+        body, encoding = ResultPages.compress(json.dumps(page).encode(), request.headers.get('Accept-Encoding', ''))
+        response = make_response(body)
+        response.content_type = "application/json"
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'private, max-age=0, must-revalidate'
+    return response
+
+@app.route('/api/results/<result_id>/export', methods=['GET'])
+def export_result(result_id):
+    """Streams every NOTAM of a stored result as a download.
+
+    Parameters
+    ----------
+    format : str
+        "ndjson" (the default), one JSON object per line, or "columnar" for
+        large dumps, see NotamExport.
+    q : str
+        Keywords to filter the NOTAMs by, as in result_notams.
+    """
+
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in NotamExport.EXPORT_FORMATS:
+        return jsonify({"error": f"Unknown export format {export_format}, expected any of {', '.join(NotamExport.EXPORT_FORMATS)}"}), 400
+    all_notams = result_store.get(result_id, request.args.get('q', '').strip())
+    if all_notams is None:
+        return jsonify({"error": f"No results found with id {result_id}, please search again."}), 404
+
+    # The chunks are encoded as they are sent, so the whole export never sits in memory
+    response = app.response_class(NotamExport.iter_export_chunks(all_notams, export_format),
+                                  mimetype=NotamExport.EXPORT_CONTENT_TYPES[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename="{result_id}{NotamExport.EXPORT_FORMATS[export_format]}"'
+    return response
+
+def submit_query_job():
+    """Queues a search and responds with the job's id and status urls."""
+
+    departure_airport = request.values.get('DepartureAirport')
+    arrival_airport = request.values.get('ArrivalAirport')
+    if not departure_airport or not arrival_airport:
+        return jsonify({"error": "DepartureAirport and ArrivalAirport are required."}), 400
+
+    try:
+        flight_window = NotamFetch.parse_flight_window(request.values.get('DepartureTime'), request.values.get('ArrivalTime'))
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
+
+    try:
+        job = query_jobs.submit(departure_airport, arrival_airport, flight_window)
+    except QueryJobs.JobQueueFullError as err:
+        return jsonify({"error": str(err)}), 503
+
+    response = job.to_dict()
+    response["status_url"] = url_for('query_job_status', job_id=job.id)
+    response["result_url"] = url_for('query_job_result', job_id=job.id)
+    return jsonify(response), 202
+
+@app.route('/api/batch', methods=['POST'])
+def batch_query():
+    """Ranks the notams for several routes in one request.
+
+    Expects a JSON body like {"routes": [["OKC", "DFW"], ["OKC", "MCI"]]}.
+    A route can add its departure and arrival times in UTC, e.g.
+    ["OKC", "DFW", "2024-03-01T14:30", "2024-03-01T16:00"], to only keep
+    the notams in effect during the flight. Each leg's ranked notams can be
+    paged through /api/results/<result_id>/notams. Errors are returned as
+    JSON too.
+    """
+
+    request_json = request.get_json(silent=True) or {}
+    route_list = request_json.get("routes")
+    if not isinstance(route_list, list) or not all(isinstance(route, list) and 2 <= len(route) <= 4
+                                                   and all(flight_time is None or isinstance(flight_time, str) for flight_time in route[2:])
+                                                   for route in route_list):
+        return jsonify({"error": "Expected a JSON body with routes as a list of [departure, arrival] pairs, optionally followed by departure and arrival times."}), 400
+
+    try:
+        flight_windows = [NotamFetch.parse_flight_window(route[2] if len(route) > 2 else None, route[3] if len(route) > 3 else None)
+                          for route in route_list]
+        batch_result = NotamBatch.get_all_notams_batch([tuple(route[:2]) for route in route_list], StringIO(), flight_windows)
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
+    except NotamFetch.RetryableFAAError as err:
+        return jsonify({"error": str(err)}), 503
+    except RuntimeError as err:
+        # The FAA API refused or failed the requests
+        return jsonify({"error": str(err)}), 502
+    except Exception as err:
+        return jsonify({"error": str(err)}), 500
+
+    legs = []
+    for leg in batch_result["legs"]:
+        leg_response = {"departure": leg["departure"], "arrival": leg["arrival"], "error": leg["error"]}
+        if leg["notams"] is not None:
+            leg_response["result_id"] = result_store.add(leg["notams"])
+            leg_response["total_count"] = len(leg["notams"])
+            leg_response["notam_ids"] = [notam.id for notam in leg["notams"]]
+        legs.append(leg_response)
+
+    return jsonify({"legs": legs, "stats": batch_result["stats"]})
+
+@app.route('/api/watches', methods=['POST'])
+def create_watch():
+    """Watches a route for changes to its ranked notams.
+
+    Expects a JSON body like {"departure": "OKC", "arrival": "DFW"}, with
+    optional "departure_time" and "arrival_time" (UTC) to only watch the
+    notams in effect during the flight. Responds with the ranked notams and
+    where to follow their changes.
+    """
+
+    request_json = request.get_json(silent=True) or {}
+    departure_airport = request_json.get("departure")
+    arrival_airport = request_json.get("arrival")
+    if not isinstance(departure_airport, str) or not isinstance(arrival_airport, str):
+        return jsonify({"error": "Expected a JSON body with departure and arrival airports."}), 400
+
+    try:
+        flight_window = NotamFetch.parse_flight_window(request_json.get("departure_time"), request_json.get("arrival_time"))
+        watch = watch_registry.add(departure_airport, arrival_airport, StringIO(), flight_window)
+    except (ValueError, TypeError) as err:
+        return jsonify({"error": str(err)}), 400
+    except RouteWatch.WatchLimitError as err:
+        return jsonify({"error": str(err)}), 503
+
+    return jsonify(watch_response(watch)), 201
+
+def watch_response(watch : RouteWatch.RouteWatch) -> dict:
+    response = watch.to_dict()
+    response["notams"] = watch_registry.ranked_items(watch.id)
+    response["changes_url"] = url_for('watch_changes', watch_id=watch.id)
+    response["events_url"] = url_for('watch_events', watch_id=watch.id)
+    return response
+
+@app.route('/api/watches/<watch_id>', methods=['GET', 'DELETE'])
+def route_watch(watch_id):
+    """Returns a watch with its ranked notams and the number of its latest
+    change, or stops watching the route."""
+
+    if request.method == 'DELETE':
+        if not watch_registry.remove(watch_id):
+            return jsonify({"error": f"No watch found with id {watch_id}, it may have expired."}), 404
+        return "", 204
+
+    watch = watch_registry.get(watch_id)
+    if watch is None:
+        return jsonify({"error": f"No watch found with id {watch_id}, it may have expired."}), 404
+    return jsonify(watch_response(watch))
+
+@app.route('/api/watches/<watch_id>/changes', methods=['GET'])
+def watch_changes(watch_id):
+    """Returns a watch's changes since the last one the client saw.
+
+    Query parameters
+    ----------------
+    after : int
+        The seq of the last change seen, or of the watch when it was read.
+    wait : float
+        Seconds to wait for a change when there's none yet, up to
+        RouteWatch.MAX_CHANGES_WAIT_SECONDS.
+    """
+
+    try:
+        seq = RouteWatch.parse_seq(request.args.get('after'))
+        wait = RouteWatch.parse_wait(request.args.get('wait'))
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
+
+    watch, changes = watch_registry.changes_after(watch_id, seq, wait)
+    if watch is None:
+        return jsonify({"error": f"No watch found with id {watch_id}, it may have expired."}), 404
+    if changes is None:
+        return jsonify({"error": f"Changes after {seq} are no longer kept, read the watch again."}), 410
+    return jsonify({"watch_id": watch_id, "seq": watch.seq, "changes": changes})
+
+@app.route('/api/watches/<watch_id>/events', methods=['GET'])
+def watch_events(watch_id):
+    """Pushes a watch's changes as server-sent events. Reconnecting clients
+    resume after the Last-Event-ID header, or the after parameter."""
+
+    try:
+        seq = RouteWatch.parse_seq(request.headers.get('Last-Event-ID') or request.args.get('after'))
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
+    if watch_registry.get(watch_id) is None:
+        return jsonify({"error": f"No watch found with id {watch_id}, it may have expired."}), 404
+
+    response = app.response_class(watch_registry.iter_events(watch_id, seq), mimetype="text/event-stream")
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/query/jobs/<job_id>', methods=['GET'])
+def query_job_status(job_id):
+    """Returns a queued search's status and messages as JSON."""
+
+    job = query_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"No job found with id {job_id}, it may have expired."}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/query/jobs/<job_id>/result', methods=['GET'])
+def query_job_result(job_id):
+    """Renders a finished job's notams the same way a regular search would."""
+
+    job = query_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"No job found with id {job_id}, it may have expired."}), 404
+    if job.status == QueryJobs.QueryJob.FAILED:
+        return render_template("error.html", error_message = job.error), 500
+    if job.status != QueryJobs.QueryJob.DONE:
+        return jsonify(job.to_dict()), 202
+
+    all_notams, map_payload = job.result
+    return render_results(all_notams, map_payload, job.departure_airport, job.arrival_airport)
+
+@app.route('/admin/profiles', methods=['GET'])
+def list_profiles():
+    """Lists saved request profiles, newest first. Admin only."""
+
+    if not RequestProfiler.is_authorized(ADMIN_TOKEN, request.headers.get('X-Notam-Admin-Token')):
+        return jsonify({"error": "A valid X-Notam-Admin-Token header is required."}), 403
+    return jsonify(profile_store.list_profiles())
+
+@app.route('/admin/profiles/<file_name>', methods=['GET'])
+def download_profile(file_name):
+    """Downloads one file of a saved profile. Admin only."""
+
+    if not RequestProfiler.is_authorized(ADMIN_TOKEN, request.headers.get('X-Notam-Admin-Token')):
+        return jsonify({"error": "A valid X-Notam-Admin-Token header is required."}), 403
+    path = profile_store.file_path(file_name)
+    if path is None:
+        return jsonify({"error": f"No profile file named {file_name}."}), 404
+    return send_file(os.path.abspath(path), as_attachment=True, download_name=file_name)
+
+@app.route('/airports/suggest', methods=['GET'])
+def suggest_airports():
+    """Returns the continental US airports matching what has been typed so far.
+
+    Parameters
+    ----------
+    q : str
+        Start of an airport code (IDENT or ICAO_ID) or of any word of its name.
+    limit : int
+        Most suggestions to return, defaults to AirportIndex.DEFAULT_SUGGESTION_LIMIT.
+    """
+
+    query = AirportIndex.normalize_query(request.args.get('q'))
+    try:
+        limit = AirportIndex.parse_limit(request.args.get('limit'))
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
+
+    with Metrics.span("airport_suggest"):
+        index = AirportIndex.get_index()
+        etag = AirportIndex.suggestion_etag(index, query, limit)
+        if etag in request.if_none_match:
+            response = make_response("", 304)
+        else:
+            response = jsonify({"query": query, "suggestions": list(index.suggest(query, limit))})
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={AirportIndex.SUGGESTION_MAX_AGE_SECONDS}'
+    return response
+
+@app.route('/api/snapshot', methods=['GET'])
+def snapshot_status():
+    """Returns how fresh the nationwide NOTAM snapshot is as JSON."""
+
+    if notam_store is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **notam_store.status()})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Returns stage timings and counters in the Prometheus text format."""
+
+    response = make_response(Metrics.registry.render())
+    response.content_type = "text/plain; version=0.0.4; charset=utf-8"
+    return response
+
 @app.errorhandler(Exception)
 def handle_backend_errors(e):
         clear_log()
@@ -71,29 +633,3 @@ def clear_log():
 
     message_log.truncate(0)
     message_log.seek(0)
-
-class TextCol(Col):
-    """Replaces newlines with <br></br> in a table column for HTML display."""
-
-    def td_format(self, content):
-       return content.replace("\n", "<br />")
-
-class NotamTable(Table):
-    """It's a table...for notams.
-
-    Implements a custom html Table object using flask_table, which will
-    automatically create an html table from a list of Notam objects. 
-    Table can be made like so:
-        table = NotamTable(all_notams)
-    """
-    id = Col('ID')
-    location = Col('Location')
-    number = Col('Number')
-    effective_start = Col('Effective Start')
-    effective_end = Col('Effective End')
-    text = TextCol('Description')
-    type = Col('Type')
-    selection_code = Col('Selection Code')
-    traffic = Col('Traffic')
-    purpose = Col('Purpose')
-    score = Col('Score')
\ No newline at end of file
@@ -0,0 +1,310 @@
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# A local stand-in for the FAA NOTAM API's /notamapi/v1/notams endpoint, for
+# offline load testing. Start it with
+#   python3 -m benchmarks.FaaMockServer --port 8089 --notams 100000
+# and point the app at it with
+#   NOTAM_FAA_API_ENTRYPOINT=http://127.0.0.1:8089/notamapi/v1/notams
+# plus client_id/client_secret environment variables matching --client-id
+# and --client-secret.
+
+NOTAMS_PATH = "/notamapi/v1/notams"
+# largest pageSize the real API accepts
+MAX_PAGE_SIZE = 1000
+# radius of the earth in nautical miles, as in NavigationTools
+EARTH_RADIUS_NM = 3443.89849
+# size in degrees of the grid cells the dataset is bucketed into
+GRID_DEGREES = 1.0
+
+def distance_nm(latitude_one : float, longitude_one : float, latitude_two : float, longitude_two : float) -> float:
+    """Great circle distance between two points in nautical miles."""
+    latitude_one, longitude_one, latitude_two, longitude_two = map(math.radians, (latitude_one, longitude_one, latitude_two, longitude_two))
+    haversine = (math.sin((latitude_two - latitude_one) / 2) ** 2
+                 + math.cos(latitude_one) * math.cos(latitude_two) * math.sin((longitude_two - longitude_one) / 2) ** 2)
+    return 2 * EARTH_RADIUS_NM * math.asin(min(1.0, math.sqrt(haversine)))
+
+def item_location(item : dict) -> tuple | None:
+    """Returns the (latitude, longitude) of a NOTAM item's Point geometry."""
+    geometry = item.get("geometry") or {}
+    if geometry.get("type") == "Point" and len(geometry.get("coordinates") or []) >= 2:
+        return (geometry["coordinates"][1], geometry["coordinates"][0])
+    for inner_geometry in geometry.get("geometries") or []:
+        if inner_geometry.get("type") == "Point":
+            return (inner_geometry["coordinates"][1], inner_geometry["coordinates"][0])
+    return None
+
+def load_recorded_items(file_name : str) -> list:
+    """Reads NOTAM items from a recorded FAA response (a page with "items"),
+    a JSON list of items, an NDJSON file with one item per line or an export
+    written by NotamExport."""
+    import NotamExport
+    from Notam import Notam
+
+    if NotamExport.is_columnar_export(file_name):
+        return [Notam.from_dict(notam_dict).to_feature() for notam_dict in NotamExport.iter_notam_dicts(file_name)]
+    with open(file_name) as recorded_file:
+        contents = recorded_file.read()
+    try:
+        recorded = json.loads(contents)
+    except json.JSONDecodeError:
+        recorded = [json.loads(line) for line in contents.splitlines() if line.strip()]
+    if isinstance(recorded, dict):
+        # A single line NDJSON file parses as one item rather than a page
+        recorded = recorded.get("items", []) if "properties" not in recorded and "id" not in recorded else [recorded]
+    # NDJSON exports hold flat NOTAM dictionaries rather than FAA items
+    return [item if "properties" in item else Notam.from_dict(item).to_feature() for item in recorded]
+
+class MockConfig:
+    """Behavior of the mock server.
+
+    Parameters
+    ----------
+    latency_ms : float
+        Base response time added to every request.
+    latency_jitter_ms : float
+        Extra random response time, exponentially distributed with this mean,
+        so a few requests are much slower than the rest.
+    rate_429 : float
+        Fraction of requests answered with HTTP 429 at random.
+    retry_after : float | None
+        Retry-After header sent with HTTP 429 responses, left out if None.
+    requests_per_minute : int | None
+        If set, requests beyond this many in the last minute get HTTP 429.
+    error_message_rate : float
+        Fraction of requests answered with HTTP 200 and only a "message"
+        key, the way the FAA API reports bad requests.
+    client_id, client_secret : str | None
+        Credentials requests must carry in their headers. Not checked if None.
+    """
+
+    def __init__(self, latency_ms : float = 0, latency_jitter_ms : float = 0, rate_429 : float = 0,
+                 requests_per_minute : int | None = None, error_message_rate : float = 0,
+                 client_id : str | None = None, client_secret : str | None = None, seed : int = 0,
+                 retry_after : float | None = 1):
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.rate_429 = rate_429
+        self.requests_per_minute = requests_per_minute
+        self.error_message_rate = error_message_rate
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.seed = seed
+        self.retry_after = retry_after
+
+class NotamDataset:
+    """NOTAM items bucketed on a lat/lon grid for radius queries."""
+
+    def __init__(self, items : list):
+        self.items = items
+        # (grid latitude, grid longitude) -> list of (latitude, longitude, item)
+        self._grid = {}
+        for item in items:
+            location = item_location(item)
+            if location is None:
+                continue
+            cell = (math.floor(location[0] / GRID_DEGREES), math.floor(location[1] / GRID_DEGREES))
+            self._grid.setdefault(cell, []).append((location[0], location[1], item))
+
+    def within(self, latitude : float, longitude : float, radius_nm : float) -> list:
+        """Returns the items within radius_nm of a point, in a stable order."""
+        latitude_cells = math.ceil(radius_nm / 60 / GRID_DEGREES) + 1
+        longitude_cells = math.ceil(radius_nm / (60 * max(math.cos(math.radians(latitude)), 0.01)) / GRID_DEGREES) + 1
+        center_cell = (math.floor(latitude / GRID_DEGREES), math.floor(longitude / GRID_DEGREES))
+
+        found_items = []
+        for latitude_offset in range(-latitude_cells, latitude_cells + 1):
+            for longitude_offset in range(-longitude_cells, longitude_cells + 1):
+                for item_latitude, item_longitude, item in self._grid.get((center_cell[0] + latitude_offset, center_cell[1] + longitude_offset), ()):
+                    if distance_nm(latitude, longitude, item_latitude, item_longitude) <= radius_nm:
+                        found_items.append(item)
+        found_items.sort(key=lambda item: item["properties"]["coreNOTAMData"]["notam"]["id"])
+        return found_items
+
+class FaaMockServer:
+    """Serves a NotamDataset the way the FAA NOTAM API does.
+
+    Use start() to run it on a background thread (e.g. from a test or the
+    load test harness) and stop() to shut it down.
+    """
+
+    def __init__(self, dataset : NotamDataset, config : MockConfig | None = None, host : str = "127.0.0.1", port : int = 0):
+        self.dataset = dataset
+        self.config = config or MockConfig()
+        self.stats = Counter()
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._recent_requests = deque()
+        self._thread = None
+
+        mock_server = self
+        class Handler(MockRequestHandler):
+            server_state = mock_server
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{NOTAMS_PATH}"
+
+    def start(self) -> "FaaMockServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="faa-mock-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.stats.clear()
+
+    def record(self, key : str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def roll(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def response_delay(self) -> float:
+        """Returns how long the next response should take, in seconds."""
+        delay_ms = self.config.latency_ms
+        if self.config.latency_jitter_ms > 0:
+            with self._lock:
+                delay_ms += self._rng.expovariate(1 / self.config.latency_jitter_ms)
+        return delay_ms / 1000
+
+    def over_rate_limit(self) -> bool:
+        """Records a request and returns whether it goes over requests_per_minute."""
+        if self.config.requests_per_minute is None:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            while self._recent_requests and now - self._recent_requests[0] >= 60:
+                self._recent_requests.popleft()
+            if len(self._recent_requests) >= self.config.requests_per_minute:
+                return True
+            self._recent_requests.append(now)
+            return False
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    server_state = None
+
+    def log_message(self, format, *args):
+        # Keep load tests quiet
+        pass
+
+    def send_json(self, status : int, body : dict, headers : dict | None = None) -> None:
+        encoded_body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded_body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(encoded_body)
+        self.server_state.record(f"status_{status}")
+
+    def do_GET(self):
+        state = self.server_state
+        config = state.config
+        url = urlparse(self.path)
+
+        if url.path == "/stats":
+            self.send_json(200, dict(state.stats))
+            return
+        if url.path == "/reset":
+            state.reset_stats()
+            self.send_json(200, {})
+            return
+        if url.path != NOTAMS_PATH:
+            self.send_json(404, {"error": "Not Found"})
+            return
+
+        state.record("requests")
+        time.sleep(state.response_delay())
+
+        if ((config.client_id is not None and self.headers.get("client_id") != config.client_id)
+                or (config.client_secret is not None and self.headers.get("client_secret") != config.client_secret)):
+            self.send_json(401, {"error": {"message": "Invalid client id or secret"}})
+            return
+        if state.over_rate_limit() or state.roll() < config.rate_429:
+            retry_after_header = {} if config.retry_after is None else {"Retry-After": f"{config.retry_after:g}"}
+            self.send_json(429, {"error": {"message": "Too Many Requests"}}, retry_after_header)
+            return
+        if state.roll() < config.error_message_rate:
+            self.send_json(200, {"message": "Simulated error from the FAA API mock"})
+            return
+
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+        try:
+            latitude = float(params["locationLatitude"])
+            longitude = float(params["locationLongitude"])
+            radius_nm = float(params.get("locationRadius", 25))
+            page_size = int(params.get("pageSize", 50))
+            page_num = int(params.get("pageNum", 1))
+        except (KeyError, ValueError) as err:
+            self.send_json(200, {"message": f"Invalid request parameters: {err}"})
+            return
+        if page_size < 1 or page_size > MAX_PAGE_SIZE:
+            self.send_json(200, {"message": f"pageSize must be between 1 and {MAX_PAGE_SIZE}"})
+            return
+
+        found_items = state.dataset.within(latitude, longitude, radius_nm)
+        start = (page_num - 1) * page_size
+        self.send_json(200, {
+            "pageSize": page_size,
+            "pageNum": page_num,
+            "totalCount": len(found_items),
+            "totalPages": max(1, math.ceil(len(found_items) / page_size)),
+            "items": found_items[start:start + page_size],
+        })
+
+def main(argv : list | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Local stand-in for the FAA NOTAM API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--notams", type=int, default=50000, help="number of synthetic NOTAMs spread over the continental US")
+    parser.add_argument("--recorded", help="serve NOTAMs from a recorded response, JSON list or NDJSON file instead")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--latency-jitter-ms", type=float, default=0)
+    parser.add_argument("--rate-429", type=float, default=0, help="fraction of requests answered with HTTP 429")
+    parser.add_argument("--retry-after", type=float, default=1, help="Retry-After seconds sent with HTTP 429, negative to leave it out")
+    parser.add_argument("--requests-per-minute", type=int, help="answer HTTP 429 beyond this many requests a minute")
+    parser.add_argument("--error-message-rate", type=float, default=0, help="fraction of requests answered with HTTP 200 and an error message")
+    parser.add_argument("--client-id", help="required client_id header")
+    parser.add_argument("--client-secret", help="required client_secret header")
+    args = parser.parse_args(argv)
+
+    if args.recorded:
+        items = load_recorded_items(args.recorded)
+    else:
+        from benchmarks import NotamGenerator
+        items = NotamGenerator.generate_notam_items(args.notams, seed=args.seed)
+
+    config = MockConfig(latency_ms=args.latency_ms, latency_jitter_ms=args.latency_jitter_ms, rate_429=args.rate_429,
+                        requests_per_minute=args.requests_per_minute, error_message_rate=args.error_message_rate,
+                        client_id=args.client_id, client_secret=args.client_secret, seed=args.seed,
+                        retry_after=args.retry_after if args.retry_after >= 0 else None)
+    server = FaaMockServer(NotamDataset(items), config, args.host, args.port)
+    print(f"Serving {len(items)} NOTAMs at {server.url}", file=sys.stderr)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+from unittest import mock
+
+# Times decoding FAA API pages into NOTAMs and scoring them, in this process
+# and on the ingest process pool with different numbers of workers.
+#
+# Run from the repository root:
+#   python3 -m benchmarks.IngestBenchmark --notams 100000 --workers 1 2 4 8
+# or on NOTAMs recorded from the real API:
+#   python3 -m benchmarks.IngestBenchmark --recorded recorded.json --workers 1 2 4
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_NOTAMS = 100000
+DEFAULT_WORKERS = [1, 2, 4]
+# items per recorded page, the FAA API's largest page size
+PAGE_SIZE = 1000
+
+def build_payloads(items : list) -> list:
+    """Returns the items as FAA API response pages, encoded the way they
+    come off the wire."""
+    from benchmarks import NotamGenerator
+
+    page_count = max(1, -(-len(items) // PAGE_SIZE))
+    return [json.dumps(NotamGenerator.build_page(items, page_num, PAGE_SIZE)).encode() for page_num in range(1, page_count + 1)]
+
+def ingest(payloads : list, today : datetime) -> tuple:
+    """Decodes every page like NotamFetch does, with pages decoded at the
+    same time the way the fetch threads do, then scores the NOTAMs.
+    Returns (seconds, [(notam id, score)])."""
+    import concurrent.futures
+    import NotamIngest
+    import NotamSort
+
+    start_time = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(payloads)) as fetch_threads:
+        pages = list(fetch_threads.map(NotamIngest.decode_page, payloads))
+    notams = [notam for page in pages for notam in NotamIngest.page_notams(page)]
+    NotamSort.RatingSort().scoring(notams, "OKC", "DFW", today)
+    elapsed = time.perf_counter() - start_time
+    return elapsed, [(notam.id, notam.score) for notam in notams]
+
+def run_with_workers(payloads : list, workers : int, repeat : int, today : datetime) -> tuple:
+    """Times ingest with this many pool workers, 0 meaning no pool.
+    Returns (best seconds, results of the last run)."""
+    import NotamIngest
+
+    patches = [
+        mock.patch.object(NotamIngest, "INGEST_WORKERS", workers),
+        mock.patch.object(NotamIngest, "MIN_POOL_PAGE_BYTES", 0),
+        mock.patch.object(NotamIngest, "MIN_POOL_SCORE_NOTAMS", 0),
+    ]
+    for patch in patches:
+        patch.start()
+    try:
+        # Start the pool's workers untimed, they would be running long before a search
+        if NotamIngest.get_pool() is not None:
+            NotamIngest.get_pool().submit(NotamIngest.score_rows, [], "OKC", "DFW", today).result()
+        timings = []
+        for i in range(repeat):
+            elapsed, results = ingest(payloads, today)
+            timings.append(elapsed)
+        return min(timings), results
+    finally:
+        if NotamIngest._pool is not None:
+            NotamIngest._pool.shutdown()
+            NotamIngest._pool = None
+        for patch in patches:
+            patch.stop()
+
+def run_benchmarks(items : list, worker_counts : list, repeat : int) -> dict:
+    payloads = build_payloads(items)
+    today = datetime.utcnow()
+    report = {
+        "created": today.isoformat() + "Z",
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "notams": len(items),
+        "payload_bytes": sum(len(payload) for payload in payloads),
+        "repeat": repeat,
+        "runs": {},
+    }
+    print(f"Ingesting {len(items)} NOTAMs in {len(payloads)} pages...", file=sys.stderr)
+    inline_time, inline_results = run_with_workers(payloads, 0, repeat, today)
+    report["runs"]["inline"] = {"best": inline_time, "speedup": 1.0}
+    for workers in worker_counts:
+        pool_time, pool_results = run_with_workers(payloads, workers, repeat, today)
+        if pool_results != inline_results:
+            raise RuntimeError(f"Error: the pool with {workers} workers scored NOTAMs differently than inline ingestion")
+        report["runs"][f"pool[{workers}]"] = {"best": pool_time, "speedup": inline_time / pool_time}
+    return report
+
+def print_report(report : dict) -> None:
+    print(f"{report['notams']} NOTAMs, {report['payload_bytes'] / 1e6:.1f} MB of pages, {report['cpus']} CPUs")
+    print(f"{'run':<16}{'best (ms)':>12}{'speedup':>10}")
+    for run_name, run_result in report["runs"].items():
+        print(f"{run_name:<16}{run_result['best'] * 1000:>12.1f}{run_result['speedup']:>9.2f}x")
+
+def main(argv : list | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Times NOTAM page decoding and scoring on the ingest process pool.")
+    parser.add_argument("--notams", type=int, default=DEFAULT_NOTAMS, help="number of synthetic NOTAMs to ingest")
+    parser.add_argument("--recorded", help="JSON file of recorded FAA API items to ingest instead of synthetic ones")
+    parser.add_argument("--workers", type=int, nargs="+", default=DEFAULT_WORKERS, help="pool sizes to time")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per pool size, the best one is reported")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    from benchmarks import FaaMockServer, NotamGenerator
+    if args.recorded:
+        items = FaaMockServer.load_recorded_items(args.recorded)
+    else:
+        items = NotamGenerator.generate_notam_items(args.notams, seed=args.notams)
+
+    # --output is relative to where the benchmark was run
+    output_path = os.path.abspath(args.output) if args.output else None
+    # The ranking files are found relative to the repository root
+    os.chdir(REPO_ROOT)
+    report = run_benchmarks(items, args.workers, args.repeat)
+    print_report(report)
+
+    if output_path:
+        with open(output_path, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,438 @@
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+# Drives the Flask app end to end against the local FAA stand-in and reports
+# latency percentiles, throughput, FAA calls per query, peak RSS and errors.
+#
+# Run from the repository root (database/Airports.json is needed for the
+# airport lookups):
+#   python3 -m benchmarks.LoadTest --concurrency 8 --duration 60 --output run.json
+# and compare a later run against it:
+#   python3 -m benchmarks.LoadTest --concurrency 8 --duration 60 --compare run.json
+# Settings of the app under test can be changed with --app-env, e.g.
+#   --app-env NOTAM_ROUTE_CACHE_SIZE=0 --app-env NOTAM_QUERY_WORKERS=8
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# routes searched when none are given, as "DEP:ARR=weight"
+DEFAULT_ROUTES = ["OKC:DFW=4", "OKC:MCI=2", "DFW:MCI=2", "LAX:DEN=1", "ORD:ATL=1"]
+# scenarios run when none are given, as "scenario=weight"
+DEFAULT_SCENARIOS = ["query=1"]
+SCENARIOS = ("query", "job", "batch")
+# a run counts as regressed when a stage's p95 is this much slower, or the
+# throughput this much lower, than the baseline
+DEFAULT_REGRESSION_THRESHOLD = 1.25
+# longest wait for the app and the stand-in to start, in seconds
+STARTUP_TIMEOUT = 60
+# seconds between polls of a queued job's status
+JOB_POLL_INTERVAL = 0.05
+# seconds a single HTTP request may take before it counts as an error
+REQUEST_TIMEOUT = 300
+# credentials shared by the stand-in and the app under test
+LOAD_TEST_CREDENTIALS = {"client_id": "loadtest", "client_secret": "loadtest"}
+
+def percentile(values : list, fraction : float) -> float | None:
+    """Returns the fraction (0 to 1) percentile of values, interpolating
+    between the closest ranks."""
+    if not values:
+        return None
+    sorted_values = sorted(values)
+    rank = (len(sorted_values) - 1) * fraction
+    lower_rank = int(rank)
+    upper_rank = min(lower_rank + 1, len(sorted_values) - 1)
+    return sorted_values[lower_rank] + (sorted_values[upper_rank] - sorted_values[lower_rank]) * (rank - lower_rank)
+
+def parse_weighted(specs : list, name : str) -> list:
+    """Converts "value=weight" strings into a list of (value, weight)."""
+    weighted = []
+    for spec in specs:
+        value, _, weight = spec.partition("=")
+        try:
+            weighted.append((value, float(weight) if weight else 1.0))
+        except ValueError as err:
+            raise ValueError(f"Invalid {name} {spec}, expected value=weight") from err
+    return weighted
+
+def parse_routes(specs : list) -> list:
+    """Converts "DEP:ARR=weight" strings into a list of ((dep, arr), weight)."""
+    routes = []
+    for route, weight in parse_weighted(specs, "route"):
+        departure_airport, _, arrival_airport = route.partition(":")
+        if not departure_airport or not arrival_airport:
+            raise ValueError(f"Invalid route {route}, expected DEP:ARR")
+        routes.append(((departure_airport, arrival_airport), weight))
+    return routes
+
+def free_port() -> int:
+    with socket.socket() as free_socket:
+        free_socket.bind(("127.0.0.1", 0))
+        return free_socket.getsockname()[1]
+
+def peak_rss_bytes(pid : int) -> int | None:
+    """Returns the peak resident set size of a process, if the platform
+    reports it (Linux's /proc)."""
+    try:
+        with open(f"/proc/{pid}/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def wait_until_up(url : str, process : subprocess.Popen, timeout : float = STARTUP_TIMEOUT) -> None:
+    import requests
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with code {process.returncode} before it was ready")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout} seconds")
+
+class StageRecorder:
+    """Collects latencies and errors per stage from every client thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # stage -> list of latencies in seconds
+        self.latencies = {}
+        # stage -> Counter of error kinds
+        self.errors = {}
+        self.recording = False
+
+    def record(self, stage : str, latency : float, error : str | None = None) -> None:
+        if not self.recording:
+            return
+        with self._lock:
+            if error is None:
+                self.latencies.setdefault(stage, []).append(latency)
+            else:
+                self.errors.setdefault(stage, Counter())[error] += 1
+
+    def summary(self, elapsed : float) -> dict:
+        stages = {}
+        for stage in sorted(set(self.latencies) | set(self.errors)):
+            latencies = self.latencies.get(stage, [])
+            errors = self.errors.get(stage, Counter())
+            total = len(latencies) + sum(errors.values())
+            stages[stage] = {
+                "count": len(latencies),
+                "throughput": len(latencies) / elapsed if elapsed > 0 else 0,
+                "p50": percentile(latencies, 0.50),
+                "p95": percentile(latencies, 0.95),
+                "p99": percentile(latencies, 0.99),
+                "max": max(latencies) if latencies else None,
+                "errors": dict(errors),
+                "error_rate": sum(errors.values()) / total if total else 0,
+            }
+        return stages
+
+class LoadClient:
+    """One simulated user, running weighted scenarios on weighted routes
+    until stop is set."""
+
+    def __init__(self, app_url : str, routes : list, scenarios : list, recorder : StageRecorder,
+                 stop : threading.Event, batch_size : int, follow_pages : int, seed : int):
+        import requests
+        self.session = requests.Session()
+        self.request_errors = (requests.RequestException,)
+        self.app_url = app_url.rstrip("/")
+        self.routes = routes
+        self.scenarios = scenarios
+        self.recorder = recorder
+        self.stop = stop
+        self.batch_size = batch_size
+        self.follow_pages = follow_pages
+        self.rng = random.Random(seed)
+
+    def pick_route(self) -> tuple:
+        return self.rng.choices([route for route, weight in self.routes], [weight for route, weight in self.routes])[0]
+
+    def timed(self, stage : str, method : str, path : str, check=None, **kwargs):
+        """Sends one request and records its latency, or the kind of error.
+
+        Returns the response, or None if it failed.
+        """
+        start_time = time.perf_counter()
+        try:
+            response = self.session.request(method, self.app_url + path, timeout=REQUEST_TIMEOUT, **kwargs)
+        except self.request_errors as err:
+            self.recorder.record(stage, time.perf_counter() - start_time, type(err).__name__)
+            return None
+        latency = time.perf_counter() - start_time
+
+        error = None
+        if response.status_code >= 400:
+            error = f"http_{response.status_code}"
+        elif check is not None:
+            error = check(response)
+        self.recorder.record(stage, latency, error)
+        return response if error is None else None
+
+    @staticmethod
+    def check_results_page(response) -> str | None:
+        # Backend exceptions are rendered as an HTML error page with HTTP 200
+        return "error_page" if "<h1>Error</h1>" in response.text else None
+
+    def run_query(self) -> None:
+        departure_airport, arrival_airport = self.pick_route()
+        response = self.timed("query", "POST", "/query/", self.check_results_page,
+                              data={"DepartureAirport": departure_airport, "ArrivalAirport": arrival_airport})
+        if response is not None and self.follow_pages:
+            self.follow_result_pages(response.text)
+
+    def follow_result_pages(self, page_html : str) -> None:
+        """Loads pages of the result the way the results table does as the user scrolls."""
+        marker = "/api/results/"
+        start = page_html.find(marker)
+        if start < 0:
+            return
+        results_path = page_html[start:page_html.find("/notams", start) + len("/notams")]
+        cursor = None
+        for page_number in range(self.follow_pages):
+            response = self.timed("result_page", "GET", results_path, params={"cursor": cursor} if cursor else {})
+            if response is None:
+                return
+            cursor = response.json().get("next_cursor")
+            if not cursor:
+                return
+
+    def run_job(self) -> None:
+        departure_airport, arrival_airport = self.pick_route()
+        start_time = time.perf_counter()
+        response = self.timed("job_submit", "POST", "/query/", data={
+            "DepartureAirport": departure_airport, "ArrivalAirport": arrival_airport, "mode": "job"})
+        if response is None:
+            return
+        job = response.json()
+        # Only the submit response has the job's urls
+        status_url, result_url = job["status_url"], job["result_url"]
+        while job.get("status") not in ("done", "failed"):
+            if self.stop.is_set():
+                return
+            time.sleep(JOB_POLL_INTERVAL)
+            response = self.timed("job_status", "GET", status_url)
+            if response is None:
+                return
+            job = response.json()
+        if job["status"] == "failed":
+            self.recorder.record("job", time.perf_counter() - start_time, "job_failed")
+            return
+        if self.timed("job_result", "GET", result_url, self.check_results_page) is not None:
+            self.recorder.record("job", time.perf_counter() - start_time)
+
+    def run_batch(self) -> None:
+        route_list = [list(self.pick_route()) for i in range(self.batch_size)]
+        def check_batch(response):
+            return "leg_error" if any(leg.get("error") for leg in response.json()["legs"]) else None
+        self.timed("batch", "POST", "/api/batch", check_batch, json={"routes": route_list})
+
+    def run(self) -> None:
+        scenario_runs = {"query": self.run_query, "job": self.run_job, "batch": self.run_batch}
+        while not self.stop.is_set():
+            scenario = self.rng.choices([name for name, weight in self.scenarios], [weight for name, weight in self.scenarios])[0]
+            scenario_runs[scenario]()
+
+def start_mock_server(args, port : int) -> subprocess.Popen:
+    command = [sys.executable, "-m", "benchmarks.FaaMockServer", "--port", str(port),
+               "--notams", str(args.faa_notams), "--seed", str(args.seed),
+               "--latency-ms", str(args.faa_latency_ms), "--latency-jitter-ms", str(args.faa_latency_jitter_ms),
+               "--rate-429", str(args.faa_rate_429),
+               "--client-id", LOAD_TEST_CREDENTIALS["client_id"], "--client-secret", LOAD_TEST_CREDENTIALS["client_secret"]]
+    if args.faa_requests_per_minute:
+        command += ["--requests-per-minute", str(args.faa_requests_per_minute)]
+    process = subprocess.Popen(command, cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_until_up(f"http://127.0.0.1:{port}/stats", process)
+    return process
+
+def start_app(faa_url : str, port : int, app_env : dict) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update(LOAD_TEST_CREDENTIALS)
+    env["NOTAM_FAA_API_ENTRYPOINT"] = faa_url
+    # The stand-in has no request budget unless --faa-requests-per-minute is given
+    env.setdefault("NOTAM_FAA_REQUESTS_PER_MINUTE", "1000000")
+    env.update(app_env)
+    command = [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(port), "--no-reload", "--no-debugger"]
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_until_up(f"http://127.0.0.1:{port}/", process)
+    return process
+
+def faa_request_count(stats_url : str) -> int:
+    import requests
+    return requests.get(stats_url, timeout=10).json().get("requests", 0)
+
+def run_load_test(args) -> dict:
+    """Starts the stand-in and the app (unless --app-url is given), runs the
+    clients and returns the results."""
+    from benchmarks.PipelineBenchmark import git_commit
+
+    processes = []
+    try:
+        faa_port = args.faa_port or free_port()
+        if args.app_url is None:
+            processes.append(start_mock_server(args, faa_port))
+            app_port = free_port()
+            app_env = dict(setting.split("=", 1) for setting in args.app_env)
+            processes.append(start_app(f"http://127.0.0.1:{faa_port}/notamapi/v1/notams", app_port, app_env))
+            app_url = f"http://127.0.0.1:{app_port}"
+        else:
+            app_url = args.app_url
+        stats_url = f"http://127.0.0.1:{faa_port}/stats"
+
+        recorder = StageRecorder()
+        stop = threading.Event()
+        routes = parse_routes(args.routes)
+        scenarios = parse_weighted(args.scenarios, "scenario")
+        unknown_scenarios = [name for name, weight in scenarios if name not in SCENARIOS]
+        if unknown_scenarios:
+            raise ValueError(f"Unknown scenario(s) {', '.join(unknown_scenarios)}, expected any of {', '.join(SCENARIOS)}")
+
+        clients = [LoadClient(app_url, routes, scenarios, recorder, stop, args.batch_size, args.follow_pages, args.seed + client_number)
+                   for client_number in range(args.concurrency)]
+        threads = [threading.Thread(target=client.run, daemon=True) for client in clients]
+        for thread in threads:
+            thread.start()
+
+        if args.warm_up > 0:
+            print(f"Warming up for {args.warm_up} seconds...", file=sys.stderr)
+            time.sleep(args.warm_up)
+        faa_requests_at_start = faa_request_count(stats_url)
+        recorder.recording = True
+        start_time = time.monotonic()
+        print(f"Running {args.concurrency} clients for {args.duration} seconds...", file=sys.stderr)
+        time.sleep(args.duration)
+        recorder.recording = False
+        elapsed = time.monotonic() - start_time
+        faa_requests = faa_request_count(stats_url) - faa_requests_at_start
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=REQUEST_TIMEOUT)
+
+        stages = recorder.summary(elapsed)
+        searches = sum(stages.get(stage, {}).get("count", 0) for stage in ("query", "job"))
+        searches += stages.get("batch", {}).get("count", 0) * args.batch_size
+        return {
+            "created": datetime.utcnow().isoformat() + "Z",
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "config": {
+                "concurrency": args.concurrency,
+                "duration": args.duration,
+                "warm_up": args.warm_up,
+                "routes": args.routes,
+                "scenarios": args.scenarios,
+                "batch_size": args.batch_size,
+                "follow_pages": args.follow_pages,
+                "app_env": args.app_env,
+                "faa_notams": args.faa_notams,
+                "faa_latency_ms": args.faa_latency_ms,
+                "faa_latency_jitter_ms": args.faa_latency_jitter_ms,
+                "faa_rate_429": args.faa_rate_429,
+                "faa_requests_per_minute": args.faa_requests_per_minute,
+            },
+            "elapsed": elapsed,
+            "routes_searched": searches,
+            "throughput": searches / elapsed if elapsed > 0 else 0,
+            "faa_requests": faa_requests,
+            "faa_requests_per_route": faa_requests / searches if searches else None,
+            "app_peak_rss_bytes": peak_rss_bytes(processes[-1].pid) if processes else None,
+            "stages": stages,
+        }
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)
+
+def compare_reports(baseline : dict, current : dict, threshold : float) -> list:
+    """Returns a description of every way current is more than threshold
+    times worse than baseline: a stage's p95 latency or error rate, or the
+    overall throughput."""
+    regressions = []
+    if baseline.get("throughput") and current["throughput"] * threshold < baseline["throughput"]:
+        regressions.append(f"throughput {baseline['throughput']:.2f}/s -> {current['throughput']:.2f}/s")
+    for stage, stage_result in current["stages"].items():
+        baseline_result = baseline["stages"].get(stage)
+        if not baseline_result:
+            continue
+        if baseline_result.get("p95") and stage_result.get("p95") and stage_result["p95"] > baseline_result["p95"] * threshold:
+            regressions.append(f"{stage} p95 {baseline_result['p95'] * 1000:.1f} ms -> {stage_result['p95'] * 1000:.1f} ms")
+        if stage_result["error_rate"] > max(baseline_result["error_rate"] * threshold, baseline_result["error_rate"] + 0.01):
+            regressions.append(f"{stage} error rate {baseline_result['error_rate']:.1%} -> {stage_result['error_rate']:.1%}")
+    return regressions
+
+def format_ms(seconds : float | None) -> str:
+    return "-" if seconds is None else f"{seconds * 1000:.1f}"
+
+def print_report(report : dict) -> None:
+    print(f"{'stage':<14}{'count':>8}{'per sec':>10}{'p50 (ms)':>11}{'p95 (ms)':>11}{'p99 (ms)':>11}{'errors':>9}")
+    for stage, stage_result in report["stages"].items():
+        print(f"{stage:<14}{stage_result['count']:>8}{stage_result['throughput']:>10.2f}{format_ms(stage_result['p50']):>11}"
+              f"{format_ms(stage_result['p95']):>11}{format_ms(stage_result['p99']):>11}{stage_result['error_rate']:>9.1%}")
+        for error, count in stage_result["errors"].items():
+            print(f"    {error}: {count}")
+    print(f"Routes searched: {report['routes_searched']} ({report['throughput']:.2f}/s)")
+    if report["faa_requests_per_route"] is not None:
+        print(f"FAA API calls: {report['faa_requests']} ({report['faa_requests_per_route']:.2f} per route)")
+    if report["app_peak_rss_bytes"] is not None:
+        print(f"App peak RSS: {report['app_peak_rss_bytes'] / 2**20:.1f} MiB")
+
+def main(argv : list | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Load tests the NOTAM search app against a local FAA API stand-in.")
+    parser.add_argument("--concurrency", type=int, default=4, help="number of simulated users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to measure for")
+    parser.add_argument("--warm-up", type=float, default=5, help="seconds to run before measuring")
+    parser.add_argument("--routes", nargs="+", default=DEFAULT_ROUTES, help="route mix as DEP:ARR=weight")
+    parser.add_argument("--scenarios", nargs="+", default=DEFAULT_SCENARIOS, help=f"scenario mix as name=weight, any of {', '.join(SCENARIOS)}")
+    parser.add_argument("--batch-size", type=int, default=5, help="routes per batch scenario request")
+    parser.add_argument("--follow-pages", type=int, default=0, help="result pages loaded after each search")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--app-url", help="load test an already running app instead of starting one")
+    parser.add_argument("--app-env", action="append", default=[], help="KEY=VALUE setting for the started app")
+    parser.add_argument("--faa-port", type=int, help="port of the FAA stand-in, needed with --app-url")
+    parser.add_argument("--faa-notams", type=int, default=50000)
+    parser.add_argument("--faa-latency-ms", type=float, default=50)
+    parser.add_argument("--faa-latency-jitter-ms", type=float, default=50)
+    parser.add_argument("--faa-rate-429", type=float, default=0)
+    parser.add_argument("--faa-requests-per-minute", type=int)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="results JSON file of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help="slowdown ratio that counts as a regression")
+    args = parser.parse_args(argv)
+    if args.app_url is not None and args.faa_port is None:
+        parser.error("--faa-port is required with --app-url, to count FAA API calls")
+
+    report = run_load_test(args)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_reports(baseline, report, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"Nothing is more than {args.threshold:.2f}x worse than {args.compare}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+import os
+import tempfile
+from unittest import mock
+from benchmarks.FaaMockServer import FaaMockServer, MockConfig, NotamDataset
+
+# Points NotamFetch at a FaaMockServer for the tests, e.g.
+#   self.server = self.enterContext(MockFaaApi(items, airports=AIRPORTS))
+# Everything it changes is put back when the context exits.
+
+# credentials the server checks and NotamFetch sends
+MOCK_CREDENTIALS = {"client_id": "mock", "client_secret": "mock"}
+
+class MockFaaApi:
+    """Runs a FaaMockServer serving items and sends NotamFetch's requests to it.
+
+    Parameters
+    ----------
+    items : list
+        FAA API items to serve, e.g. from NotamGenerator.generate_notam_items.
+    config : MockConfig | None
+        Behavior of the server, expecting MOCK_CREDENTIALS by default.
+    airports : list | None
+        If set, the airport database NavigationTools plans routes with.
+    """
+
+    def __init__(self, items : list, config : MockConfig | None = None, airports : list | None = None):
+        self.server = FaaMockServer(NotamDataset(items), config or MockConfig(**MOCK_CREDENTIALS))
+        self.airports = airports
+        self._patches = []
+        self._temporary_directory = None
+
+    def __enter__(self) -> FaaMockServer:
+        import NavigationTools
+        import NotamFetch
+
+        self.server.start()
+        # No .env file, the credentials come from the environment
+        self._temporary_directory = tempfile.TemporaryDirectory()
+        self._patches = [
+            mock.patch.object(NotamFetch, "FAA_API_ENTRYPOINT", self.server.url),
+            mock.patch.object(NotamFetch, "credentials", dict(MOCK_CREDENTIALS)),
+            mock.patch.dict(os.environ, MOCK_CREDENTIALS),
+            mock.patch.object(NotamFetch, "ENV_FILE_DIR", os.path.join(self._temporary_directory.name, ".env")),
+        ]
+        if self.airports is not None:
+            self._patches += [
+                mock.patch.object(NavigationTools, "database", self.airports),
+                mock.patch.object(NavigationTools, "airport_codes", NavigationTools.build_code_lookup(self.airports)),
+            ]
+        for patch in self._patches:
+            patch.start()
+        return self.server
+
+    def __exit__(self, *exc_info) -> None:
+        for patch in reversed(self._patches):
+            patch.stop()
+        self._patches = []
+        self.server.stop()
+        self._temporary_directory.cleanup()
@@ -0,0 +1,156 @@
+import math
+import random
+from datetime import datetime, timedelta
+
+# Synthetic FAA NOTAM API payloads for benchmarks and load tests. The items
+# follow the GeoJSON shape of /notamapi/v1/notams responses closely enough to
+# go through Notam, NotamSort.RatingSort and the fetch code unchanged.
+
+# Center and spread (in degrees) of generated NOTAMs when no area is given,
+# roughly the continental US
+CONUS_CENTER = (39.0, -98.0)
+CONUS_SPREAD = (12.0, 26.0)
+
+NOTAM_TEXTS = [
+    "RWY 17L/35R CLSD",
+    "TWY B BTN TWY B3 AND TWY B5 CLSD",
+    "ILS RWY 35R LOC/GP U/S",
+    "OBST CRANE (ASN 2024-ASW-1234-NRA) 353012N0973512W (1.2NM N APCH END RWY 17L) 1450FT (210FT AGL) FLAGGED AND LGTD",
+    "AD AP BCN U/S",
+    "NAV VOR U/S",
+    "AIRSPACE UAS WI AN AREA DEFINED AS .5NM RADIUS OF 3524N09736W SFC-400FT AGL",
+    "!FDC 4/1234 ZFW TX..AIRSPACE DALLAS, TX..TEMPORARY FLIGHT RESTRICTIONS",
+    "RWY 13/31 SFC CONDITION REPORTED WET",
+    "APRON NORTH RAMP CLSD TO ACFT OVER 12500LBS",
+    "OBST TOWER LGT (ASR 1234567) 352412N0973604W (4.1NM WSW OKC) 1049FT (299FT AGL) U/S",
+    "COM ATIS FREQ 125.85 U/S",
+]
+NOTAM_TYPES = ["N", "N", "N", "R", "C"]
+CLASSIFICATIONS = ["DOM", "DOM", "DOM", "FDC", "INTL", "MIL"]
+SELECTION_CODES = ["QMRLC", "QMXLC", "QICAS", "QOBCE", "QNVAS", "QFAAH", "QWULW", "QRTCA", "QMNLC", "QCAAS"]
+TRAFFIC = ["IV", "I", "V", None]
+PURPOSES = ["NBO", "BO", "M", "B", "SCHEDULED", None]
+SCOPES = ["A", "E", "W", "AE", "AW", None]
+AIRPORTS = [("OKC", "KOKC"), ("DFW", "KDFW"), ("MCI", "KMCI"), ("DAL", "KDAL"), ("OUN", "KOUN"),
+            ("LAX", "KLAX"), ("ORD", "KORD"), ("DEN", "KDEN"), ("ATL", "KATL"), ("JFK", "KJFK")]
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+def format_coordinates(latitude : float, longitude : float) -> str:
+    """Formats decimal degrees the way the FAA API does, e.g. 3524N09736W."""
+    latitude_minutes = round(abs(latitude) * 60)
+    longitude_minutes = round(abs(longitude) * 60)
+    return (f"{latitude_minutes // 60:02d}{latitude_minutes % 60:02d}{'N' if latitude >= 0 else 'S'}"
+            f"{longitude_minutes // 60:03d}{longitude_minutes % 60:02d}{'E' if longitude >= 0 else 'W'}")
+
+def format_date(date : datetime) -> str:
+    return date.strftime(DATE_FORMAT)[:-4] + "Z"
+
+def random_location(rng : random.Random, center : tuple | None, radius_nm : float | None) -> tuple:
+    """Returns a random (latitude, longitude) within radius_nm of center, or
+    anywhere over the continental US if no center is given."""
+    if center is None:
+        return (CONUS_CENTER[0] + rng.uniform(-CONUS_SPREAD[0], CONUS_SPREAD[0]) / 2,
+                CONUS_CENTER[1] + rng.uniform(-CONUS_SPREAD[1], CONUS_SPREAD[1]) / 2)
+    distance_degrees = (radius_nm or 25) / 60 * math.sqrt(rng.random())
+    angle = rng.uniform(0, 2 * math.pi)
+    latitude = center[0] + distance_degrees * math.cos(angle)
+    longitude = center[1] + distance_degrees * math.sin(angle) / max(math.cos(math.radians(center[0])), 0.01)
+    return (max(-90.0, min(90.0, latitude)), max(-180.0, min(180.0, longitude)))
+
+def generate_notam_item(rng : random.Random, notam_number : int, now : datetime,
+                        center : tuple | None = None, radius_nm : float | None = None) -> dict:
+    """Returns one synthetic NOTAM in the FAA API's GeoJSON item format."""
+    latitude, longitude = random_location(rng, center, radius_nm)
+    location, icao_location = rng.choice(AIRPORTS)
+    issued = now - timedelta(days=rng.randint(0, 120), minutes=rng.randint(0, 1439))
+    effective_start = issued + timedelta(hours=rng.randint(0, 48))
+    # About a tenth have already ended and a fifth are permanent
+    end_roll = rng.random()
+    if end_roll < 0.1:
+        effective_end = format_date(now - timedelta(hours=rng.randint(1, 240)))
+    elif end_roll < 0.3:
+        effective_end = "PERM"
+    else:
+        effective_end = format_date(now + timedelta(hours=rng.randint(1, 24 * 90)))
+
+    return {
+        "type": "Feature",
+        "properties": {
+            "coreNOTAMData": {
+                "notam": {
+                    "id": f"NOTAM_1_{notam_number:08d}",
+                    "series": "A",
+                    "number": f"{issued.month:02d}/{notam_number % 1000:03d}",
+                    "type": rng.choice(NOTAM_TYPES),
+                    "issued": format_date(issued),
+                    "affectedFIR": "ZFW",
+                    "selectionCode": rng.choice(SELECTION_CODES),
+                    "traffic": rng.choice(TRAFFIC),
+                    "purpose": rng.choice(PURPOSES),
+                    "scope": rng.choice(SCOPES),
+                    "minimumFL": "000",
+                    "maximumFL": "999",
+                    "location": location,
+                    "effectiveStart": format_date(effective_start),
+                    "effectiveEnd": effective_end,
+                    "text": rng.choice(NOTAM_TEXTS),
+                    "classification": rng.choice(CLASSIFICATIONS),
+                    "accountId": location,
+                    "lastUpdated": format_date(issued),
+                    "icaoLocation": icao_location,
+                    "coordinates": format_coordinates(latitude, longitude),
+                    "radius": f"{rng.choice([1, 3, 5, 5, 10, 25]):03d}",
+                }
+            }
+        },
+        "geometry": {
+            "type": "Point",
+            "coordinates": [round(longitude, 5), round(latitude, 5)],
+        },
+    }
+
+def iter_notam_items(count : int, seed : int = 0, center : tuple | None = None, radius_nm : float | None = None,
+                     duplicate_fraction : float = 0.0, now : datetime | None = None):
+    """Yields count synthetic NOTAM items without holding them all in memory.
+
+    Parameters
+    ----------
+    count : int
+        Number of items to generate.
+    seed : int
+        The same seed always gives the same items.
+    center : tuple
+        (latitude, longitude) to place the NOTAMs around. Spread over the
+        continental US if None.
+    radius_nm : float
+        Distance from center that NOTAMs are placed within.
+    duplicate_fraction : float
+        Fraction of items that repeat an earlier NOTAM id, the way
+        overlapping request areas return the same NOTAM more than once.
+    now : datetime
+        Time the dates are generated around, defaults to the current hour.
+    """
+    rng = random.Random(seed)
+    now = now or datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    for notam_number in range(count):
+        item_number = notam_number
+        if notam_number > 0 and rng.random() < duplicate_fraction:
+            # Regenerate an earlier item exactly
+            item_number = rng.randrange(notam_number)
+        yield generate_notam_item(random.Random(f"{seed}-{item_number}"), item_number, now, center, radius_nm)
+
+def generate_notam_items(count : int, **kwargs) -> list:
+    """Returns a list of count synthetic NOTAM items, see iter_notam_items."""
+    return list(iter_notam_items(count, **kwargs))
+
+def build_page(items : list, page_num : int, page_size : int) -> dict:
+    """Returns one page of items in the FAA API's response format."""
+    total_pages = max(1, math.ceil(len(items) / page_size))
+    start = (page_num - 1) * page_size
+    return {
+        "pageSize": page_size,
+        "pageNum": page_num,
+        "totalCount": len(items),
+        "totalPages": total_pages,
+        "items": items[start:start + page_size],
+    }
@@ -0,0 +1,184 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+# Times each stage of the search pipeline on synthetic NOTAMs.
+#
+# Run from the repository root:
+#   python3 -m benchmarks.PipelineBenchmark --sizes 1000 10000 --output bench.json
+# and compare a later run against it:
+#   python3 -m benchmarks.PipelineBenchmark --sizes 1000 10000 --compare bench.json
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = [1000, 10000, 100000]
+# a stage counts as regressed when it is this much slower than the baseline
+DEFAULT_REGRESSION_THRESHOLD = 1.25
+# fraction of fetched items that repeat a NOTAM from another request area
+DUPLICATE_FRACTION = 0.2
+# routes timed by the get_points_between stage
+BENCHMARK_ROUTES = [
+    ((35.3931, -97.6007), (32.8968, -97.0380)),   # OKC - DFW
+    ((33.9425, -118.4081), (40.6398, -73.7789)),  # LAX - JFK
+    ((47.6062, -122.3321), (25.7959, -80.2870)),  # SEA - MIA
+]
+# airport codes timed by the airport_lookup stage, including a miss
+BENCHMARK_AIRPORTS = ["OKC", "KDFW", "LAX", "KJFK", "1K4", "ZZZZ"]
+
+def time_stage(stage, repeat : int, warm_up : bool = False) -> dict:
+    """Runs stage() repeat times and returns its timings in seconds.
+
+    With warm_up, stage() runs once untimed first so lazy imports and
+    caches don't count against the first run.
+    """
+    if warm_up:
+        stage()
+    timings = []
+    for i in range(repeat):
+        start_time = time.perf_counter()
+        stage()
+        timings.append(time.perf_counter() - start_time)
+    return {"best": min(timings), "median": statistics.median(timings), "runs": timings}
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def benchmark_size(size : int, repeat : int) -> dict:
+    """Times every NOTAM stage on size synthetic items."""
+    import NavigationTools
+    import NotamFetch
+    import NotamSort
+    from Notam import Notam
+    from benchmarks import NotamGenerator
+
+    items = NotamGenerator.generate_notam_items(size, seed=size, duplicate_fraction=DUPLICATE_FRACTION)
+    results = {}
+
+    results["notam_construction"] = time_stage(lambda: [Notam(item) for item in items], repeat)
+    notams = [Notam(item) for item in items]
+
+    results["set_dedup"] = time_stage(lambda: set(notams), repeat)
+    unique_notams = list(set(notams))
+
+    route_points = [NavigationTools.PointObject(*point) for point in BENCHMARK_ROUTES[0]]
+    results["corridor_filter"] = time_stage(lambda: NotamFetch.filter_route_corridor(unique_notams, route_points, NotamFetch.NOTAM_RADIUS), repeat)
+
+    results["expiry_filter"] = time_stage(lambda: NotamFetch.remove_expired_notams(unique_notams), repeat)
+    current_notams = NotamFetch.remove_expired_notams(unique_notams)
+
+    sort_list = NotamSort.RatingSort()
+    results["scoring"] = time_stage(lambda: sort_list.scoring(current_notams, "OKC", "DFW"), repeat)
+    results["sort"] = time_stage(lambda: sort_list.sort(list(current_notams), "OKC", "DFW"), repeat)
+
+    for stage_result in results.values():
+        stage_result["per_item_us"] = stage_result["best"] / size * 1e6
+    return results
+
+def benchmark_navigation(repeat : int) -> dict:
+    """Times path generation and airport lookups, which don't depend on the
+    number of NOTAMs."""
+    import NavigationTools
+    import NotamFetch
+
+    results = {}
+    routes = [(NavigationTools.PointObject(*start), NavigationTools.PointObject(*end)) for start, end in BENCHMARK_ROUTES]
+    results["get_points_between"] = time_stage(
+        lambda: [NotamFetch.get_points_between(start, end, NotamFetch.DEFAULT_PATH_STEP_SIZE_NM) for start, end in routes], repeat, warm_up=True)
+
+    if os.path.exists(NavigationTools.DATABASE_FILE_DIR):
+        def look_up_airports():
+            for airport in BENCHMARK_AIRPORTS:
+                try:
+                    NavigationTools.get_valid_US_airport(airport, None)
+                except ValueError:
+                    pass
+        NavigationTools.load_database_file()
+        results["airport_lookup"] = time_stage(look_up_airports, repeat, warm_up=True)
+    else:
+        results["airport_lookup"] = {"skipped": f"no airport database at {NavigationTools.DATABASE_FILE_DIR}"}
+    return results
+
+def run_benchmarks(sizes : list, repeat : int) -> dict:
+    """Runs every stage and returns the results in the baseline format."""
+    report = {
+        "created": datetime.utcnow().isoformat() + "Z",
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "stages": {},
+    }
+    for size in sizes:
+        print(f"Benchmarking {size} NOTAMs...", file=sys.stderr)
+        for stage_name, stage_result in benchmark_size(size, repeat).items():
+            report["stages"][f"{stage_name}[{size}]"] = stage_result
+    for stage_name, stage_result in benchmark_navigation(repeat).items():
+        report["stages"][stage_name] = stage_result
+    return report
+
+def compare_reports(baseline : dict, current : dict, threshold : float) -> list:
+    """Returns (stage, baseline seconds, current seconds, ratio) for every
+    stage that is more than threshold times slower than the baseline."""
+    regressions = []
+    for stage_name, stage_result in current["stages"].items():
+        baseline_result = baseline["stages"].get(stage_name)
+        if not baseline_result or "best" not in baseline_result or "best" not in stage_result:
+            continue
+        ratio = stage_result["best"] / baseline_result["best"] if baseline_result["best"] > 0 else float("inf")
+        if ratio > threshold:
+            regressions.append((stage_name, baseline_result["best"], stage_result["best"], ratio))
+    return regressions
+
+def print_report(report : dict) -> None:
+    print(f"{'stage':<32}{'best (ms)':>12}{'median (ms)':>14}{'per item (us)':>16}")
+    for stage_name, stage_result in report["stages"].items():
+        if "skipped" in stage_result:
+            print(f"{stage_name:<32}  skipped: {stage_result['skipped']}")
+            continue
+        per_item = f"{stage_result['per_item_us']:.2f}" if "per_item_us" in stage_result else "-"
+        print(f"{stage_name:<32}{stage_result['best'] * 1000:>12.2f}{stage_result['median'] * 1000:>14.2f}{per_item:>16}")
+
+def main(argv : list | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Times each stage of the NOTAM pipeline on synthetic data.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="numbers of NOTAMs to benchmark with, up to 1000000")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage, the best one is reported")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help="slowdown ratio that counts as a regression")
+    args = parser.parse_args(argv)
+
+    # Files named on the command line are relative to where it was run
+    output_path = os.path.abspath(args.output) if args.output else None
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    # The ranking files and airport database are found relative to the repository root
+    os.chdir(REPO_ROOT)
+    report = run_benchmarks(args.sizes, args.repeat)
+    print_report(report)
+
+    if output_path:
+        with open(output_path, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+
+    if compare_path:
+        with open(compare_path) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_reports(baseline, report, args.threshold)
+        for stage_name, baseline_time, current_time, ratio in regressions:
+            print(f"REGRESSION {stage_name}: {baseline_time * 1000:.2f} ms -> {current_time * 1000:.2f} ms ({ratio:.2f}x)")
+        if regressions:
+            return 1
+        print(f"No stage is more than {args.threshold:.2f}x slower than {args.compare}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
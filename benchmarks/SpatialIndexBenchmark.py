@@ -0,0 +1,122 @@
+import argparse
+import json
+import random
+import sys
+import time
+
+# Compares SpatialIndex queries against a linear scan over every NOTAM
+# circle, and checks both return the same NOTAMs.
+#
+# Run from the repository root:
+#   python3 -m benchmarks.SpatialIndexBenchmark --sizes 10000 100000 500000
+
+DEFAULT_SIZES = [10000, 100000]
+# queries of each kind timed per size
+DEFAULT_QUERY_COUNT = 100
+# radius of circle queries and half width of polyline queries, in nautical miles
+QUERY_RADIUS_NM = 25
+# NOTAM radii in nautical miles and their weights: mostly small areas and a
+# few FIR-wide NOTAMs, like the FAA data
+NOTAM_RADII = [0, 1, 3, 5, 10, 25, 999]
+NOTAM_RADIUS_WEIGHTS = [20, 20, 15, 30, 10, 4.9, 0.1]
+
+def random_circles(count : int, seed : int) -> list:
+    """Returns count (key, latitude, longitude, radius_nm) over the continental US."""
+    from benchmarks.NotamGenerator import CONUS_CENTER, CONUS_SPREAD
+    rng = random.Random(seed)
+    return [(key,
+             CONUS_CENTER[0] + rng.uniform(-CONUS_SPREAD[0], CONUS_SPREAD[0]) / 2,
+             CONUS_CENTER[1] + rng.uniform(-CONUS_SPREAD[1], CONUS_SPREAD[1]) / 2,
+             rng.choices(NOTAM_RADII, NOTAM_RADIUS_WEIGHTS)[0]) for key in range(count)]
+
+def random_routes(count : int, seed : int) -> list:
+    """Returns count routes of 2 to 4 points over the continental US."""
+    circles = random_circles(count * 4, seed)
+    rng = random.Random(seed)
+    routes = []
+    for route_number in range(count):
+        point_count = rng.randint(2, 4)
+        routes.append([(latitude, longitude) for key, latitude, longitude, radius in circles[route_number * 4:route_number * 4 + point_count]])
+    return routes
+
+def linear_circle(circles : list, latitude : float, longitude : float, radius_nm : float) -> list:
+    from NavigationTools import get_distance_nm
+    return [key for key, circle_latitude, circle_longitude, circle_radius in circles
+            if get_distance_nm(latitude, longitude, circle_latitude, circle_longitude) <= radius_nm + circle_radius]
+
+def linear_polyline(circles : list, points : list, buffer_nm : float) -> list:
+    from NavigationTools import get_distance_to_segment_nm
+    segments = list(zip(points, points[1:]))
+    return [key for key, latitude, longitude, radius in circles
+            if any(get_distance_to_segment_nm(latitude, longitude, start[0], start[1], end[0], end[1]) <= buffer_nm + radius
+                   for start, end in segments)]
+
+def time_queries(run_query, queries : list) -> tuple:
+    """Returns the seconds per query and the results of run_query(*query) for each query."""
+    start_time = time.perf_counter()
+    results = [set(run_query(*query)) for query in queries]
+    return (time.perf_counter() - start_time) / len(queries), results
+
+def benchmark_size(size : int, query_count : int, linear : bool = True) -> dict:
+    from SpatialIndex import SpatialIndex
+
+    circles = random_circles(size, seed=size)
+    start_time = time.perf_counter()
+    index = SpatialIndex()
+    for key, latitude, longitude, radius in circles:
+        index.insert(key, latitude, longitude, radius)
+    results = {"build_seconds": time.perf_counter() - start_time}
+
+    query_circles = random_circles(query_count, seed=size + 1)
+    queries = {
+        "point": (index.query_point, lambda latitude, longitude: linear_circle(circles, latitude, longitude, 0),
+                  [(latitude, longitude) for key, latitude, longitude, radius in query_circles]),
+        "circle": (index.query_circle, lambda latitude, longitude, radius_nm: linear_circle(circles, latitude, longitude, radius_nm),
+                   [(latitude, longitude, QUERY_RADIUS_NM) for key, latitude, longitude, radius in query_circles]),
+        # Polylines are slower to scan, so fewer of them are timed
+        "polyline": (index.query_polyline, lambda points, buffer_nm: linear_polyline(circles, points, buffer_nm),
+                     [(route, QUERY_RADIUS_NM) for route in random_routes(max(1, query_count // 10), seed=size + 2)]),
+    }
+    for query_name, (index_query, linear_query, query_arguments) in queries.items():
+        index_seconds, index_results = time_queries(index_query, query_arguments)
+        query_result = {"index_ms": index_seconds * 1000, "mean_results": sum(map(len, index_results)) / len(index_results)}
+        if linear:
+            linear_seconds, linear_results = time_queries(linear_query, query_arguments)
+            if linear_results != index_results:
+                raise RuntimeError(f"Error: index and linear scan disagree on {query_name} queries over {size} NOTAMs")
+            query_result["linear_ms"] = linear_seconds * 1000
+            query_result["speedup"] = linear_seconds / index_seconds if index_seconds > 0 else float("inf")
+        results[query_name] = query_result
+    return results
+
+def print_report(report : dict) -> None:
+    print(f"{'NOTAMs':>10}{'query':>10}{'index (ms)':>12}{'linear (ms)':>13}{'speedup':>10}{'results':>10}")
+    for size, size_result in report["sizes"].items():
+        print(f"{size:>10}{'build':>10}{size_result['build_seconds'] * 1000:>12.1f}")
+        for query_name in ("point", "circle", "polyline"):
+            query_result = size_result[query_name]
+            linear_ms = f"{query_result['linear_ms']:.2f}" if "linear_ms" in query_result else "-"
+            speedup = f"{query_result['speedup']:.0f}x" if "speedup" in query_result else "-"
+            print(f"{'':>10}{query_name:>10}{query_result['index_ms']:>12.3f}{linear_ms:>13}{speedup:>10}{query_result['mean_results']:>10.1f}")
+
+def main(argv : list | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Compares SpatialIndex queries with a linear scan.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="numbers of NOTAM circles to index")
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERY_COUNT, help="point and circle queries per size")
+    parser.add_argument("--no-linear", action="store_true", help="only time the index, for sizes too large to scan")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    report = {"query_radius_nm": QUERY_RADIUS_NM, "sizes": {}}
+    for size in args.sizes:
+        print(f"Benchmarking {size} NOTAMs...", file=sys.stderr)
+        report["sizes"][size] = benchmark_size(size, args.queries, linear=not args.no_linear)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import threading
+import unittest
+from AdaptiveConcurrency import AdaptiveLimiter, MIN_LATENCY_SAMPLES
+
+# Run these tests with `python3 -m unittest tests/AdaptiveConcurrencyTests.py`
+
+class TestAdaptiveLimiter(unittest.TestCase) :
+
+    def test_additive_increase(self) :
+        limiter = AdaptiveLimiter(initial_limit=4, max_limit=6)
+        # A full window of healthy responses raises the limit by about one
+        for i in range(4) :
+            self.assertTrue(limiter.acquire(timeout=0))
+            limiter.release(latency=0.1)
+        self.assertAlmostEqual(limiter.limit, 5, delta=0.2)
+        for i in range(100) :
+            limiter.acquire(timeout=0)
+            limiter.release(latency=0.1)
+        self.assertEqual(limiter.limit, 6)
+
+    def test_multiplicative_decrease_with_cooldown(self) :
+        limiter = AdaptiveLimiter(initial_limit=16, decrease_cooldown=60)
+        for i in range(3) :
+            limiter.acquire(timeout=0)
+        # Requests sent before the backoff report the same overload, only one counts
+        for i in range(3) :
+            limiter.release(overloaded=True)
+        self.assertEqual(limiter.limit, 8)
+        self.assertEqual(limiter.decreases, 1)
+        self.assertEqual(limiter.in_flight, 0)
+
+        limiter = AdaptiveLimiter(initial_limit=3, min_limit=2, decrease_cooldown=0)
+        for i in range(3) :
+            limiter.acquire(timeout=0)
+            limiter.release(overloaded=True)
+        self.assertEqual(limiter.limit, 2)
+
+    def test_latency_spike_backs_off(self) :
+        limiter = AdaptiveLimiter(initial_limit=10, max_limit=10)
+        for i in range(MIN_LATENCY_SAMPLES) :
+            limiter.acquire(timeout=0)
+            limiter.release(latency=0.1)
+        limiter.acquire(timeout=0)
+        limiter.release(latency=1.0)
+        self.assertEqual(limiter.limit, 5)
+
+    def test_acquire_waits_for_a_slot(self) :
+        limiter = AdaptiveLimiter(initial_limit=1)
+        self.assertTrue(limiter.acquire(timeout=0))
+        self.assertFalse(limiter.acquire(timeout=0.01))
+        threading.Timer(0.05, limiter.release, kwargs={"latency": 0.05}).start()
+        self.assertTrue(limiter.acquire(timeout=5))
+
+    def test_converges_on_capacity(self) :
+        # Simulate an API that answers 429 whenever more than capacity
+        # requests are in flight at once
+        capacity = 12
+        limiter = AdaptiveLimiter(initial_limit=1, max_limit=50, decrease_cooldown=0)
+        limits = []
+        for round_number in range(300) :
+            in_flight = int(limiter.limit)
+            for i in range(in_flight) :
+                limiter.acquire(timeout=0)
+            for i in range(in_flight) :
+                limiter.release(latency=0.1, overloaded=in_flight > capacity and i == 0)
+            limits.append(limiter.limit)
+        settled_limits = limits[100:]
+        self.assertLessEqual(max(settled_limits), capacity + 2)
+        self.assertGreaterEqual(sum(settled_limits) / len(settled_limits), capacity * 0.6)
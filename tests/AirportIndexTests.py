@@ -0,0 +1,60 @@
+import random
+import string
+import time
+import unittest
+import AirportIndex
+
+# Run these tests with `python3 -m unittest tests/AirportIndexTests.py`
+
+def make_airport(ident, icao_id, name, state="OK", country="UNITED STATES") :
+    return {"properties": {"IDENT": ident, "ICAO_ID": icao_id, "NAME": name, "STATE": state, "COUNTRY": country},
+            "geometry": {"coordinates": [-97.0, 35.0, 0]}}
+
+AIRPORTS = [
+    make_airport("OKC", "KOKC", "WILL ROGERS WORLD"),
+    make_airport("OK1", None, "OKMULGEE REGIONAL"),
+    make_airport("PWA", "KPWA", "WILEY POST"),
+    make_airport("ANC", "PANC", "TED STEVENS ANCHORAGE INTL", state="AK"),
+    make_airport("YYZ", "CYYZ", "TORONTO PEARSON INTL", state="ON", country="CANADA"),
+]
+
+class TestAirportIndex(unittest.TestCase) :
+
+    def test_ranking(self) :
+        index = AirportIndex.AirportIndex(AIRPORTS)
+        self.assertEqual([airport["ident"] for airport in index.suggest("OK")], ["OKC", "OK1"])
+        self.assertEqual([airport["ident"] for airport in index.suggest("OK1")], ["OK1"])
+        # Name words match after codes
+        self.assertEqual([airport["ident"] for airport in index.suggest("WIL")], ["OKC", "PWA"])
+        self.assertEqual([airport["ident"] for airport in index.suggest("ROGERS W")], ["OKC"])
+        self.assertEqual([airport["ident"] for airport in index.suggest("KP")], ["PWA"])
+
+    def test_only_continental_airports(self) :
+        index = AirportIndex.AirportIndex(AIRPORTS)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.suggest("PANC"), ())
+        self.assertEqual(index.suggest("TORONTO"), ())
+        self.assertEqual(index.suggest(""), ())
+
+    def test_query_and_limit_parsing(self) :
+        self.assertEqual(AirportIndex.normalize_query("  will   rogers "), "WILL ROGERS")
+        self.assertEqual(AirportIndex.parse_limit(None), AirportIndex.DEFAULT_SUGGESTION_LIMIT)
+        with self.assertRaises(ValueError) :
+            AirportIndex.parse_limit("0")
+        with self.assertRaises(ValueError) :
+            AirportIndex.parse_limit(str(AirportIndex.MAX_SUGGESTION_LIMIT + 1))
+
+    def test_lookup_speed_at_database_size(self) :
+        rng = random.Random(0)
+        words = ["".join(rng.choices(string.ascii_uppercase, k=rng.randint(3, 9))) for _ in range(3000)]
+        airports = [make_airport("".join(rng.choices(string.ascii_uppercase + string.digits, k=rng.choice((3, 4)))),
+                                 None if rng.random() < 0.8 else "K" + "".join(rng.choices(string.ascii_uppercase, k=3)),
+                                 " ".join(rng.choices(words, k=rng.randint(1, 4))))
+                    for _ in range(20_000)]
+        index = AirportIndex.AirportIndex(airports)
+
+        started = time.perf_counter()
+        for prefix in string.ascii_uppercase :
+            self.assertEqual(len(index._suggest(prefix)), AirportIndex.DEFAULT_SUGGESTION_LIMIT)
+        # Single letters match the most airports, the slowest case
+        self.assertLess((time.perf_counter() - started) / len(string.ascii_uppercase), 0.02)
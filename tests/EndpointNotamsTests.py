@@ -0,0 +1,38 @@
+import unittest
+from io import StringIO
+from benchmarks import NotamGenerator
+from benchmarks.MockFaaApi import MockFaaApi
+import NotamFetch
+from NavigationTools import PointObject
+
+# Run these tests with `python3 -m unittest tests/EndpointNotamsTests.py`
+
+OKC = (35.3931, -97.6007)
+AIRPORTS = [
+    {"properties": {"IDENT": ident, "ICAO_ID": "K" + ident, "NAME": ident, "STATE": "OK", "COUNTRY": "UNITED STATES"},
+     "geometry": {"coordinates": [longitude, latitude, 0]}}
+    for ident, latitude, longitude in (("OKC", 35.3931, -97.6007), ("DFW", 32.8968, -97.038))
+]
+
+class TestEndpointNotams(unittest.TestCase) :
+
+    def setUp(self) :
+        items = NotamGenerator.generate_notam_items(300, seed=6, center=OKC, radius_nm=200)
+        self.server = self.enterContext(MockFaaApi(items, airports=AIRPORTS))
+
+    def test_areas_reported_as_they_finish(self) :
+        area_list = [(PointObject(OKC[0] - offset, OKC[1]), 25) for offset in (0, 0.5, 1, 1.5)]
+        reported = {}
+        area_notam_sets = NotamFetch.get_notams_for_areas(area_list, StringIO(), lambda index, notams : reported.setdefault(index, notams))
+        self.assertEqual(reported, dict(enumerate(area_notam_sets)))
+
+    def test_endpoints_ranked_before_the_route(self) :
+        endpoint_results = []
+        sorted_notams, point_list, request_radius = NotamFetch.find_route_notams("OKC", "DFW", StringIO(), on_endpoints=endpoint_results.append)
+        self.assertEqual(len(endpoint_results), 1)
+        endpoint_notams = endpoint_results[0]
+        self.assertTrue(endpoint_notams)
+        self.assertLess(len(endpoint_notams), len(sorted_notams))
+        # The early rows are the same NOTAMs, in the same order, as in the full ranking
+        endpoint_ids = {notam.id for notam in endpoint_notams}
+        self.assertEqual([notam.id for notam in endpoint_notams], [notam.id for notam in sorted_notams if notam.id in endpoint_ids])
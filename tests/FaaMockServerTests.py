@@ -0,0 +1,51 @@
+import unittest
+from io import StringIO
+from benchmarks import NotamGenerator
+from benchmarks.FaaMockServer import MockConfig, distance_nm
+from benchmarks.MockFaaApi import MOCK_CREDENTIALS, MockFaaApi
+import NotamFetch
+from NavigationTools import PointObject
+
+# Run these tests with `python3 -m unittest tests/FaaMockServerTests.py`
+
+OKC = (35.3931, -97.6007)
+
+class TestFaaMockServer(unittest.TestCase) :
+
+    def start_server(self, items, **config) :
+        return self.enterContext(MockFaaApi(items, MockConfig(**MOCK_CREDENTIALS, **config)))
+
+    def test_radius_filter_and_paging(self) :
+        near_items = NotamGenerator.generate_notam_items(1500, seed=1, center=OKC, radius_nm=20)
+        far_items = NotamGenerator.generate_notam_items(100, seed=2, center=(45.0, -120.0), radius_nm=20)
+        self.start_server(near_items + far_items)
+
+        notams = NotamFetch.get_notams_at(PointObject(*OKC), 25, StringIO())
+        # More than one page of NOTAMs, and none from the far away area
+        self.assertEqual(len(notams), len({item["properties"]["coreNOTAMData"]["notam"]["id"] for item in near_items}))
+        for notam in notams :
+            self.assertLessEqual(distance_nm(OKC[0], OKC[1], notam.latitude, notam.longitude), 25.1)
+
+    def test_bad_credentials(self) :
+        self.start_server([])
+        NotamFetch.credentials = {"client_id": "bad_id", "client_secret": "bad_secret"}
+        with self.assertRaisesRegex(RuntimeError, "401") :
+            NotamFetch.get_notams_at(PointObject(*OKC), 25, StringIO())
+
+    def test_injected_errors(self) :
+        server = self.start_server([], rate_429=1.0, retry_after=0)
+        # Rate limited requests are retried until the attempts run out
+        with self.assertRaisesRegex(RuntimeError, "429") :
+            NotamFetch.get_notams_at(PointObject(*OKC), 25, StringIO())
+        self.assertEqual(server.stats["status_429"], NotamFetch.FAA_MAX_ATTEMPTS)
+
+        server.config.rate_429 = 0
+        server.config.error_message_rate = 1.0
+        with self.assertRaisesRegex(RuntimeError, "error message from FAA API") :
+            NotamFetch.get_notams_at(PointObject(*OKC), 25, StringIO())
+        self.assertEqual(server.stats["status_200"], 1)
+
+    def test_page_size_limit(self) :
+        self.start_server([])
+        with self.assertRaisesRegex(RuntimeError, "pageSize") :
+            NotamFetch.get_notams_at(PointObject(*OKC), 25, StringIO(), {"pageSize": "5000"})
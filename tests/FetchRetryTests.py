@@ -0,0 +1,115 @@
+import threading
+import time
+import unittest
+from io import StringIO
+from unittest import mock
+from benchmarks import NotamGenerator
+from benchmarks.FaaMockServer import MockConfig
+from benchmarks.MockFaaApi import MOCK_CREDENTIALS, MockFaaApi
+import NotamFetch
+from NavigationTools import PointObject
+
+# Run these tests with `python3 -m unittest tests/FetchRetryTests.py`
+
+OKC = (35.3931, -97.6007)
+
+class FlakyConfig(MockConfig) :
+    """Answers the first failures requests with HTTP 429, then succeeds."""
+
+    def __init__(self, failures, **kwargs) :
+        super().__init__(**MOCK_CREDENTIALS, **kwargs)
+        self.failures = failures
+        self.lock = threading.Lock()
+
+    @property
+    def rate_429(self) :
+        with self.lock :
+            self.failures -= 1
+            return 1.0 if self.failures >= 0 else 0.0
+
+    @rate_429.setter
+    def rate_429(self, value) :
+        pass
+
+class TestFetchRetry(unittest.TestCase) :
+
+    def start_server(self, config) :
+        items = NotamGenerator.generate_notam_items(30, seed=1, center=OKC, radius_nm=20)
+        server = self.enterContext(MockFaaApi(items, config))
+        NotamFetch.page_latencies.clear()
+        return server
+
+    def test_retries_until_success(self) :
+        server = self.start_server(FlakyConfig(2, retry_after=0))
+        retries_before = NotamFetch.FAA_RETRIES.value(reason="429") or 0
+        with mock.patch.object(NotamFetch, "FAA_RETRY_BASE_DELAY", 0.01) :
+            notams = NotamFetch.get_notams_at(PointObject(*OKC), 25, StringIO())
+        self.assertEqual(len(notams), 30)
+        self.assertEqual(server.stats["status_429"], 2)
+        self.assertEqual(NotamFetch.FAA_RETRIES.value(reason="429") - retries_before, 2)
+
+    def test_respects_retry_after(self) :
+        self.start_server(FlakyConfig(1, retry_after=0.5))
+        with mock.patch.object(NotamFetch, "FAA_RETRY_BASE_DELAY", 0.01) :
+            start_time = time.monotonic()
+            NotamFetch.get_notams_at(PointObject(*OKC), 25, StringIO())
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.5)
+
+    def test_parse_retry_after(self) :
+        self.assertEqual(NotamFetch.parse_retry_after("3"), 3.0)
+        self.assertIsNone(NotamFetch.parse_retry_after(None))
+        self.assertIsNone(NotamFetch.parse_retry_after("soon"))
+        self.assertEqual(NotamFetch.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+
+    def test_hedged_request_wins(self) :
+        server = self.start_server(MockConfig(**MOCK_CREDENTIALS))
+        # Warm up so importing requests doesn't hold up the first request
+        NotamFetch.get_notams_at(PointObject(*OKC), 25, StringIO())
+        NotamFetch.page_latencies.clear()
+        for i in range(NotamFetch.FAA_HEDGE_MIN_SAMPLES) :
+            NotamFetch.page_latencies.add(0.01)
+
+        # Only the first request is slow, so the hedge answers first
+        slow_requests = [1.0]
+        def response_delay() :
+            return slow_requests.pop() if slow_requests else 0.0
+        server.response_delay = response_delay
+
+        hedges_won_before = NotamFetch.FAA_HEDGES.value(outcome="won") or 0
+        with mock.patch.object(NotamFetch, "FAA_HEDGE_ENABLED", True) :
+            start_time = time.monotonic()
+            notams = NotamFetch.get_notams_at(PointObject(*OKC), 25, StringIO())
+        self.assertLess(time.monotonic() - start_time, 0.9)
+        self.assertEqual(len(notams), 30)
+        self.assertEqual(NotamFetch.FAA_HEDGES.value(outcome="won") - hedges_won_before, 1)
+
+    def test_no_hedge_while_queueing(self) :
+        server = self.start_server(MockConfig(**MOCK_CREDENTIALS))
+        NotamFetch.get_notams_at(PointObject(*OKC), 25, StringIO())
+        NotamFetch.page_latencies.clear()
+        for i in range(NotamFetch.FAA_HEDGE_MIN_SAMPLES) :
+            NotamFetch.page_latencies.add(0.01)
+
+        class QueueingLimiter :
+            """Makes every request wait well past the hedge delay for its token."""
+            tokens = 1
+            def acquire(self, timeout = None) :
+                time.sleep(0.3)
+                return True
+            def available(self) :
+                return self.tokens
+
+        # Waiting for a token doesn't count towards the hedge delay
+        hedges_sent_before = NotamFetch.FAA_HEDGES.value(outcome="sent") or 0
+        limiter = QueueingLimiter()
+        with mock.patch.object(NotamFetch, "FAA_HEDGE_ENABLED", True), mock.patch.object(NotamFetch, "rate_limiter", limiter) :
+            NotamFetch.get_notams_at(PointObject(*OKC), 25, StringIO())
+            self.assertEqual((NotamFetch.FAA_HEDGES.value(outcome="sent") or 0) - hedges_sent_before, 0)
+
+            # A slow page isn't hedged when no token is left to spare
+            limiter.tokens = 0
+            server.response_delay = lambda : 0.5
+            hedges_skipped_before = NotamFetch.FAA_HEDGES.value(outcome="skipped") or 0
+            NotamFetch.get_notams_at(PointObject(*OKC), 25, StringIO())
+        self.assertEqual(NotamFetch.FAA_HEDGES.value(outcome="skipped") - hedges_skipped_before, 1)
+        self.assertEqual((NotamFetch.FAA_HEDGES.value(outcome="sent") or 0) - hedges_sent_before, 0)
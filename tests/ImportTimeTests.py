@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+# Run these tests with `python3 -m unittest tests/ImportTimeTests.py`
+#
+# Cold start budgets, in milliseconds, for importing each module in a fresh
+# interpreter. They are generous on purpose so slow machines don't fail, but
+# an eager import of plotly, geopy or the airport database blows well past
+# them. Override with the NOTAM_IMPORT_BUDGET_MS environment variable.
+IMPORT_BUDGETS_MS = {
+    "NotamFetch": 150,
+    "app": 600,
+}
+# Modules that must only be loaded on first use
+LAZY_MODULES = ["plotly", "geopy", "flask_table", "requests", "dotenv", "tenacity"]
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run_python(*args) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], cwd=REPO_ROOT, capture_output=True, text=True, timeout=60)
+
+def cumulative_import_time_ms(module_name : str) -> float:
+    """Imports module_name in a fresh interpreter with -X importtime and
+    returns its cumulative import time."""
+    result = run_python("-X", "importtime", "-c", f"import {module_name}")
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module_name} failed:\n{result.stderr}")
+
+    for line in result.stderr.splitlines():
+        # Lines look like "import time:  self [us] | cumulative | module"
+        fields = line.split("|")
+        if line.startswith("import time:") and len(fields) == 3 and fields[2].strip() == module_name:
+            return int(fields[1]) / 1000
+    raise RuntimeError(f"No import time reported for {module_name}")
+
+class TestColdStart(unittest.TestCase) :
+
+    def test_import_time_budget(self) :
+        for module_name, budget_ms in IMPORT_BUDGETS_MS.items() :
+            budget_ms = float(os.getenv("NOTAM_IMPORT_BUDGET_MS", budget_ms))
+            # Take the best of a few runs so one slow start doesn't fail the test
+            import_time_ms = min(cumulative_import_time_ms(module_name) for i in range(3))
+            print(f"Importing {module_name} took {import_time_ms:.1f} ms (budget {budget_ms:.0f} ms)")
+            self.assertLessEqual(import_time_ms, budget_ms,
+                                 f"Importing {module_name} took {import_time_ms:.1f} ms, over its {budget_ms:.0f} ms budget")
+
+    def test_heavy_modules_load_lazily(self) :
+        script = ("import json, sys, app, NavigationTools; "
+                  f"print(json.dumps([[name for name in {LAZY_MODULES!r} if name in sys.modules], NavigationTools.database is None]))")
+        result = run_python("-c", script)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        loaded_modules, database_deferred = json.loads(result.stdout.strip().splitlines()[-1])
+        self.assertEqual(loaded_modules, [], f"{', '.join(loaded_modules)} should not be imported until first use")
+        self.assertTrue(database_deferred, "The airport database should not be loaded at import time")
@@ -0,0 +1,75 @@
+import math
+import random
+import unittest
+from datetime import datetime
+from benchmarks import NotamGenerator
+from IntervalIndex import IntervalIndex
+from Notam import Notam, parse_notam_interval
+import NotamFetch
+
+# Run these tests with `python3 -m unittest tests/IntervalIndexTests.py`
+
+class TestIntervalIndex(unittest.TestCase) :
+
+    def test_overlapping_matches_linear_scan(self) :
+        rng = random.Random(6)
+        intervals = {}
+        for key in range(2000) :
+            start = rng.choice([-math.inf, rng.uniform(0, 1000)])
+            end = rng.choice([math.inf, start + rng.uniform(0, 200)]) if math.isfinite(start) else rng.choice([math.inf, rng.uniform(0, 1000)])
+            intervals[key] = (start, end)
+        index = IntervalIndex()
+        for key, (start, end) in intervals.items() :
+            index.insert(key, start, end)
+
+        def check_windows() :
+            for window_start, window_end in [(500, 500), (100, 150), (-5, 0), (990, 2000), (-math.inf, math.inf)] :
+                expected = {key for key, (start, end) in intervals.items() if start <= window_end and end >= window_start}
+                found = index.overlapping(window_start, window_end)
+                self.assertEqual(len(found), len(expected))
+                self.assertEqual(set(found), expected)
+
+        # Intervals not yet in the tree are found too
+        check_windows()
+        index.rebuild()
+        self.assertEqual(index.pending_count(), 0)
+        check_windows()
+
+        # Changes are seen by the next query, before the tree is rebuilt
+        index.remove(0)
+        index.insert("new", 5000, 6000)
+        index.insert(1, 7000, 7000)
+        del intervals[0]
+        intervals["new"], intervals[1] = (5000, 6000), (7000, 7000)
+        self.assertEqual(index.pending_count(), 4)
+        self.assertIn("new", index.overlapping(5500, 5500))
+        self.assertNotIn("new", index.overlapping(6001, 7000))
+        self.assertNotIn(0, index.overlapping(-math.inf, math.inf))
+        self.assertEqual(index.overlapping(-math.inf, math.inf).count(1), 1)
+        check_windows()
+        index.rebuild()
+        self.assertEqual(index.pending_count(), 0)
+        check_windows()
+
+    def test_flight_window_filter(self) :
+        now = datetime(2024, 3, 1, 12)
+        notams = [Notam(item) for item in NotamGenerator.generate_notam_items(300, seed=9, now=now)]
+        flight_window = NotamFetch.parse_flight_window("2024-03-01T14:00", "2024-03-01T16:30Z")
+        self.assertEqual(flight_window, (datetime(2024, 3, 1, 14), datetime(2024, 3, 1, 16, 30)))
+
+        window_start, window_end = NotamFetch.flight_window_timestamps(flight_window)
+        kept = NotamFetch.filter_flight_window(notams, flight_window)
+        self.assertLess(len(kept), len(notams))
+        for notam in notams :
+            start, end = parse_notam_interval(notam.effective_start, notam.effective_end)
+            self.assertEqual(notam in kept, start <= window_end and end >= window_start)
+
+    def test_bad_flight_windows(self) :
+        self.assertIsNone(NotamFetch.parse_flight_window("", None))
+        self.assertEqual(NotamFetch.parse_flight_window("2024-03-01T14:00+02:00", None), (datetime(2024, 3, 1, 12), datetime(2024, 3, 1, 12)))
+        with self.assertRaisesRegex(ValueError, "before departure") :
+            NotamFetch.parse_flight_window("2024-03-01T14:00", "2024-03-01T13:00")
+        with self.assertRaisesRegex(ValueError, "needs a departure") :
+            NotamFetch.parse_flight_window(None, "2024-03-01T13:00")
+        with self.assertRaisesRegex(ValueError, "expected like") :
+            NotamFetch.parse_flight_window("tomorrow", None)
@@ -0,0 +1,38 @@
+import unittest
+from benchmarks import LoadTest
+
+# Run these tests with `python3 -m unittest tests/LoadTestTests.py`
+
+class TestLoadTestReport(unittest.TestCase) :
+
+    def test_percentile(self) :
+        values = list(range(1, 101))
+        self.assertEqual(LoadTest.percentile(values, 0.5), 50.5)
+        self.assertAlmostEqual(LoadTest.percentile(values, 0.99), 99.01)
+        self.assertEqual(LoadTest.percentile([3.0], 0.95), 3.0)
+        self.assertIsNone(LoadTest.percentile([], 0.5))
+
+    def test_parse_routes(self) :
+        self.assertEqual(LoadTest.parse_routes(["OKC:DFW=3", "OKC:MCI"]), [(("OKC", "DFW"), 3.0), (("OKC", "MCI"), 1.0)])
+        with self.assertRaises(ValueError) :
+            LoadTest.parse_routes(["OKC=2"])
+        with self.assertRaises(ValueError) :
+            LoadTest.parse_routes(["OKC:DFW=many"])
+
+    def test_recorder_and_compare(self) :
+        recorder = LoadTest.StageRecorder()
+        recorder.record("query", 1.0)
+        recorder.recording = True
+        for latency in (0.1, 0.2, 0.3) :
+            recorder.record("query", latency)
+        recorder.record("query", 5.0, "error_page")
+        baseline = {"throughput": 3.0, "stages": recorder.summary(1.0)}
+        # Recorded before recording started, so not counted
+        self.assertEqual(baseline["stages"]["query"]["count"], 3)
+        self.assertEqual(baseline["stages"]["query"]["errors"], {"error_page": 1})
+        self.assertEqual(baseline["stages"]["query"]["error_rate"], 0.25)
+
+        self.assertEqual(LoadTest.compare_reports(baseline, baseline, 1.25), [])
+        slower_stages = {"query": dict(baseline["stages"]["query"], p95=baseline["stages"]["query"]["p95"] * 2)}
+        regressions = LoadTest.compare_reports(baseline, {"throughput": 2.0, "stages": slower_stages}, 1.25)
+        self.assertEqual(len(regressions), 2)
@@ -0,0 +1,55 @@
+import time
+import unittest
+import Metrics
+
+# Run these tests with `python3 -m unittest tests/MetricsTests.py`
+
+class TestMetrics(unittest.TestCase) :
+
+    def test_histogram_buckets(self) :
+        histogram = Metrics.Histogram("test_seconds", "Test.", ("stage",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0) :
+            histogram.observe(value, stage="fetch")
+        result = histogram.value(stage="fetch")
+        self.assertEqual(result["count"], 4)
+        self.assertAlmostEqual(result["sum"], 2.65)
+        self.assertEqual(list(result["buckets"].values()), [2, 3, 4])
+        self.assertIsNone(histogram.value(stage="other"))
+        with self.assertRaises(ValueError) :
+            histogram.observe(1.0)
+
+    def test_render(self) :
+        registry = Metrics.Registry()
+        counter = registry.counter("test_responses_total", "Responses.", ("status",))
+        counter.inc(status=200)
+        counter.inc(status=200)
+        counter.inc(status='4"29')
+        self.assertIs(registry.counter("test_responses_total", "Responses.", ("status",)), counter)
+        registry.gauge("test_tokens", "Tokens.", function=lambda: 2.5)
+        registry.histogram("test_seconds", "Test.", buckets=(1.0,)).observe(0.5)
+
+        lines = registry.render().splitlines()
+        self.assertIn("# TYPE test_responses_total counter", lines)
+        self.assertIn('test_responses_total{status="200"} 2', lines)
+        self.assertIn('test_responses_total{status="4\\"29"} 1', lines)
+        self.assertIn("test_tokens 2.5", lines)
+        self.assertIn('test_seconds_bucket{le="1"} 1', lines)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 1', lines)
+        self.assertIn("test_seconds_count 1", lines)
+        with self.assertRaises(ValueError) :
+            registry.gauge("test_responses_total", "Responses.")
+
+    def test_span(self) :
+        with self.assertRaises(ZeroDivisionError) :
+            with Metrics.span("test_failing_stage") :
+                1 / 0
+        self.assertEqual(Metrics.STAGE_DURATION.value(stage="test_failing_stage")["count"], 1)
+        self.assertEqual(Metrics.STAGE_ERRORS.value(stage="test_failing_stage"), 1)
+
+        # Spans wrap every FAA page and search stage, so they must stay cheap
+        span_count = 10000
+        start_time = time.perf_counter()
+        for i in range(span_count) :
+            with Metrics.span("test_overhead") :
+                pass
+        self.assertLess((time.perf_counter() - start_time) / span_count, 50e-6)
@@ -0,0 +1,119 @@
+import json
+import os
+import tempfile
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+from benchmarks import NotamGenerator
+from benchmarks.MockFaaApi import MockFaaApi
+import NotamBatchRunner
+import NotamFetch
+
+# Run these tests with `python3 -m unittest tests/NotamBatchRunnerTests.py`
+
+OKC = (35.3931, -97.6007)
+AIRPORTS = [
+    {"properties": {"IDENT": ident, "ICAO_ID": "K" + ident, "NAME": ident, "STATE": "OK", "COUNTRY": "UNITED STATES"},
+     "geometry": {"coordinates": [longitude, latitude, 0]}}
+    for ident, latitude, longitude in (("OKC", 35.3931, -97.6007), ("OUN", 35.2456, -97.4721), ("DFW", 32.8968, -97.038))
+]
+
+class TestNotamBatchRunner(unittest.TestCase) :
+
+    def setUp(self) :
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.directory = temporary_directory.name
+
+    def write_file(self, file_name, contents) :
+        path = os.path.join(self.directory, file_name)
+        with open(path, "w") as output_file :
+            output_file.write(contents)
+        return path
+
+    def test_read_legs(self) :
+        path = self.write_file("legs.csv", "departure,arrival\n# nightly legs\nOKC,DFW\n\nKOUN, KOKC, 2024-03-01T14:30, 2024-03-01T15:00\nOKC,DFW,tomorrow\n")
+        legs = NotamBatchRunner.read_legs(path)
+        self.assertEqual([(leg.index, leg.departure, leg.arrival) for leg in legs], [(0, "OKC", "DFW"), (1, "KOUN", "KOKC"), (2, "OKC", "DFW")])
+        self.assertIsNone(legs[0].flight_window)
+        self.assertEqual(legs[1].flight_window[0].hour, 14)
+        self.assertIsNotNone(legs[2].error)
+
+    def test_resume_skips_finished_legs(self) :
+        leg = NotamBatchRunner.BatchLeg(0, "OKC", "DFW")
+        path = self.write_file("ranked.ndjson",
+                               leg.record([])
+                               + NotamBatchRunner.BatchLeg(1, "OKC", "OUN").record(error="Fetching failed", retryable=True)
+                               + NotamBatchRunner.BatchLeg(2, "OKC", "XXX").record(error="Unknown airport")
+                               + '{"leg": 3, "departure"')
+        self.assertEqual(NotamBatchRunner.load_finished_legs(path), {0, 2})
+        # The leg searched again and the line cut short by the interruption are gone
+        with open(path) as output_file :
+            self.assertEqual([record["leg"] for record in map(json.loads, output_file)], [0, 2])
+
+    def start_mock_api(self) :
+        items = NotamGenerator.generate_notam_items(300, seed=4, center=OKC, radius_nm=150)
+        return self.enterContext(MockFaaApi(items, airports=AIRPORTS))
+
+    def read_records(self, output_path) :
+        with open(output_path) as output_file :
+            return [json.loads(line) for line in output_file]
+
+    def test_run_against_mock_api(self) :
+        server = self.start_mock_api()
+        legs = NotamBatchRunner.read_legs(self.write_file("legs.csv", "OKC,DFW\nOKC,OUN\nOUN,DFW\nOKC,JNU\n"))
+        output_path = os.path.join(self.directory, "ranked.ndjson")
+        summary = NotamBatchRunner.run_batch(legs, output_path, workers=2, chunk_size=2)
+        self.assertEqual((summary["ranked"], summary["failed"]), (3, 1))
+        self.assertGreater(summary["notams"], 0)
+
+        with open(output_path) as output_file :
+            records = {record["leg"]: record for record in map(json.loads, output_file)}
+        self.assertEqual(set(records), {0, 1, 2, 3})
+        scores = [notam["score"] for notam in records[0]["notams"]]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertIsNotNone(records[3]["error"])
+
+        # A second run has nothing left to do
+        requests_before = server.stats["requests"]
+        summary = NotamBatchRunner.run_batch(legs, output_path, workers=2)
+        self.assertEqual(summary["resumed"], 4)
+        self.assertEqual(server.stats["requests"], requests_before)
+
+    def test_failed_area_only_fails_its_legs(self) :
+        self.start_mock_api()
+        legs = NotamBatchRunner.read_legs(self.write_file("legs.csv", "OKC,DFW\nOKC,OUN\nOUN,DFW\n"))
+        output_path = os.path.join(self.directory, "ranked.ndjson")
+        timed_get_notams_at = NotamFetch.timed_get_notams_at
+        def get_notams_at(point, request_radius, message_log) :
+            if point.latitude < 33.5 :
+                raise NotamFetch.RetryableFAAError("Error: the FAA API kept failing")
+            return timed_get_notams_at(point, request_radius, message_log)
+
+        with mock.patch.object(NotamFetch, "timed_get_notams_at", get_notams_at) :
+            summary = NotamBatchRunner.run_batch(legs, output_path, workers=1)
+        self.assertEqual((summary["ranked"], summary["failed"]), (1, 2))
+        records = {record["leg"]: record for record in self.read_records(output_path)}
+        self.assertIsNone(records[1]["error"])
+        self.assertTrue(records[0]["retryable"] and records[2]["retryable"])
+
+        # Resuming searches the failed legs again and replaces their records
+        summary = NotamBatchRunner.run_batch(legs, output_path, workers=1)
+        self.assertEqual((summary["resumed"], summary["ranked"], summary["failed"]), (1, 2, 0))
+        records = self.read_records(output_path)
+        self.assertEqual(sorted(record["leg"] for record in records), [0, 1, 2])
+        self.assertTrue(all(record["error"] is None for record in records))
+
+    def test_broken_pool_leaves_legs_for_the_next_run(self) :
+        self.start_mock_api()
+        legs = NotamBatchRunner.read_legs(self.write_file("legs.csv", "OKC,DFW\nOKC,OUN\nOUN,DFW\n"))
+        output_path = os.path.join(self.directory, "ranked.ndjson")
+        with mock.patch.object(NotamBatchRunner.concurrent.futures.ProcessPoolExecutor, "submit",
+                               side_effect=BrokenProcessPool("A worker was killed")) :
+            summary = NotamBatchRunner.run_batch(legs, output_path, workers=1, chunk_size=1)
+        self.assertEqual((summary["ranked"], summary["failed"], summary["not_run"]), (0, 1, 2))
+        self.assertTrue(self.read_records(output_path)[0]["retryable"])
+
+        summary = NotamBatchRunner.run_batch(legs, output_path, workers=1)
+        self.assertEqual((summary["resumed"], summary["ranked"]), (0, 3))
+        self.assertEqual(sorted(record["leg"] for record in self.read_records(output_path)), [0, 1, 2])
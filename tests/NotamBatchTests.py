@@ -0,0 +1,87 @@
+import time
+import unittest
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock
+from benchmarks import NotamGenerator
+from benchmarks.MockFaaApi import MockFaaApi
+import NotamBatch
+import NotamFetch
+import NotamStore
+from NavigationTools import PointObject
+from RateLimiter import RateLimiter
+
+# Run these tests with `python3 -m unittest tests/NotamBatchTests.py`
+
+OKC = (35.3931, -97.6007)
+AIRPORTS = [
+    {"properties": {"IDENT": ident, "ICAO_ID": "K" + ident, "NAME": ident, "STATE": state, "COUNTRY": "UNITED STATES"},
+     "geometry": {"coordinates": [longitude, latitude, 0]}}
+    for ident, state, latitude, longitude in (("OKC", "OK", 35.3931, -97.6007), ("DFW", "TX", 32.8968, -97.038), ("TUL", "OK", 36.1984, -95.8881))
+]
+
+class TestBatchAreaPlanning(unittest.TestCase) :
+
+    HUB = PointObject(35.39, -97.60)
+
+    def test_shared_hub_is_fetched_once(self) :
+        leg_areas = [
+            [(self.HUB, 25), (PointObject(34.8, -97.3), 25)],
+            [(self.HUB, 25), (PointObject(35.9, -97.2), 25)],
+            [(self.HUB, 25), (PointObject(35.4, -96.9), 25)],
+        ]
+        unique_areas, leg_coverage = NotamBatch.plan_batch_areas(leg_areas)
+        self.assertEqual(len(unique_areas), 4)
+        hub_areas = {coverage[0][2] for coverage in leg_coverage}
+        self.assertEqual(len(hub_areas), 1)
+
+    def test_small_area_inside_large_area(self) :
+        leg_areas = [[(self.HUB, 60)], [(PointObject(35.5, -97.5), 25)]]
+        unique_areas, leg_coverage = NotamBatch.plan_batch_areas(leg_areas)
+        self.assertEqual(len(unique_areas), 1)
+        self.assertIs(leg_coverage[1][0][2], unique_areas[0])
+
+    def test_separate_areas_are_kept(self) :
+        leg_areas = [[(self.HUB, 25)], [(PointObject(32.90, -97.04), 25)]]
+        unique_areas, leg_coverage = NotamBatch.plan_batch_areas(leg_areas)
+        self.assertEqual(len(unique_areas), 2)
+
+class TestBatchRanking(unittest.TestCase) :
+
+    def setUp(self) :
+        items = NotamGenerator.generate_notam_items(400, seed=5, center=OKC, radius_nm=200)
+        self.server = self.enterContext(MockFaaApi(items, airports=AIRPORTS))
+        self.enterContext(mock.patch.object(NotamFetch, "CORRIDOR_HALF_WIDTH_NM", 10))
+
+    def test_ranked_like_a_search(self) :
+        departure = datetime.utcnow() + timedelta(days=2)
+        flight_window = (departure, departure + timedelta(hours=2))
+        store = NotamStore.NotamStore(bounds=(31.0, -100.0, 38.0, -94.0), sweep_radius=100)
+        store.sweep(StringIO())
+
+        for notam_store in (None, store) :
+            with mock.patch.object(NotamFetch, "notam_store", notam_store) :
+                self.server.stats.clear()
+                batch_legs = NotamBatch.get_all_notams_batch([("OKC", "DFW"), ("OKC", "TUL")], StringIO(), [flight_window, None])["legs"]
+                batch_requests = self.server.stats["requests"]
+                for leg, leg_window in zip(batch_legs, (flight_window, None)) :
+                    sorted_notams = NotamFetch.find_route_notams(leg["departure"], leg["arrival"], StringIO(), leg_window)[0]
+                    self.assertTrue(sorted_notams)
+                    self.assertEqual([(notam.id, notam.score) for notam in leg["notams"]], [(notam.id, notam.score) for notam in sorted_notams])
+            # Answered from the snapshot store, the batch doesn't call the FAA API
+            self.assertEqual(batch_requests == 0, notam_store is not None)
+
+class TestRateLimiter(unittest.TestCase) :
+
+    def test_burst_then_wait(self) :
+        limiter = RateLimiter(requests_per_minute=600, burst=3)
+        start_time = time.monotonic()
+        for i in range(4) :
+            self.assertTrue(limiter.acquire())
+        # The fourth request waits for one token at 10 per second
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.08)
+
+    def test_timeout(self) :
+        limiter = RateLimiter(requests_per_minute=1, burst=1)
+        self.assertTrue(limiter.acquire(timeout=0))
+        self.assertFalse(limiter.acquire(timeout=0.01))
@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+from benchmarks import NotamGenerator
+from benchmarks.FaaMockServer import load_recorded_items
+import NotamExport
+from Notam import Notam
+
+# Run these tests with `python3 -m unittest tests/NotamExportTests.py`
+
+def make_ranked_notams(count) :
+    notams = [Notam(item) for item in NotamGenerator.generate_notam_items(count, seed=5)]
+    for rank, notam in enumerate(notams) :
+        notam.score = count - rank
+    return notams
+
+class TestNotamExport(unittest.TestCase) :
+
+    def setUp(self) :
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.directory = temporary_directory.name
+
+    def test_round_trip(self) :
+        notams = make_ranked_notams(300)
+        for file_name, export_format in (("dump.ndjson", "ndjson"), ("dump.ndjson.gz", "ndjson"), ("dump.notamcol", "columnar")) :
+            path = os.path.join(self.directory, file_name)
+            self.assertEqual(NotamExport.export_notams(notams, path, export_format), len(notams))
+            loaded = list(NotamExport.load_notams(path))
+            self.assertEqual([vars(notam) for notam in loaded], [vars(notam) for notam in notams], export_format)
+
+    def test_streams_as_produced(self) :
+        produced = []
+        def ranked_notams() :
+            for notam in make_ranked_notams(NotamExport.NDJSON_CHUNK_LINES * 3) :
+                produced.append(notam)
+                yield notam
+
+        chunks = NotamExport.iter_ndjson_chunks(ranked_notams())
+        next(chunks)
+        # Only the first chunk's NOTAMs have been pulled from the generator
+        self.assertEqual(len(produced), NotamExport.NDJSON_CHUNK_LINES)
+
+    def test_columnar_reads_only_asked_columns(self) :
+        path = os.path.join(self.directory, "dump.notamcol")
+        NotamExport.export_notams(make_ranked_notams(50), path, "columnar")
+        rows = list(NotamExport.iter_notam_dicts(path, columns=("id", "score")))
+        self.assertEqual(len(rows), 50)
+        self.assertEqual(set(rows[0]), {"id", "score"})
+
+    def test_exports_replay_in_mock_server(self) :
+        notams = make_ranked_notams(20)
+        for file_name, export_format in (("dump.ndjson", "ndjson"), ("dump.notamcol", "columnar")) :
+            path = os.path.join(self.directory, file_name)
+            NotamExport.export_notams(notams, path, export_format)
+            items = load_recorded_items(path)
+            self.assertEqual([Notam(item).id for item in items], [notam.id for notam in notams])
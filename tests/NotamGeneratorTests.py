@@ -0,0 +1,44 @@
+import unittest
+from datetime import datetime
+from benchmarks import NotamGenerator
+from Notam import Notam
+
+# Run these tests with `python3 -m unittest tests/NotamGeneratorTests.py`
+
+class TestNotamGenerator(unittest.TestCase) :
+
+    def test_items_parse_as_notams(self) :
+        notams = [Notam(item) for item in NotamGenerator.generate_notam_items(200, seed=1)]
+        self.assertEqual(len({notam.id for notam in notams}), 200)
+        for notam in notams :
+            self.assertIsNotNone(notam.latitude)
+            self.assertIsNotNone(notam.radius_nm)
+            self.assertEqual(len(notam.selection_code), 5)
+
+    def test_same_seed_same_items(self) :
+        now = datetime(2024, 3, 1, 12)
+        first_items = NotamGenerator.generate_notam_items(50, seed=7, now=now)
+        self.assertEqual(first_items, NotamGenerator.generate_notam_items(50, seed=7, now=now))
+        self.assertNotEqual(first_items, NotamGenerator.generate_notam_items(50, seed=8, now=now))
+
+    def test_duplicates(self) :
+        items = NotamGenerator.generate_notam_items(1000, seed=3, duplicate_fraction=0.5)
+        unique_notams = {Notam(item) for item in items}
+        # A repeated id always comes with the same NOTAM
+        items_by_id = {}
+        for item in items :
+            notam_id = item["properties"]["coreNOTAMData"]["notam"]["id"]
+            self.assertEqual(items_by_id.setdefault(notam_id, item), item)
+        self.assertLess(len(unique_notams), 700)
+        self.assertGreater(len(unique_notams), 300)
+
+    def test_items_stay_in_area(self) :
+        center = (35.39, -97.60)
+        for item in NotamGenerator.generate_notam_items(200, seed=2, center=center, radius_nm=25) :
+            longitude, latitude = item["geometry"]["coordinates"]
+            self.assertLess(abs(latitude - center[0]), 25 / 60 + 0.01)
+
+    def test_paging(self) :
+        items = NotamGenerator.generate_notam_items(25, seed=4)
+        page = NotamGenerator.build_page(items, 3, 10)
+        self.assertEqual((page["totalCount"], page["totalPages"], len(page["items"])), (25, 3, 5))
@@ -0,0 +1,64 @@
+import json
+import unittest
+from datetime import datetime
+from unittest import mock
+from benchmarks import NotamGenerator
+import NotamIngest
+import NotamSort
+from Notam import Notam
+
+# Run these tests with `python3 -m unittest tests/NotamIngestTests.py`
+
+def notam_attributes(notam) :
+    return {attribute : getattr(notam, attribute) for attribute in Notam.ROW_ATTRIBUTES}
+
+class TestNotamIngest(unittest.TestCase) :
+
+    def setUp(self) :
+        items = NotamGenerator.generate_notam_items(300, seed=11)
+        self.page_body = json.dumps(NotamGenerator.build_page(items, 1, 1000)).encode()
+        self.expected_notams = [Notam(item) for item in items]
+
+        patches = [
+            mock.patch.object(NotamIngest, "INGEST_WORKERS", 2),
+            mock.patch.object(NotamIngest, "MIN_POOL_PAGE_BYTES", 0),
+            mock.patch.object(NotamIngest, "MIN_POOL_SCORE_NOTAMS", 100),
+            mock.patch.object(NotamIngest, "SCORE_CHUNK_NOTAMS", 70),
+        ]
+        for patch in patches :
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(self.shut_down_pool)
+
+    def shut_down_pool(self) :
+        if NotamIngest._pool is not None :
+            NotamIngest._pool.shutdown()
+            NotamIngest._pool = None
+
+    def test_row_round_trip(self) :
+        for notam in self.expected_notams :
+            self.assertEqual(notam_attributes(Notam.from_row(notam.to_row())), notam_attributes(notam))
+
+    def test_pages_decoded_on_the_pool(self) :
+        tasks_before = NotamIngest.INGEST_TASKS.total()
+        page = NotamIngest.decode_page(self.page_body)
+        self.assertEqual(NotamIngest.INGEST_TASKS.total() - tasks_before, 1)
+        self.assertNotIn("items", page)
+        self.assertEqual(NotamIngest.page_item_count(page), len(self.expected_notams))
+        self.assertEqual([notam_attributes(notam) for notam in NotamIngest.page_notams(page)],
+                         [notam_attributes(notam) for notam in self.expected_notams])
+
+        # Small pages stay on the calling thread
+        with mock.patch.object(NotamIngest, "MIN_POOL_PAGE_BYTES", len(self.page_body) + 1) :
+            page = NotamIngest.decode_page(self.page_body)
+        self.assertIn("items", page)
+        self.assertEqual(len(NotamIngest.page_notams(page)), len(self.expected_notams))
+
+    def test_pool_scores_match(self) :
+        today = datetime.utcnow()
+        tables = NotamSort.load_ranking_tables()
+        expected_scores = [NotamSort.score_notam(notam, tables, "OKC", "DFW", today) for notam in self.expected_notams]
+        self.assertEqual(NotamIngest.score_notams(self.expected_notams, "OKC", "DFW", today), expected_scores)
+
+        with mock.patch.object(NotamIngest, "INGEST_WORKERS", 0) :
+            self.assertIsNone(NotamIngest.score_notams(self.expected_notams, "OKC", "DFW", today))
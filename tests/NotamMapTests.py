@@ -0,0 +1,57 @@
+import unittest
+import NotamMap
+from Notam import Notam, parse_notam_coordinates
+
+# Run these tests with `python3 -m unittest tests/NotamMapTests.py`
+
+class Point :
+    def __init__(self, latitude, longitude) :
+        self.latitude = latitude
+        self.longitude = longitude
+
+def make_notam(notam_id, coordinates) :
+    return Notam({"properties": {"coreNOTAMData": {"notam": {"id": notam_id, "coordinates": coordinates}}}})
+
+class TestNotamCoordinates(unittest.TestCase) :
+
+    def test_degrees_minutes(self) :
+        latitude, longitude = parse_notam_coordinates("3524N09736W")
+        self.assertAlmostEqual(latitude, 35.4)
+        self.assertAlmostEqual(longitude, -97.6)
+
+    def test_degrees_minutes_seconds(self) :
+        latitude, longitude = parse_notam_coordinates("352436S0973636E")
+        self.assertAlmostEqual(latitude, -35.41)
+        self.assertAlmostEqual(longitude, 97.61)
+
+    def test_unreadable_coordinates(self) :
+        self.assertIsNone(parse_notam_coordinates(None))
+        self.assertIsNone(parse_notam_coordinates("NOT A PLACE"))
+        self.assertIsNone(parse_notam_coordinates("9924N09736W"))
+
+    def test_geometry_fallback(self) :
+        notam = Notam({
+            "geometry": {"type": "GeometryCollection", "geometries": [{"type": "Point", "coordinates": [-97.5, 35.25]}]},
+            "properties": {"coreNOTAMData": {"notam": {"id": "1"}}},
+        })
+        self.assertEqual((notam.latitude, notam.longitude), (35.25, -97.5))
+
+class TestMapPayload(unittest.TestCase) :
+
+    ROUTE = [Point(35.39, -97.60), Point(37.0, -96.0), Point(39.30, -94.71)]
+
+    def test_payload_features(self) :
+        payload = NotamMap.build_map_payload(self.ROUTE, 25, [make_notam("1", "3524N09736W"), make_notam("2", None)])
+        kinds = [feature["properties"]["kind"] for feature in payload["features"]]
+        self.assertEqual(kinds, ["route", "request_area", "request_area", "request_area", "notam_cluster"])
+        self.assertEqual(payload["features"][0]["geometry"]["coordinates"][0], [-97.6, 35.39])
+        self.assertEqual(payload["bbox"], [-97.6, 35.39, -94.71, 39.3])
+
+    def test_marker_count_stays_flat(self) :
+        # 10,000 NOTAMs packed around the departure airport become a handful of clusters
+        notams = [make_notam(str(i), f"352{i % 10}N0973{i % 7}W") for i in range(10000)]
+        clusters = [feature for feature in NotamMap.build_map_payload(self.ROUTE, 25, notams)["features"]
+                    if feature["properties"]["kind"] == "notam_cluster"]
+        self.assertLess(len(clusters), 20)
+        self.assertEqual(sum(cluster["properties"]["count"] for cluster in clusters), 10000)
+        self.assertTrue(all(len(cluster["properties"]["notam_ids"]) <= NotamMap.MAX_CLUSTER_SAMPLE_IDS for cluster in clusters))
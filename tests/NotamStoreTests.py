@@ -0,0 +1,103 @@
+import unittest
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock
+from benchmarks import NotamGenerator
+from benchmarks.MockFaaApi import MockFaaApi
+import NotamFetch
+import NotamStore
+from NavigationTools import PointObject
+
+# Run these tests with `python3 -m unittest tests/NotamStoreTests.py`
+
+OKC = (35.3931, -97.6007)
+# Small area around OKC so a sweep only takes a few requests
+TEST_BOUNDS = (33.0, -100.0, 38.0, -95.0)
+AIRPORTS = [
+    {"properties": {"IDENT": ident, "ICAO_ID": "K" + ident, "NAME": ident, "STATE": "OK", "COUNTRY": "UNITED STATES"},
+     "geometry": {"coordinates": [longitude, latitude, 0]}}
+    for ident, latitude, longitude in (("OKC", 35.3931, -97.6007), ("TUL", 36.1984, -95.8881), ("LAW", 34.5677, -98.4166))
+]
+
+class TestNotamStore(unittest.TestCase) :
+
+    def setUp(self) :
+        items = NotamGenerator.generate_notam_items(400, seed=3, center=OKC, radius_nm=120)
+        self.server = self.enterContext(MockFaaApi(items, airports=AIRPORTS))
+        self.store = NotamStore.NotamStore(bounds=TEST_BOUNDS, sweep_radius=100)
+
+    def test_sweep_covers_bounds(self) :
+        south, west, north, east = TEST_BOUNDS
+        for latitude in range(int(south * 4), int(north * 4) + 1) :
+            for longitude in range(int(west * 4), int(east * 4) + 1) :
+                point = PointObject(latitude / 4, longitude / 4)
+                self.assertTrue(self.store.regions_near(point, 0), f"{point} is not covered by the sweep")
+
+    def test_answers_like_the_live_api(self) :
+        self.assertEqual(self.store.sweep(StringIO()), 0)
+        requests_after_sweep = self.server.stats["requests"]
+
+        point = PointObject(*OKC)
+        self.assertTrue(self.store.is_fresh(point, 50))
+        live_ids = {notam.id for notam in NotamFetch.get_notams_at(point, 50, StringIO())}
+        self.server.stats.clear()
+
+        stored_ids = {notam.id for notam in self.store.notams_in_circle(point, 50)}
+        self.assertEqual(stored_ids, live_ids)
+        self.assertGreater(requests_after_sweep, 0)
+        self.assertEqual(self.server.stats["requests"], 0)
+
+    def test_stale_areas_are_fetched_live(self) :
+        self.store.sweep(StringIO())
+        inside_area = (PointObject(*OKC), 50)
+        outside_area = (PointObject(45.0, -120.0), 50)
+        self.server.stats.clear()
+
+        self.store.notams_for_areas([inside_area], StringIO())
+        self.assertEqual(self.server.stats["requests"], 0)
+        self.store.notams_for_areas([inside_area, outside_area], StringIO())
+        self.assertEqual(self.server.stats["requests"], 1)
+
+        # Regions past max_age are no longer trusted
+        self.store.max_age = 0
+        self.server.stats.clear()
+        self.store.notams_for_areas([inside_area], StringIO())
+        self.assertEqual(self.server.stats["requests"], 1)
+
+    def test_failed_regions_stay_stale(self) :
+        self.server.config.error_message_rate = 1.0
+        failed_regions = self.store.sweep(StringIO())
+        self.assertEqual(failed_regions, len(self.store.regions))
+        self.assertFalse(self.store.is_fresh(PointObject(*OKC), 50))
+        self.assertEqual(self.store.status()["failed_regions"], len(self.store.regions))
+
+    def test_flight_window(self) :
+        self.store.sweep(StringIO())
+        # The sweep's changes are already in the time index's tree
+        self.assertEqual(self.store.time_index.pending_count(), 0)
+        area = (PointObject(*OKC), 80)
+        all_notams = self.store.notams_for_areas([area], StringIO())[0]
+        departure = datetime.utcnow() + timedelta(days=3)
+        flight_window = (departure, departure + timedelta(hours=2))
+
+        window_notams = self.store.notams_for_areas([area], StringIO(), flight_window)[0]
+        self.assertLess(len(window_notams), len(all_notams))
+        self.assertEqual(window_notams, set(NotamFetch.filter_flight_window(all_notams, flight_window)))
+
+        # Areas fetched live are held to the same window
+        self.store.max_age = 0
+        live_notams = self.store.notams_for_areas([area], StringIO(), flight_window)[0]
+        self.assertEqual({notam.id for notam in live_notams}, {notam.id for notam in window_notams})
+
+    def test_searches_keep_their_own_scores(self) :
+        self.store.sweep(StringIO())
+        self.enterContext(mock.patch.object(NotamFetch, "notam_store", self.store))
+
+        first_notams = NotamFetch.find_route_notams("OKC", "TUL", StringIO())[0]
+        first_scores = {notam.id : notam.score for notam in first_notams}
+        second_notams = NotamFetch.find_route_notams("LAW", "OKC", StringIO())[0]
+        second_scores = {notam.id : notam.score for notam in second_notams}
+        shared_ids = first_scores.keys() & second_scores.keys()
+        # The routes share NOTAMs around OKC, some of which rank differently on each
+        self.assertTrue(any(first_scores[notam_id] != second_scores[notam_id] for notam_id in shared_ids))
+        self.assertEqual({notam.id : notam.score for notam in first_notams}, first_scores)
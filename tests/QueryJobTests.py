@@ -0,0 +1,101 @@
+import threading
+import time
+import unittest
+from unittest import mock
+import QueryJobs
+
+# Run these tests with `python3 -m unittest tests/QueryJobTests.py`
+
+class TestQueryJobQueue(unittest.TestCase) :
+
+    def wait_for(self, job, timeout = 5) :
+        deadline = time.time() + timeout
+        while not job.is_finished() and time.time() < deadline :
+            time.sleep(0.01)
+        self.assertTrue(job.is_finished(), f"Job {job.id} did not finish in {timeout} seconds")
+
+    def test_job_result(self) :
+        queue = QueryJobs.QueryJobQueue(lambda dep, arr, log : f"{dep}-{arr}", worker_count=1)
+        job = queue.submit("OKC", "DFW")
+        self.wait_for(job)
+        self.assertEqual(job.status, QueryJobs.QueryJob.DONE)
+        self.assertEqual(job.result, "OKC-DFW")
+        self.assertIs(queue.get(job.id), job)
+        queue.shutdown()
+
+    def test_identical_routes_share_a_job(self) :
+        release = threading.Event()
+        calls = []
+        def run_query(dep, arr, log) :
+            calls.append((dep, arr))
+            release.wait(5)
+            return None
+
+        queue = QueryJobs.QueryJobQueue(run_query, worker_count=2)
+        first_job = queue.submit("okc", "dfw")
+        second_job = queue.submit(" OKC", "DFW ")
+        release.set()
+        self.wait_for(first_job)
+        self.assertIs(first_job, second_job)
+        self.assertEqual(len(calls), 1)
+        queue.shutdown()
+
+    def test_failed_jobs_are_not_reused(self) :
+        def run_query(dep, arr, log) :
+            raise RuntimeError("FAA API is down")
+
+        queue = QueryJobs.QueryJobQueue(run_query, worker_count=1)
+        first_job = queue.submit("OKC", "DFW")
+        self.wait_for(first_job)
+        self.assertEqual(first_job.status, QueryJobs.QueryJob.FAILED)
+        self.assertIn("FAA API is down", first_job.to_dict()["error"])
+
+        second_job = queue.submit("OKC", "DFW")
+        self.assertIsNot(first_job, second_job)
+        self.wait_for(second_job)
+        queue.shutdown()
+
+    def test_queue_is_bounded(self) :
+        release = threading.Event()
+        queue = QueryJobs.QueryJobQueue(lambda dep, arr, log : release.wait(5), worker_count=1, max_pending_jobs=2)
+        queue.submit("OKC", "DFW")
+        queue.submit("OKC", "MCI")
+        with self.assertRaises(QueryJobs.JobQueueFullError) :
+            queue.submit("OKC", "LAX")
+        release.set()
+        queue.shutdown()
+
+    def test_results_expire(self) :
+        queue = QueryJobs.QueryJobQueue(lambda dep, arr, log : None, worker_count=1, result_ttl=0.05)
+        job = queue.submit("OKC", "DFW")
+        self.wait_for(job)
+        time.sleep(0.1)
+        self.assertIsNone(queue.get(job.id))
+        self.assertIsNot(queue.submit("OKC", "DFW"), job)
+        queue.shutdown()
+
+    def test_expiry_while_a_job_finishes(self) :
+        queue = QueryJobs.QueryJobQueue(lambda dep, arr, log : None, worker_count=1)
+        errors = []
+        def expire_jobs() :
+            try :
+                queue.get("unknown")
+            except Exception as err :
+                errors.append(err)
+
+        real_time = time.time
+        def finishing_time() :
+            # The worker takes the job's finishing time, expire jobs right then
+            if threading.current_thread().name.startswith("notam-query") :
+                expiry_thread = threading.Thread(target=expire_jobs)
+                expiry_thread.start()
+                expiry_thread.join(0.2)
+            return real_time()
+
+        with mock.patch.object(QueryJobs.time, "time", finishing_time) :
+            job = queue.submit("OKC", "DFW")
+            self.wait_for(job)
+            queue.shutdown()
+        self.assertEqual(errors, [])
+        self.assertIsNotNone(job.finished_at)
+        self.assertIs(queue.get(job.id), job)
@@ -0,0 +1,58 @@
+import os
+import pstats
+import tempfile
+import tracemalloc
+import unittest
+import RequestProfiler
+
+# Run these tests with `python3 -m unittest tests/RequestProfilerTests.py`
+
+def busy_work() :
+    return sorted(str(i) for i in range(20000))
+
+class TestRequestProfiler(unittest.TestCase) :
+
+    def setUp(self) :
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.store = RequestProfiler.ProfileStore(self.directory.name, max_profiles=2)
+
+    def test_authorization(self) :
+        self.assertTrue(RequestProfiler.is_authorized("secret", "secret"))
+        self.assertFalse(RequestProfiler.is_authorized("secret", "wrong"))
+        self.assertFalse(RequestProfiler.is_authorized("secret", None))
+        # No admin token configured means nobody can profile
+        self.assertFalse(RequestProfiler.is_authorized(None, ""))
+
+    def test_modes_save_profiles(self) :
+        for mode in RequestProfiler.PROFILE_MODES :
+            result, profile_id = self.store.run(mode, busy_work, {"departure": "OKC", "arrival": "K/DFW"})
+            self.assertEqual(result, busy_work())
+            self.assertIn("-OKC-KDFW-", profile_id)
+            self.assertIsNotNone(self.store.file_path(profile_id + ".json"))
+
+        self.assertFalse(tracemalloc.is_tracing())
+        profiles = self.store.list_profiles()
+        # Only the newest two are kept
+        self.assertEqual([profile["mode"] for profile in profiles], ["memory", "sample"])
+        self.assertEqual(len(os.listdir(self.directory.name)), 4)
+        self.assertEqual(profiles[0]["annotations"]["arrival"], "K/DFW")
+        self.assertIn("peak_traced_bytes", profiles[0]["summary"])
+
+    def test_cpu_profile_loads(self) :
+        result, profile_id = self.store.run(RequestProfiler.CPU_MODE, busy_work, {})
+        stats = pstats.Stats(self.store.file_path(profile_id + ".prof"))
+        self.assertTrue(any(function_name == "busy_work" for file_name, line, function_name in stats.stats))
+
+    def test_errors_are_raised_after_saving(self) :
+        def failing_search() :
+            raise RuntimeError("FAA API is down")
+        with self.assertRaisesRegex(RuntimeError, "FAA API is down") :
+            self.store.run(RequestProfiler.CPU_MODE, failing_search, {})
+        self.assertEqual(self.store.list_profiles()[0]["error"], "RuntimeError('FAA API is down')")
+
+    def test_file_path_rejects_other_files(self) :
+        self.assertIsNone(self.store.file_path("../app.py"))
+        self.assertIsNone(self.store.file_path("missing.json"))
+        with self.assertRaises(ValueError) :
+            self.store.run("wall", busy_work, {})
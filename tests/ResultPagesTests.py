@@ -0,0 +1,81 @@
+import gzip
+import json
+import unittest
+import ResultPages
+from Notam import Notam
+
+# Run these tests with `python3 -m unittest tests/ResultPagesTests.py`
+
+def make_notams(count) :
+    notams = []
+    for i in range(count) :
+        notam = Notam({"properties": {"coreNOTAMData": {"notam": {"id": f"N{i}", "text": f"RWY {i} CLSD"}}}})
+        notam.score = count - i
+        notams.append(notam)
+    return notams
+
+class TestResultPages(unittest.TestCase) :
+
+    def test_cursor_walks_every_notam_once(self) :
+        notams = make_notams(120)
+        result_id = ResultPages.result_id_for(notams)
+        seen_ids = []
+        offset = 0
+        while True :
+            page = ResultPages.build_page(result_id, notams, offset, 50, ("id",))
+            seen_ids += [item["id"] for item in page["items"]]
+            if page["next_cursor"] is None :
+                break
+            offset = ResultPages.decode_cursor(page["next_cursor"], result_id)
+        self.assertEqual(seen_ids, [notam.id for notam in notams])
+
+    def test_cursor_from_other_result_is_rejected(self) :
+        cursor = ResultPages.encode_cursor("first", 50)
+        with self.assertRaises(ValueError) :
+            ResultPages.decode_cursor(cursor, "second")
+        with self.assertRaises(ValueError) :
+            ResultPages.decode_cursor("not a cursor", "first")
+
+    def test_field_selection(self) :
+        page = ResultPages.build_page("result", make_notams(3), 0, 10, ResultPages.parse_fields("id, score"))
+        self.assertEqual(page["items"][0], {"id": "N0", "score": 3})
+        with self.assertRaises(ValueError) :
+            ResultPages.parse_fields("id,password")
+
+    def test_result_id_depends_on_contents(self) :
+        self.assertEqual(ResultPages.result_id_for(make_notams(5)), ResultPages.result_id_for(make_notams(5)))
+        changed_notams = make_notams(5)
+        changed_notams[2].text = "RWY 2 OPEN"
+        self.assertNotEqual(ResultPages.result_id_for(make_notams(5)), ResultPages.result_id_for(changed_notams))
+
+    def test_compression(self) :
+        body = json.dumps({"items": ["RWY 17/35 CLSD"] * 500}).encode()
+        compressed_body, encoding = ResultPages.compress(body, "gzip, deflate")
+        self.assertEqual(encoding, "gzip")
+        self.assertEqual(gzip.decompress(compressed_body), body)
+        self.assertEqual(ResultPages.compress(body, "identity"), (body, None))
+        self.assertEqual(ResultPages.compress(b"{}", "gzip"), (b"{}", None))
+
+    def test_store_drops_least_recently_used(self) :
+        store = ResultPages.ResultStore(max_results=2)
+        first_id = store.add(make_notams(1))
+        second_id = store.add(make_notams(2))
+        store.get(first_id)
+        store.add(make_notams(3))
+        self.assertIsNotNone(store.get(first_id))
+        self.assertIsNone(store.get(second_id))
+
+    def test_store_filters_by_keywords(self) :
+        store = ResultPages.ResultStore(max_results=1)
+        result_id = store.add(make_notams(12))
+        self.assertEqual([notam.id for notam in store.get(result_id, "runway 11")], ["N11"])
+        self.assertEqual(len(store.get(result_id, "RWY CLSD")), 12)
+
+        cursor = ResultPages.encode_cursor(result_id, 5, "RWY")
+        self.assertEqual(ResultPages.decode_cursor(cursor, result_id, "RWY"), 5)
+        with self.assertRaises(ValueError) :
+            ResultPages.decode_cursor(cursor, result_id)
+
+        # Evicted results leave the text index
+        store.add(make_notams(1))
+        self.assertEqual(len(store.text_index), 1)
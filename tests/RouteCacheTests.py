@@ -0,0 +1,104 @@
+import time
+import unittest
+from datetime import datetime, timedelta
+from Notam import Notam
+from RouteCache import RouteCache
+
+# Run these tests with `python3 -m unittest tests/RouteCacheTests.py`
+
+class Point :
+    def __init__(self, latitude, longitude) :
+        self.latitude = latitude
+        self.longitude = longitude
+
+def make_notam(notam_id, text = "RWY 17/35 CLSD", effective_end = "PERM") :
+    return Notam({"properties": {"coreNOTAMData": {"notam": {
+        "id": notam_id,
+        "text": text,
+        "effectiveStart": "2024-01-01T00:00:00.000Z",
+        "effectiveEnd": effective_end,
+    }}}})
+
+class TestRouteCache(unittest.TestCase) :
+
+    POINTS = [Point(35.39, -97.60), Point(34.5, -97.3), Point(32.90, -97.04)]
+
+    def test_hit_after_put(self) :
+        cache = RouteCache()
+        self.assertIsNone(cache.get("OKC", "DFW"))
+        notams = [make_notam("1"), make_notam("2")]
+        cache.put("OKC", "DFW", notams, {"type": "FeatureCollection"}, self.POINTS, 25)
+
+        entry = cache.get("okc", "dfw")
+        self.assertIsNotNone(entry)
+        self.assertEqual(entry.notam_ids, ["1", "2"])
+        self.assertEqual(entry.map_payload, {"type": "FeatureCollection"})
+        self.assertIsNone(cache.get("DFW", "OKC"))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_changed_area_invalidates_route(self) :
+        cache = RouteCache()
+        area_notams = {make_notam("1")}
+        cache.area_fetched(self.POINTS[1], 25, area_notams)
+        cache.put("OKC", "DFW", list(area_notams), None, self.POINTS, 25)
+
+        # Fetching the same NOTAMs again keeps the entry
+        cache.area_fetched(self.POINTS[1], 25, {make_notam("1")})
+        self.assertIsNotNone(cache.get("OKC", "DFW"))
+
+        # A new NOTAM in one of the route's areas drops it
+        cache.area_fetched(self.POINTS[1], 25, {make_notam("1"), make_notam("3")})
+        self.assertIsNone(cache.get("OKC", "DFW"))
+        self.assertEqual(cache.invalidations, 1)
+
+    def test_unrelated_area_keeps_route(self) :
+        cache = RouteCache()
+        cache.area_fetched(Point(40, -100), 25, {make_notam("1")})
+        cache.put("OKC", "DFW", [], None, self.POINTS, 25)
+        cache.area_fetched(Point(40, -100), 25, {make_notam("2")})
+        self.assertIsNotNone(cache.get("OKC", "DFW"))
+
+    def test_entry_expires_with_first_notam_end(self) :
+        cache = RouteCache()
+        ending_soon = (datetime.utcnow() + timedelta(seconds=0.05)).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        cache.put("OKC", "DFW", [make_notam("1", effective_end=ending_soon), make_notam("2")], None, self.POINTS, 25)
+        self.assertIsNotNone(cache.get("OKC", "DFW"))
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("OKC", "DFW"))
+
+    def test_max_age(self) :
+        cache = RouteCache(max_age=0.05)
+        cache.put("OKC", "DFW", [make_notam("1")], None, self.POINTS, 25)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("OKC", "DFW"))
+
+    def test_least_recently_used_route_is_evicted(self) :
+        cache = RouteCache(max_entries=2)
+        cache.put("OKC", "DFW", [], None, self.POINTS, 25)
+        cache.put("OKC", "MCI", [], None, self.POINTS, 25)
+        cache.get("OKC", "DFW")
+        cache.put("OKC", "OUN", [], None, self.POINTS, 25)
+        self.assertIsNotNone(cache.get("OKC", "DFW"))
+        self.assertIsNone(cache.get("OKC", "MCI"))
+        self.assertEqual(len(cache), 2)
+
+    def test_result_of_changed_areas_is_not_stored(self) :
+        cache = RouteCache()
+        with cache.recording() as record :
+            cache.area_fetched(self.POINTS[1], 25, {make_notam("1")})
+        # Another search fetches the area with a new NOTAM before this one is stored
+        cache.area_fetched(self.POINTS[1], 25, {make_notam("1"), make_notam("3")})
+        self.assertIsNone(cache.put("OKC", "DFW", [make_notam("1")], None, self.POINTS, 25, record=record))
+        self.assertIsNone(cache.get("OKC", "DFW"))
+        self.assertEqual(cache.rejected_puts, 1)
+
+        with cache.recording() as record :
+            cache.area_fetched(self.POINTS[1], 25, {make_notam("1"), make_notam("3")})
+        self.assertIsNotNone(cache.put("OKC", "DFW", [make_notam("1"), make_notam("3")], None, self.POINTS, 25, record=record))
+
+    def test_result_started_before_a_clear_is_not_stored(self) :
+        cache = RouteCache()
+        with cache.recording() as record :
+            cache.clear()
+        self.assertIsNone(cache.put("OKC", "DFW", [], None, self.POINTS, 25, record=record))
+        self.assertEqual(len(cache), 0)
@@ -0,0 +1,38 @@
+import random
+import unittest
+from benchmarks import NotamGenerator
+from Notam import Notam
+import NotamFetch
+from NavigationTools import PointObject, RouteCorridor, get_distance_nm, get_distance_to_segment_nm
+
+# Run these tests with `python3 -m unittest tests/RouteCorridorTests.py`
+
+OKC = (35.3931, -97.6007)
+DFW = (32.8968, -97.0380)
+
+class TestRouteCorridor(unittest.TestCase) :
+
+    def test_distance_matches_segment_distance(self) :
+        route = [(33.9425, -118.4081), OKC, (40.6398, -73.7789)]
+        corridor = RouteCorridor(route)
+        rng = random.Random(2)
+        for i in range(500) :
+            latitude, longitude = rng.uniform(25, 49), rng.uniform(-124, -67)
+            expected = min(get_distance_to_segment_nm(latitude, longitude, *start, *end) for start, end in zip(route, route[1:]))
+            self.assertAlmostEqual(corridor.distance_nm(latitude, longitude), expected, places=6)
+        self.assertAlmostEqual(RouteCorridor([OKC]).distance_nm(*DFW), get_distance_nm(*OKC, *DFW), places=6)
+
+    def test_filter_keeps_notams_near_the_route(self) :
+        notams = [Notam(item) for item in NotamGenerator.generate_notam_items(300, seed=4, center=OKC, radius_nm=150)]
+        point_list = [PointObject(*OKC), PointObject(*DFW)]
+        corridor = RouteCorridor([OKC, DFW])
+
+        kept = NotamFetch.filter_route_corridor(notams, point_list, 10)
+        self.assertLess(len(kept), len(notams))
+        for notam in notams :
+            near_route = corridor.distance_nm(notam.latitude, notam.longitude) <= 10 + notam.radius_nm
+            self.assertEqual(notam in kept, near_route)
+
+        # NOTAMs that can't be placed are never dropped
+        notams[0].latitude = notams[0].longitude = None
+        self.assertIn(notams[0], NotamFetch.filter_route_corridor(notams, point_list, 0))
@@ -0,0 +1,114 @@
+import copy
+import unittest
+from io import StringIO
+from unittest import mock
+from benchmarks import NotamGenerator
+from benchmarks.FaaMockServer import NotamDataset
+from benchmarks.MockFaaApi import MockFaaApi
+import NotamFetch
+import RouteWatch
+
+# Run these tests with `python3 -m unittest tests/RouteWatchTests.py`
+
+OKC = (35.3931, -97.6007)
+SEA = (47.4502, -122.3088)
+AIRPORTS = [
+    {"properties": {"IDENT": ident, "ICAO_ID": "K" + ident, "NAME": ident, "STATE": state, "COUNTRY": "UNITED STATES"},
+     "geometry": {"coordinates": [longitude, latitude, 0]}}
+    for ident, state, latitude, longitude in (("OKC", "OK", 35.3931, -97.6007), ("DFW", "TX", 32.8968, -97.038),
+                                              ("SEA", "WA", 47.4502, -122.3088), ("PDX", "OR", 45.5887, -122.5975))
+]
+
+def notam_data(item) :
+    return item["properties"]["coreNOTAMData"]["notam"]
+
+class TestRouteWatch(unittest.TestCase) :
+
+    def setUp(self) :
+        self.items = (NotamGenerator.generate_notam_items(200, seed=7, center=OKC, radius_nm=150)
+                      + NotamGenerator.generate_notam_items(100, seed=8, center=SEA, radius_nm=100))
+        self.server = self.enterContext(MockFaaApi(self.items, airports=AIRPORTS))
+        self.registry = RouteWatch.WatchRegistry()
+
+    def change_okc_notams(self) :
+        """Cancels one ranked NOTAM near OKC, edits another and issues a new one."""
+        watch = self.registry.get(self.okc_watch.id)
+        cancelled_id, edited_id = watch.ranking[0], watch.ranking[1]
+        items = [item for item in self.items if notam_data(item)["id"] != cancelled_id]
+        edited_item = copy.deepcopy(next(item for item in items if notam_data(item)["id"] == edited_id))
+        notam_data(edited_item)["text"] += " CORRECTED"
+        new_item = copy.deepcopy(edited_item)
+        notam_data(new_item)["id"] = "NEW_NOTAM"
+        items = [edited_item if notam_data(item)["id"] == edited_id else item for item in items] + [new_item]
+        self.server.dataset = NotamDataset(items)
+        return cancelled_id, edited_id
+
+    def test_only_changes_are_pushed(self) :
+        self.okc_watch = self.registry.add("OKC", "DFW", StringIO())
+        sea_watch = self.registry.add("SEA", "PDX", StringIO())
+        self.assertGreater(self.okc_watch.seq + len(self.okc_watch.ranking), 0)
+
+        # Nothing changed, so nothing is pushed
+        self.registry.refresh(StringIO())
+        self.assertEqual((self.okc_watch.seq, sea_watch.seq), (0, 0))
+
+        cancelled_id, edited_id = self.change_okc_notams()
+        reranks_before = RouteWatch.WATCH_RERANKS.total()
+        self.registry.refresh(StringIO())
+        watch, changes = self.registry.changes_after(self.okc_watch.id, 0)
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(changes[0]["cancelled"], [cancelled_id])
+        self.assertEqual({item["id"] for item in changes[0]["added"]}, {edited_id, "NEW_NOTAM"})
+        # The other route's areas didn't change, so it wasn't re-ranked
+        self.assertEqual(sea_watch.seq, 0)
+        self.assertLessEqual(RouteWatch.WATCH_RERANKS.total() - reranks_before, len(self.okc_watch.area_keys))
+
+        # The kept ranking matches a new search of the route
+        sorted_notams, point_list, request_radius = NotamFetch.find_route_notams("OKC", "DFW", StringIO())
+        ranked_items = self.registry.ranked_items(self.okc_watch.id)
+        self.assertEqual({item["id"]: item["score"] for item in ranked_items}, {notam.id: notam.score for notam in sorted_notams})
+        self.assertEqual([item["score"] for item in ranked_items], sorted((item["score"] for item in ranked_items), reverse=True))
+
+    def test_follow_changes(self) :
+        self.okc_watch = self.registry.add("OKC", "DFW", StringIO())
+        self.assertEqual(self.registry.changes_after(self.okc_watch.id, 0, timeout=0.01)[1], [])
+
+        self.change_okc_notams()
+        events = self.registry.iter_events(self.okc_watch.id, 0)
+        # Areas fetched by other searches update the watch as well
+        NotamFetch.area_listeners.append(self.registry.area_fetched)
+        self.addCleanup(NotamFetch.area_listeners.remove, self.registry.area_fetched)
+        NotamFetch.find_route_notams("OKC", "DFW", StringIO())
+        self.assertTrue(next(events).startswith("id: 1\nevent: change\n"))
+
+        self.assertTrue(self.registry.remove(self.okc_watch.id))
+        self.assertEqual(self.registry.changes_after(self.okc_watch.id, 0), (None, None))
+        self.assertEqual(self.registry._area_notams, {})
+
+    def test_unknown_airport(self) :
+        with self.assertRaises(TypeError) :
+            self.registry.add("OKC", "XXXX", StringIO())
+        self.assertEqual(len(self.registry), 0)
+
+    def test_refresh_within_budget(self) :
+        self.okc_watch = self.registry.add("OKC", "DFW", StringIO())
+        sea_watch = self.registry.add("SEA", "PDX", StringIO())
+        cancelled_id, edited_id = self.change_okc_notams()
+
+        # One failing area doesn't lose the others
+        get_notams_at = NotamFetch.timed_get_notams_at
+        def fail_near_sea(point, request_radius, message_log) :
+            if point.latitude > 45 :
+                raise RuntimeError("Received non-HTTP 200 status code 500 from FAA API")
+            return get_notams_at(point, request_radius, message_log)
+        failures_before = RouteWatch.WATCH_REFRESH_FAILURES.total()
+        with mock.patch.object(NotamFetch, "timed_get_notams_at", fail_near_sea) :
+            self.registry.refresh(StringIO())
+        self.assertEqual(RouteWatch.WATCH_REFRESH_FAILURES.total() - failures_before, len(sea_watch.area_keys))
+        self.assertEqual(self.registry.changes_after(self.okc_watch.id, 0)[1][0]["cancelled"], [cancelled_id])
+
+        # Without a snapshot store, a refresh only fetches the areas fetched longest ago
+        self.registry.refresh_area_budget = 2
+        self.server.stats.clear()
+        self.registry.refresh(StringIO())
+        self.assertEqual(self.server.stats["requests"], 2)
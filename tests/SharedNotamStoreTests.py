@@ -0,0 +1,100 @@
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from io import StringIO
+from benchmarks import NotamGenerator
+from benchmarks.MockFaaApi import MockFaaApi
+import NotamStore
+import SharedNotamStore
+from NavigationTools import PointObject
+
+# Run these tests with `python3 -m unittest tests/SharedNotamStoreTests.py`
+
+OKC = (35.3931, -97.6007)
+# Small area around OKC so a sweep only takes a few requests
+TEST_BOUNDS = (33.0, -100.0, 38.0, -95.0)
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run_in_other_process(code) :
+    """Runs code in a new interpreter and returns what it printed."""
+    return subprocess.run([sys.executable, "-c", code], cwd=PACKAGE_DIR, capture_output=True, text=True, check=True).stdout.strip()
+
+class TestSharedNotamStore(unittest.TestCase) :
+
+    def setUp(self) :
+        items = NotamGenerator.generate_notam_items(400, seed=3, center=OKC, radius_nm=120)
+        self.server = self.enterContext(MockFaaApi(items))
+
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.directory = temporary_directory.name
+
+        self.store = NotamStore.NotamStore(bounds=TEST_BOUNDS, sweep_radius=100)
+        self.store.sweep(StringIO())
+        self.publisher = SharedNotamStore.SnapshotPublisher(self.store, self.directory)
+        self.publisher.publish()
+        self.reader = SharedNotamStore.SharedNotamStore(self.directory)
+
+    def test_answers_like_the_writer(self) :
+        rng = random.Random(1)
+        for _ in range(30) :
+            point = PointObject(OKC[0] + rng.uniform(-1.5, 1.5), OKC[1] + rng.uniform(-2, 2))
+            radius = rng.choice([10, 25, 50, 80])
+            self.assertEqual({notam.id for notam in self.reader.current().notams_in_circle(point, radius)},
+                             {notam.id for notam in self.store.notams_in_circle(point, radius)})
+
+        departure = datetime.utcnow() + timedelta(days=3)
+        flight_window = (departure, departure + timedelta(hours=2))
+        areas = [(PointObject(*OKC), 80), (PointObject(35.0, -97.0), 40)]
+        self.server.stats.clear()
+        self.assertEqual(self.reader.notams_for_areas(areas, StringIO(), flight_window),
+                         self.store.notams_for_areas(areas, StringIO(), flight_window))
+        self.assertEqual(self.server.stats["requests"], 0)
+
+    def test_versions_switch_atomically(self) :
+        refreshes = []
+        self.reader.refresh_listeners.append(lambda : refreshes.append(True))
+        first_snapshot = self.reader.current()
+        first_ids = {notam.id for notam in first_snapshot.notams_in_circle(PointObject(*OKC), 80)}
+
+        # A sweep that only refreshes fetch times doesn't drop cached routes
+        self.publisher.publish()
+        self.assertEqual(self.reader.current().version, first_snapshot.version + 1)
+        self.assertEqual(refreshes, [])
+
+        region = self.store.regions_near(PointObject(*OKC), 0)[0]
+        self.store.update_region(region, set())
+        for listener in self.store.refresh_listeners :
+            listener()
+        self.publisher.publish()
+        second_ids = {notam.id for notam in self.reader.current().notams_in_circle(PointObject(*OKC), 80)}
+        self.assertEqual(refreshes, [True])
+        self.assertLess(len(second_ids), len(first_ids))
+        # A search still holding the old snapshot sees it unchanged
+        self.assertEqual({notam.id for notam in first_snapshot.notams_in_circle(PointObject(*OKC), 80)}, first_ids)
+
+    def test_other_processes_read_the_snapshot(self) :
+        printed = run_in_other_process(f"import SharedNotamStore; print(len(SharedNotamStore.SharedNotamStore({self.directory!r})))")
+        self.assertEqual(int(printed), len(self.store))
+
+    def test_one_writer(self) :
+        self.assertTrue(SharedNotamStore.claim_writer(self.directory))
+        def release() :
+            SharedNotamStore._writer_lock_file.close()
+            SharedNotamStore._writer_lock_file = None
+        self.addCleanup(release)
+        printed = run_in_other_process(f"import SharedNotamStore; print(SharedNotamStore.claim_writer({self.directory!r}))")
+        self.assertEqual(printed, "False")
+
+    def test_searches_keep_their_own_scores(self) :
+        areas = [(PointObject(*OKC), 80)]
+        first_notams = self.reader.notams_for_areas(areas, StringIO())[0]
+        for notam in first_notams :
+            notam.score = -1
+        second_notams = self.reader.notams_for_areas(areas, StringIO())[0]
+        self.assertEqual({notam.id for notam in second_notams}, {notam.id for notam in first_notams})
+        self.assertFalse(any(getattr(notam, "score", None) == -1 for notam in second_notams))
@@ -0,0 +1,51 @@
+import random
+import unittest
+from NavigationTools import get_distance_nm, get_distance_to_segment_nm
+from SpatialIndex import LARGE_RADIUS_NM, SpatialIndex
+
+# Run these tests with `python3 -m unittest tests/SpatialIndexTests.py`
+
+ROUTE = [(33.9425, -118.4081), (35.3931, -97.6007), (40.6398, -73.7789)]  # LAX - OKC - JFK
+
+class TestSpatialIndex(unittest.TestCase) :
+
+    def setUp(self) :
+        rng = random.Random(5)
+        self.circles = {}
+        for key in range(3000) :
+            radius = rng.choice([0, 1, 5, 25, 60, LARGE_RADIUS_NM + 100])
+            self.circles[key] = (rng.uniform(25, 49), rng.uniform(-124, -67), radius)
+        self.index = SpatialIndex()
+        for key, (latitude, longitude, radius) in self.circles.items() :
+            self.index.insert(key, latitude, longitude, radius)
+
+    def test_circle_query_matches_linear_scan(self) :
+        for latitude, longitude, radius in [(35.39, -97.60, 0), (35.39, -97.60, 50), (47.0, -122.0, 200), (25.5, -80.3, 10)] :
+            expected = {key for key, (circle_latitude, circle_longitude, circle_radius) in self.circles.items()
+                        if get_distance_nm(latitude, longitude, circle_latitude, circle_longitude) <= radius + circle_radius}
+            self.assertEqual(set(self.index.query_circle(latitude, longitude, radius)), expected)
+        self.assertEqual(set(self.index.query_point(35.39, -97.60)), set(self.index.query_circle(35.39, -97.60, 0)))
+
+    def test_polyline_query_matches_linear_scan(self) :
+        expected = {key for key, (latitude, longitude, radius) in self.circles.items()
+                    if any(get_distance_to_segment_nm(latitude, longitude, *start, *end) <= 20 + radius
+                           for start, end in zip(ROUTE, ROUTE[1:]))}
+        found = set(self.index.query_polyline(ROUTE, 20))
+        self.assertEqual(found, expected)
+        # Only a corridor of the country is returned
+        self.assertLess(len(found), len(self.circles) / 2)
+
+    def test_insert_replaces_and_remove(self) :
+        self.index.insert("moving", 35.0, -97.0, 1, "moving notam")
+        self.index.insert("moving", 45.0, -110.0, 1, "moving notam")
+        self.assertNotIn("moving notam", self.index.query_point(35.0, -97.0))
+        self.assertIn("moving notam", self.index.query_point(45.0, -110.0))
+        self.assertTrue(self.index.remove("moving"))
+        self.assertFalse(self.index.remove("moving"))
+        self.assertNotIn("moving notam", self.index.query_point(45.0, -110.0))
+        self.assertEqual(len(self.index), len(self.circles))
+
+    def test_wraps_antimeridian(self) :
+        index = SpatialIndex()
+        index.insert("dateline", 52.0, 179.9, 30)
+        self.assertEqual(index.query_circle(52.0, -179.9, 1), ["dateline"])
@@ -0,0 +1,60 @@
+import random
+import time
+import unittest
+from types import SimpleNamespace
+from benchmarks import NotamGenerator
+from TextIndex import TextIndex, tokenize
+
+# Run these tests with `python3 -m unittest tests/TextIndexTests.py`
+
+def make_notams(count, seed=0) :
+    rng = random.Random(seed)
+    return [SimpleNamespace(id=f"N{i}", text=rng.choice(NotamGenerator.NOTAM_TEXTS)) for i in range(count)]
+
+class TestTextIndex(unittest.TestCase) :
+
+    def test_contractions_match_plain_words(self) :
+        self.assertEqual(tokenize("Runway 17L closed"), tokenize("RWY 17L CLSD"))
+        self.assertEqual(tokenize("temporary flight restrictions"), ["TFR"])
+        self.assertEqual(tokenize("ILS LOC/GP U/S"), ["ILS", "LOC", "GP", "U/S"])
+
+        index = TextIndex()
+        index.add("N1", "RWY 17L/35R CLSD")
+        index.add("N2", "!FDC 4/1234 ZFW TX..AIRSPACE DALLAS, TX..TEMPORARY FLIGHT RESTRICTIONS")
+        self.assertEqual(index.search("runway closed"), {"N1"})
+        self.assertEqual(index.search("TFR"), {"N2"})
+        self.assertEqual(index.search("RWY TFR"), set())
+
+    def test_shared_notams_are_counted(self) :
+        index = TextIndex()
+        index.add("N1", "RWY 17L/35R CLSD")
+        index.add("N1", "RWY 17L/35R CLSD")
+        index.remove("N1")
+        self.assertEqual(index.search("RWY"), {"N1"})
+        index.remove("N1")
+        self.assertEqual(index.search("RWY"), set())
+        self.assertEqual(len(index), 0)
+
+    def test_filter_keeps_order(self) :
+        notams = make_notams(200)
+        index = TextIndex()
+        for notam in notams :
+            index.add(notam.id, notam.text)
+
+        expected = [notam for notam in notams if "CLSD" in notam.text.split() and "TWY" in notam.text.split()]
+        self.assertEqual(index.filter(notams, "taxiway closed"), expected)
+        self.assertEqual(index.filter(notams, "  "), notams)
+
+    def test_filter_does_not_grow_with_index(self) :
+        notams = make_notams(100_000)
+        index = TextIndex()
+        for notam in notams :
+            index.add(notam.id, notam.text)
+        route_notams = notams[::200]
+
+        started = time.perf_counter()
+        for _ in range(10) :
+            filtered = index.filter(route_notams, "RWY CLSD")
+        elapsed = (time.perf_counter() - started) / 10
+        self.assertTrue(filtered)
+        self.assertLess(elapsed, 0.005)